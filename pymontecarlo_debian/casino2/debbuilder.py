@@ -3,43 +3,31 @@
 # Standard library modules.
 import os
 import zipfile
-import tempfile
 from datetime import datetime
-import shutil
 import argparse
 
 # Third party modules.
-from debian.copyright import FilesParagraph, License
 
 # Local modules.
 from pymontecarlo_debian.core.debbuilder import DebBuilder
 from pymontecarlo_debian.core.manpage import ManPage
 from pymontecarlo_debian.core.desktopentry import DesktopEntry
-from pymontecarlo_debian.core.exeinfo import extract_exe_info
+from pymontecarlo_debian.core.lint import SCRIPT
+from pymontecarlo_debian.core.command import \
+    add_build_arguments, get_builder_kwargs, run_build
+from pymontecarlo_debian.core.exeinfo import extract_zip_exe_info
 
 # Globals and constants variables.
 
 class Casino2DebBuilder(DebBuilder):
 
-    def __init__(self, zip_path):
+    def __init__(self, zip_path, **kwargs):
         self._zip_path = zip_path
-
-        # Exe info
-        temp_file = tempfile.NamedTemporaryFile(suffix='.exe', delete=False)
-        try:
-            with zipfile.ZipFile(zip_path, 'r') as z:
-                for filename in z.namelist():
-                    if filename.endswith('wincasino2.exe'):
-                        break
-                temp_file.write(z.read(filename))
-                temp_file.close()
-            self.exe_info = extract_exe_info(temp_file.name)
-        finally:
-            os.remove(temp_file.name)
+        self._exe_info = None
 
         super().__init__(package='casino2',
                          fullname='Casino 2',
-                         version=self.exe_info['File version'], # dummy
+                         version=lambda: self.exe_info['File version'], # dummy
                          maintainer='Hendrix Demers',
                          maintainer_email='hendrix.demers@mail.mcgill.ca',
                          authors=['D. Drouin', 'A.R. Couture', 'R. Gauvin',
@@ -48,40 +36,40 @@ class Casino2DebBuilder(DebBuilder):
                          section='science',
                          short_description='Monte Carlo simulation of electron trajectory in solid',
                          long_description='The CASINO acronym has been derived from the words "monte CArlo SImulation of electroN trajectory in sOlids". This program is a Monte Carlo simulation of electron trajectory in solid specially designed for low beam interaction in a bulk and thin foil. This complex single scattering Monte Carlo program is specifically designed for low energy beam interaction and can be used to generate many of the recorded signals (X-rays and backscattered electrons) in a scanning electron microscope. This program can also be efficiently used for all of the accelerated voltage found on a field emission scanning electron microscope(0.1 to 30 KeV).',
-                         date=datetime.strptime(self.exe_info['Link date'], '%I:%M %p %d/%m/%Y'), # dummy
+                         date=lambda: datetime.strptime(self.exe_info['Link date'], '%I:%M %p %d/%m/%Y'), # dummy
                          license='We clain no responsibility and liability concerning the technical predictions of this program. In all publications using the results of this program, the complete references to CASINO must be include in the paper.',
                          homepage='http://www.gel.usherbrooke.ca/casino/',
-                         depends=['wine'])
+                         depends=['wine'],
+                         **kwargs)
+
+    @property
+    def exe_info(self):
+        if self._exe_info is None:
+            with zipfile.ZipFile(self._zip_path, 'r') as z:
+                self._exe_info = extract_zip_exe_info(z, 'wincasino2.exe')
+        return self._exe_info
+
+    def _map_zip_members(self, names, arch, *args, **kwargs):
+        # Exe from other architecture
+        if arch == 'amd64':
+            excluded = 'wincasino2.exe'
+        elif arch == 'i386':
+            excluded = 'wincasino2_64.exe'
 
-    def _extract_zip(self, temp_dir, arch, *args, **kwargs):
-        dirpath = os.path.join(temp_dir, 'zip')
-        os.makedirs(dirpath)
-        with zipfile.ZipFile(self._zip_path, 'r') as z:
-            for filename in z.namelist(): # Cannot use extract all, problem in zip
-                z.extract(filename, dirpath)
+        paths = {}
+        for name in names:
+            if name == excluded:
+                continue
 
-    def _organize_files(self, temp_dir, arch, *args, **kwargs):
-        # Copy files to share
-        dst_dir = os.path.join(temp_dir, 'usr', 'share', self.package)
-        os.makedirs(dst_dir, exist_ok=True)
-
-        src_dir = os.path.join(temp_dir, 'zip')
-        for filename in os.listdir(src_dir):
-            shutil.move(os.path.join(src_dir, filename), dst_dir)
+            # Boost license (added to copyright file)
+            if name.startswith('licenses/'):
+                continue
 
-        # Remove exe from other architecture
-        if arch == 'amd64':
-            os.remove(os.path.join(temp_dir, 'usr', 'share',
-                                   self.package, 'wincasino2.exe'))
-        elif arch == 'i386':
-            os.remove(os.path.join(temp_dir, 'usr', 'share',
-                                   self.package, 'wincasino2_64.exe'))
+            paths[name] = os.path.join('usr', 'share', self.package, name)
 
-        # Remove Boost license (added to copyright file)
-        licenses_dir = os.path.join(temp_dir, 'usr', 'share', self.package, 'licenses')
-        if os.path.exists(licenses_dir):
-            shutil.rmtree(licenses_dir)
+        return paths
 
+    def _organize_files(self, temp_dir, arch, *args, **kwargs):
         # Copy icon
         dst_dir = os.path.join(temp_dir, 'usr', 'share', 'icons',
                                'hicolor', '48x48', 'apps')
@@ -89,10 +77,7 @@ class Casino2DebBuilder(DebBuilder):
 
         src = os.path.join(os.path.dirname(__file__), 'wincasino2.png')
         dst = os.path.join(dst_dir, 'casino2.png')
-        shutil.copy(src, dst)
-
-        # Remove temporary directory
-        shutil.rmtree(src_dir)
+        self._manifest.copy_file(src, dst)
 
     def _create_executable(self, temp_dir, arch, *args, **kwargs):
         if arch == 'amd64':
@@ -100,16 +85,20 @@ class Casino2DebBuilder(DebBuilder):
         elif arch == 'i386':
             filename = 'wincasino2.exe'
 
-        lines = []
-        lines.append('#!/bin/sh')
-        lines.append('cd /usr/share/%s' % self.package)
-        lines.append('wine /usr/share/%s/%s $@' % (self.package, filename))
-        return lines
+        return self._create_launcher(filename)
+
+    def _get_arch_paths(self, temp_dir, arch, *args, **kwargs):
+        if arch == 'amd64':
+            filename = 'wincasino2_64.exe'
+        elif arch == 'i386':
+            filename = 'wincasino2.exe'
+        return [os.path.join('usr', 'share', self.package, filename)]
 
     def _write_executable(self, lines, temp_dir, arch, *args, **kwargs):
         os.makedirs(os.path.join(temp_dir, 'usr', 'bin'), exist_ok=True)
         filepath = os.path.join(temp_dir, 'usr', 'bin', 'casino2')
-        with open(filepath, 'w') as fp:
+        self._linter.check(SCRIPT, lines, os.path.relpath(filepath, temp_dir))
+        with self._manifest.open(filepath, 'w') as fp:
             fp.write('\n'.join(lines))
         os.chmod(filepath, 0o555)
 
@@ -131,12 +120,16 @@ class Casino2DebBuilder(DebBuilder):
                             terminal=False,
                             categories=['Science'])
 
+    def _get_architecture(self, arch, *args, **kwargs):
+        return arch
+
     def _create_control(self, temp_dir, arch, *args, **kwargs):
         control = super()._create_control(temp_dir, *args, **kwargs)
         control['Architecture'] = arch
         return control
 
     def _create_copyright(self, temp_dir, arch, *args, **kwargs):
+        from debian.copyright import FilesParagraph, License
         copyrightobj = super()._create_copyright(temp_dir, arch, *args, **kwargs)
 
         # Add Boost license
@@ -170,47 +163,50 @@ DEALINGS IN THE SOFTWARE.
 
         return copyrightobj
 
-    def _build(self, temp_dir, arch, *args, **kwargs):
-        self._extract_zip(temp_dir, arch, *args, **kwargs)
-
-        self._organize_files(temp_dir, arch, *args, **kwargs)
-
-        lines = self._create_executable(temp_dir, arch, *args, **kwargs)
-        self._write_executable(lines, temp_dir, arch, *args, **kwargs)
-
-        manpage = self._create_man_page(temp_dir, arch, *args, **kwargs)
-        self._write_man_page(manpage, temp_dir, arch, *args, **kwargs)
-
-        entry = self._create_desktop_entry(temp_dir, arch, *args, **kwargs)
-        self._write_desktop_entry(entry, temp_dir, arch, *args, **kwargs)
-
-        super()._build(temp_dir, arch, *args, **kwargs)
+    def _add_stages(self, graph, temp_dir, arch, *args, **kwargs):
+        graph.add('extract', lambda: self._extract_zip(temp_dir, arch, *args, **kwargs),
+                  outputs=['zip members'])
+        graph.add('icons', lambda: self._organize_files(temp_dir, arch, *args, **kwargs),
+                  outputs=[os.path.join('usr', 'share', 'icons')])
+
+        graph.add('executable',
+                  self._create_stage(self._create_executable, self._write_executable,
+                                     temp_dir, arch, *args, **kwargs),
+                  outputs=[os.path.join('usr', 'bin', self.package)])
+        # Date of the gzip header
+        graph.add('man page',
+                  self._create_stage(self._create_man_page, self._write_man_page,
+                                     temp_dir, arch, *args, **kwargs),
+                  inputs=['date'], outputs=[os.path.join('usr', 'share', 'man')])
+        graph.add('desktop entry',
+                  self._create_stage(self._create_desktop_entry, self._write_desktop_entry,
+                                     temp_dir, arch, *args, **kwargs),
+                  outputs=[os.path.join('usr', 'share', 'applications')])
+
+        super()._add_stages(graph, temp_dir, arch, *args, **kwargs)
 
     def build(self, outputdir, arch, *args, **kwargs):
         if arch not in ['amd64', 'i386']:
             raise ValueError('Invalid architecture: amd64 or i386')
-        super().build(outputdir, arch, *args, **kwargs)
+        return super().build(outputdir, arch, *args, **kwargs)
 
-def run():
-    parser = argparse.ArgumentParser(description='Create deb for Casino 2')
+    def plan(self, arch, *args, **kwargs):
+        if arch not in ['amd64', 'i386']:
+            raise ValueError('Invalid architecture: amd64 or i386')
+        return super().plan(arch, *args, **kwargs)
+
+def run(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description='Create deb for Casino 2')
 
     parser.add_argument('filepath', help='Path to ZIP containing Casino 2')
     parser.add_argument('-a', '--arch', choices=('amd64', 'i386'), required=True,
                         help='Architecture')
-    parser.add_argument('-o', '--output', help='Path to output directory')
-
-    args = parser.parse_args()
-
-    filepath = args.filepath
-
-    outputdir = args.output
-    if not outputdir:
-        outputdir = os.path.dirname(filepath)
+    add_build_arguments(parser, split_data=True)
 
-    arch = args.arch
+    args = parser.parse_args(argv)
 
-    debbuilder = Casino2DebBuilder(filepath)
-    debbuilder.build(outputdir, arch=arch)
+    debbuilder = Casino2DebBuilder(args.filepath, **get_builder_kwargs(args))
+    run_build(debbuilder, args, arch=args.arch)
 
 if __name__ == '__main__':
     run()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import io
+import tempfile
+import shutil
+import zipfile
+import tarfile
+import subprocess
+import time
+from unittest import mock
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.casino2.debbuilder import Casino2DebBuilder
+
+# Globals and constants variables.
+
+class TestCasino2DebBuilder(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.zip_path = os.path.join(self.tmpdir, 'casino2.zip')
+        with zipfile.ZipFile(self.zip_path, 'w') as z:
+            z.writestr('wincasino2.exe', b'a' * 3000)
+            z.writestr('wincasino2_64.exe', b'b' * 4000)
+            z.writestr('data/', b'')
+            z.writestr('data/elements.dat', b'c' * 5000)
+            z.writestr('licenses/boost.txt', b'boost')
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir)
+
+    def testplan(self):
+        debbuilder = Casino2DebBuilder(self.zip_path)
+        plan, = debbuilder.plan(arch='amd64')
+
+        self.assertEqual('casino2', plan.package)
+        self.assertEqual('amd64', plan.architecture)
+        self.assertEqual(['licenses/boost.txt', 'wincasino2.exe'], plan.excluded)
+
+        files = dict((planned.path, planned) for planned in plan.files)
+        planned = files['usr/share/casino2/wincasino2_64.exe']
+        self.assertEqual(4000, planned.size)
+        self.assertEqual(0o644, planned.mode)
+        self.assertEqual('wincasino2_64.exe', planned.member)
+        self.assertEqual(0o555, files['usr/bin/casino2'].mode)
+        self.assertIsNone(files['usr/bin/casino2'].member)
+        self.assertIn('usr/share/doc/casino2/copyright', files)
+
+        # Exe info is not extracted
+        self.assertIsNone(debbuilder._exe_info)
+
+        buf = io.StringIO()
+        plan.write(buf)
+        self.assertIn('Installed-Size: %i KiB' % plan.installed_size, buf.getvalue())
+
+    def testplan_split_data(self):
+        debbuilder = Casino2DebBuilder(self.zip_path, split_data=True)
+        data_plan, plan = debbuilder.plan(arch='i386')
+
+        self.assertEqual('casino2-data', data_plan.package)
+        self.assertEqual('all', data_plan.architecture)
+        paths = [planned.path for planned in data_plan.files]
+        self.assertIn('usr/share/casino2/data/elements.dat', paths)
+        self.assertNotIn('usr/share/casino2/wincasino2.exe', paths)
+
+        paths = [planned.path for planned in plan.files]
+        self.assertIn('usr/share/casino2/wincasino2.exe', paths)
+        self.assertNotIn('usr/share/casino2/data/elements.dat', paths)
+
+    @mock.patch.dict(os.environ)
+    def testbuild_reproducible(self):
+        os.environ.pop('SOURCE_DATE_EPOCH', None)
+        exe_info = {'File version': '2.48', 'Link date': '10:30 AM 01/02/2015'}
+
+        hashes = []
+        for umask, outputdir in [(0o022, 'a'), (0o002, 'b')]:
+            debbuilder = Casino2DebBuilder(self.zip_path, reproducible=True)
+            debbuilder._exe_info = exe_info
+
+            old_umask = os.umask(umask)
+            try:
+                record, = debbuilder.build(os.path.join(self.tmpdir, outputdir),
+                                           arch='amd64')
+            finally:
+                os.umask(old_umask)
+            hashes.append(record.hashes['sha256'])
+            time.sleep(1.1) # Files extracted at another time
+
+        self.assertEqual(hashes[0], hashes[1])
+
+        epoch = debbuilder.source_date_epoch
+        self.assertEqual(1422786600, epoch)
+        data = subprocess.check_output(['dpkg-deb', '--fsys-tarfile', record.filepath])
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            for member in tar.getmembers():
+                self.assertLessEqual(member.mtime, epoch, member.name)
+                self.assertEqual('root', member.uname)
+
+    def testbuild_umask(self):
+        debbuilder = Casino2DebBuilder(self.zip_path, split_data=True)
+        debbuilder._exe_info = {'File version': '2.48', 'Link date': '10:30 AM 01/02/2015'}
+
+        old_umask = os.umask(0o002)
+        try:
+            records = debbuilder.build(self.tmpdir, arch='amd64')
+        finally:
+            os.umask(old_umask)
+
+        for record in records:
+            for option in ['--fsys-tarfile', '--ctrl-tarfile']:
+                data = subprocess.check_output(['dpkg-deb', option, record.filepath])
+                with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+                    for member in tar.getmembers():
+                        self.assertFalse(member.mode & 0o022, member.name)
+
+    def testbuild_streaming(self):
+        exe_info = {'File version': '2.48', 'Link date': '10:30 AM 01/02/2015'}
+
+        contents = []
+        for streaming in [False, True]:
+            debbuilder = Casino2DebBuilder(self.zip_path, split_data=True,
+                                           reproducible=True, streaming=streaming)
+            debbuilder._exe_info = exe_info
+            outputdir = os.path.join(self.tmpdir, str(streaming))
+            records = debbuilder.build(outputdir, arch='i386')
+
+            for record in records:
+                listing = subprocess.check_output(['dpkg-deb', '--contents', record.filepath])
+                control = subprocess.check_output(['dpkg-deb', '--ctrl-tarfile', record.filepath])
+                with tarfile.open(fileobj=io.BytesIO(control)) as tar:
+                    md5sums = tar.extractfile('./md5sums').read()
+                contents.append((os.path.basename(record.filepath), listing, md5sums,
+                                 record.control['Installed-Size']))
+
+        self.assertEqual(4, len(contents))
+        self.assertEqual(contents[:2], contents[2:])
+
+    def testbuild_split_data_existing(self):
+        exe_info = {'File version': '2.48', 'Link date': '10:30 AM 01/02/2015'}
+
+        def _build():
+            debbuilder = Casino2DebBuilder(self.zip_path, split_data=True)
+            debbuilder._exe_info = exe_info
+            return debbuilder.build(self.tmpdir, arch='amd64')
+
+        data_record, _record = _build()
+        mtime = os.stat(data_record.filepath).st_mtime_ns
+
+        # Same files: the data package is not built again
+        records = _build()
+        self.assertEqual(1, len(records))
+        self.assertEqual(mtime, os.stat(data_record.filepath).st_mtime_ns)
+
+        # Also when it is in another directory than the output one
+        debbuilder = Casino2DebBuilder(self.zip_path, split_data=True, built_dir=self.tmpdir)
+        debbuilder._exe_info = exe_info
+        outputdir = tempfile.mkdtemp(dir=self.tmpdir)
+        records = debbuilder.build(outputdir, arch='i386')
+        self.assertEqual(['casino2_2.48-1_i386.deb'],
+                         [os.path.basename(record.filepath) for record in records])
+
+        # Other files, same version: the data package is replaced
+        with zipfile.ZipFile(self.zip_path, 'a') as z:
+            z.writestr('data/other.dat', b'd' * 100)
+        data_record, _record = _build()
+        listing = subprocess.check_output(['dpkg-deb', '--contents', data_record.filepath])
+        self.assertIn(b'./usr/share/casino2/data/other.dat', listing)
+
+    def testbuild_lint(self):
+        debbuilder = Casino2DebBuilder(self.zip_path)
+        debbuilder._exe_info = {'File version': '2.51', 'Link date': '10:30 AM 01/02/2015'}
+        record, = debbuilder.build(self.tmpdir, arch='amd64')
+
+        self.assertEqual('2.51', debbuilder.version)
+        self.assertEqual('casino2_2.51-1_amd64.deb', os.path.basename(record.filepath))
+        self.assertNotIn('Recommends', record.control)
+        self.assertEqual([], debbuilder.lint_findings)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -25,7 +25,7 @@ class Casino2WebpageVersionParser(WebpageVersionParser):
     def _parse_webpage(self, content):
         soup = BeautifulSoup(content, "html.parser")
 
-        versions = []
+        releases = []
         for a in soup.find_all('a'):
             match = re.match(self.PATTERN, a['href'])
             if not match:
@@ -36,12 +36,9 @@ class Casino2WebpageVersionParser(WebpageVersionParser):
             if version.version[0] != 2:
                 continue
 
-            versions.append(version)
+            releases.append((version, a['href']))
 
-        if not versions:
-            return None
-
-        return max(versions)
+        return releases
 
 class Casino2PackageCloudVersionParser(PackageCloudVersionParser):
 
@@ -0,0 +1,52 @@
+"""Single command line entry point dispatching to the programs"""
+
+# Standard library modules.
+import sys
+import argparse
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.plugins import get_entry_points, load_reference
+
+# Globals and constants variables.
+PROG = 'pymontecarlo-debian'
+ENTRY_POINT_GROUP = 'pymontecarlo_debian.commands'
+COMMANDS = {'casino2': 'pymontecarlo_debian.casino2.debbuilder:run',
+            'mcxray': 'pymontecarlo_debian.mcxray.debbuilder:run',
+            'monaco': 'pymontecarlo_debian.monaco.debbuilder:run',
+            'winxray': 'pymontecarlo_debian.winxray.debbuilder:run',
+            'serve': 'pymontecarlo_debian.core.server:run',
+            'verify': 'pymontecarlo_debian.core.verify:run',
+            'watch': 'pymontecarlo_debian.core.watch:run'}
+
+def main(argv=None):
+    """
+    Runs the command named by the first argument with the remaining ones.
+    Only the module of this command is imported, so that ``--help`` of a
+    command does not load the others.
+    A command is a ``run(argv, prog)`` function registered in the
+    ``pymontecarlo_debian.commands`` entry point group.
+    """
+    commands = get_entry_points(ENTRY_POINT_GROUP, COMMANDS)
+
+    parser = argparse.ArgumentParser(prog=PROG,
+                                     description='Create DEB for Monte Carlo programs')
+    parser.add_argument('command', choices=sorted(commands),
+                        help='Program to package, serve to start the build service, '
+                             'watch to build the zips dropped in a directory '
+                             'or verify to check packages')
+    parser.add_argument('args', nargs=argparse.REMAINDER,
+                        help='Arguments of the command (see %s <command> --help)' % PROG)
+
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # Only the command is parsed, all its arguments (including --help)
+    # are passed to it
+    args = parser.parse_args(argv[:1])
+    run = load_reference(commands[args.command])
+    return run(argv[1:], prog='%s %s' % (PROG, args.command))
+
+if __name__ == '__main__':
+    sys.exit(main())
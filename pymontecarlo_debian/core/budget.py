@@ -0,0 +1,101 @@
+"""Memory budget of a build"""
+
+# Standard library modules.
+import os
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.digest import BUFFER_SIZE
+from pymontecarlo_debian.core.pipeline import QUEUE_SIZE
+from pymontecarlo_debian.core.debfile import XZ_PRESET, XZ_PRESET_MEMORY, get_lzma_preset
+
+# Globals and constants variables.
+MIN_CHUNK_SIZE = 4 * 1024
+WORKER_OVERHEAD = 64 * 1024 # Window and state of a zlib decompressor
+
+class MemoryBudget(object):
+    """
+    Splits *limit* bytes between the buffers of a build, so that the
+    memory it uses does not depend on the size of the zip.
+    Half goes to the xz compressor, half to the chunks copied from the
+    zip members: in the queues of the streaming pipeline or in the
+    extraction threads.
+    The memory of the interpreter itself is not counted.
+    Without *limit*, the defaults are used.
+    """
+
+    def __init__(self, limit=None):
+        if limit is not None and limit <= 0:
+            raise ValueError('Memory budget must be positive')
+        self.limit = limit
+
+    def split(self, count):
+        """
+        Returns the budget of each of *count* parts of the build running at
+        the same time, e.g. the packages compressed concurrently.
+        """
+        if self.limit is None:
+            return self
+        return MemoryBudget(max(1, self.limit // count))
+
+    @property
+    def _buffer_limit(self):
+        return self.limit // 2
+
+    @property
+    def chunk_size(self):
+        """
+        Size of the chunks read from the zip members.
+        """
+        if self.limit is None:
+            return BUFFER_SIZE
+        return max(MIN_CHUNK_SIZE, min(BUFFER_SIZE, self._buffer_limit // 64))
+
+    @property
+    def queue_size(self):
+        """
+        Chunks held by each of the two queues of the streaming pipeline.
+        """
+        if self.limit is None:
+            return QUEUE_SIZE
+        return max(1, min(QUEUE_SIZE, self._buffer_limit // (4 * self.chunk_size)))
+
+    def get_extract_workers(self, max_workers=None):
+        """
+        Returns the number of extraction threads, at most *max_workers*
+        (by default, the number of processors).
+        """
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        if self.limit is None:
+            return max_workers
+        return max(1, min(max_workers,
+                          self._buffer_limit // (self.chunk_size + WORKER_OVERHEAD)))
+
+    @property
+    def compressor_limit(self):
+        """
+        Memory of the xz compressor, in bytes, ``None`` if not limited.
+        """
+        if self.limit is None:
+            return None
+        return self.limit - self._buffer_limit
+
+    def get_compressor_preset(self, preset=XZ_PRESET):
+        """
+        Returns *preset*, or a lower xz preset if a single thread at
+        *preset* does not fit in the memory of the compressor.
+        """
+        return get_lzma_preset(preset, self.compressor_limit)
+
+    def get_compressor_threads(self, preset=XZ_PRESET):
+        """
+        Returns the number of threads of an xz compressor at *preset*
+        (lowered by :meth:`get_compressor_preset`), ``None`` if not limited.
+        A thread needs about the memory of a single-threaded compressor.
+        """
+        if self.limit is None:
+            return None
+        preset = self.get_compressor_preset(preset)
+        return max(1, self.compressor_limit // XZ_PRESET_MEMORY[preset])
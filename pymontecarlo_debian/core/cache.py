@@ -0,0 +1,266 @@
+"""Cache of extracted zips"""
+
+# Standard library modules.
+import os
+import json
+import errno
+import fcntl
+import shutil
+import zipfile
+import tempfile
+import contextlib
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.digest import hash_file, PayloadManifest
+from pymontecarlo_debian.core.extract import ZipExtractor, ExtractionError, sanitize_name
+from pymontecarlo_debian.core.metrics import REGISTRY
+from pymontecarlo_debian.core.budget import MemoryBudget
+
+# Globals and constants variables.
+MAX_SIZE = 4 * 1024 ** 3
+FICLONE = 0x40049409 # Linux ioctl to reflink a file
+
+LOOKUPS = REGISTRY.counter('pymontecarlo_debian_extraction_cache_lookups_total',
+                           'Lookups in the extraction cache by result', ('result',))
+EVICTIONS = REGISTRY.counter('pymontecarlo_debian_extraction_cache_evictions_total',
+                             'Entries evicted from the extraction cache')
+
+def link_file(src, dst):
+    """
+    Creates *dst* with the content of *src* without copying the data when
+    possible: hard link, then reflink (copy-on-write filesystems), then copy.
+    """
+    try:
+        os.link(src, dst)
+        return
+    except OSError as ex:
+        if ex.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM):
+            raise
+
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            shutil.copyfileobj(fsrc, fdst)
+    shutil.copymode(src, dst)
+
+class CachedTree(object):
+    """
+    Extracted content of a zip in the cache. Files must not be modified,
+    as they may be hard linked in staging directories.
+    """
+
+    def __init__(self, path, index):
+        self.path = path
+        self.members = dict((name, tuple(value))
+                            for name, value in index['members'].items())
+        self.errors = [ExtractionError(name, error)
+                       for name, error in index['errors']]
+
+    def link(self, name, filepath, manifest=None):
+        """
+        Stages the member *name* (as in the zip) to *filepath* and records
+        its digests in *manifest*.
+        """
+        _size, md5, sha256 = self.members[name]
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        link_file(os.path.join(self.path, sanitize_name(name)), filepath)
+        if manifest is not None:
+            manifest.add(filepath, md5, sha256)
+        return filepath
+
+class ExtractionCache(object):
+    """
+    Extracted zips keyed by the SHA-256 of the zip, so that the builds of
+    the same zip for other architectures, variants or retries skip the
+    decompression. The least recently used entries are evicted when the
+    cache exceeds *max_size* bytes.
+
+    Each entry has a lock file: builders hold a shared lock while they
+    stage from an entry, the extraction and the eviction of an entry take
+    an exclusive lock. The eviction removes the lock file with the entry.
+
+    The SHA-256 of a zip is remembered by device, inode, size and
+    modification time, so that a zip is hashed once per cache instance.
+    """
+
+    INDEX_FILENAME = 'index.json'
+
+    def __init__(self, root, max_size=MAX_SIZE, max_workers=None):
+        self.root = os.path.abspath(root)
+        self.max_size = max_size
+        self.max_workers = max_workers
+        self._keys = {}
+        os.makedirs(self.root, exist_ok=True)
+
+    def _get_paths(self, key):
+        dirpath = os.path.join(self.root, key)
+        return dirpath, os.path.join(dirpath, self.INDEX_FILENAME), dirpath + '.lock'
+
+    def _get_key(self, zip_path):
+        st = os.stat(zip_path)
+        stat_key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        key = self._keys.get(stat_key)
+        if key is None:
+            key = self._keys[stat_key] = hash_file(zip_path)['sha256']
+        return key
+
+    def _is_current(self, lockfp, lock_path):
+        """
+        Returns whether the locked file *lockfp* is still the lock file of
+        its entry, i.e. the entry was not evicted while it waited.
+        """
+        try:
+            return os.fstat(lockfp.fileno()).st_ino == os.stat(lock_path).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _acquire(self, zip_path, dirpath, index_path, lock_path, budget):
+        """
+        Returns the lock file of the entry, with a shared lock, and whether
+        the lookup was a hit, once the entry is extracted.
+        """
+        while True:
+            lockfp = open(lock_path, 'a')
+            try:
+                fcntl.flock(lockfp, fcntl.LOCK_SH)
+                if self._is_current(lockfp, lock_path) and os.path.exists(index_path):
+                    return lockfp, 'hit'
+
+                fcntl.flock(lockfp, fcntl.LOCK_EX)
+                result = 'hit'
+                if self._is_current(lockfp, lock_path):
+                    if not os.path.exists(index_path): # Not extracted meanwhile
+                        self._populate(zip_path, dirpath, budget)
+                        result = 'miss'
+
+                    # Not atomic: the entry may be evicted meanwhile
+                    fcntl.flock(lockfp, fcntl.LOCK_SH)
+                    if self._is_current(lockfp, lock_path) and os.path.exists(index_path):
+                        return lockfp, result
+            except BaseException:
+                lockfp.close()
+                raise
+            lockfp.close()
+
+    def _populate(self, zip_path, dirpath, budget):
+        temp_dir = tempfile.mkdtemp(prefix='.', dir=self.root)
+        try:
+            manifest = PayloadManifest()
+
+            def _extract(z, member, filepath):
+                os.makedirs(os.path.dirname(filepath), exist_ok=True)
+                with z.open(member) as src:
+                    manifest.copy_stream(src, filepath, budget.chunk_size)
+                os.chmod(filepath, 0o644)
+
+            with zipfile.ZipFile(zip_path, 'r') as z:
+                targets = [(member, os.path.join(temp_dir, sanitize_name(member.filename)))
+                           for member in z.infolist() if not member.is_dir()]
+
+            extractor = ZipExtractor(budget.get_extract_workers(self.max_workers))
+            errors = extractor.extract(zip_path, targets, _extract)
+            failed = set(error.name for error in errors)
+
+            members = {}
+            for member, filepath in targets:
+                if member.filename in failed:
+                    continue
+                digest = manifest.get(filepath)
+                members[member.filename] = (digest.size, digest.md5, digest.sha256)
+
+            index = {'members': members,
+                     'errors': [(error.name, str(error.error)) for error in errors]}
+            with open(os.path.join(temp_dir, self.INDEX_FILENAME), 'w') as fp:
+                json.dump(index, fp)
+
+            if os.path.exists(dirpath): # Incomplete entry
+                shutil.rmtree(dirpath)
+            os.rename(temp_dir, dirpath)
+        except Exception:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+    @contextlib.contextmanager
+    def open(self, zip_path, budget=None, sha256=None):
+        """
+        Returns the :class:`CachedTree` of the zip, extracting it first if it
+        is not in the cache. The entry cannot be evicted until the context
+        exits. The extraction threads and buffers fit in the
+        :class:`MemoryBudget <pymontecarlo_debian.core.budget.MemoryBudget>`
+        *budget*. The zip is only hashed if its *sha256* is not given.
+        """
+        if budget is None:
+            budget = MemoryBudget()
+        key = sha256.lower() if sha256 else self._get_key(zip_path)
+        dirpath, index_path, lock_path = self._get_paths(key)
+
+        lockfp, result = self._acquire(zip_path, dirpath, index_path, lock_path, budget)
+        with lockfp:
+            try:
+                LOOKUPS.inc(result=result)
+
+                # Last use for the eviction
+                os.utime(index_path)
+                with open(index_path, 'r') as fp:
+                    tree = CachedTree(dirpath, json.load(fp))
+
+                self.evict()
+
+                yield tree
+            finally:
+                fcntl.flock(lockfp, fcntl.LOCK_UN)
+
+    def _iter_entries(self):
+        for filename in os.listdir(self.root):
+            dirpath, index_path, lock_path = self._get_paths(filename)
+            if filename.startswith('.') or not os.path.isdir(dirpath):
+                continue
+
+            try:
+                with open(index_path, 'r') as fp:
+                    index = json.load(fp)
+                last_used = os.stat(index_path).st_mtime
+            except (OSError, ValueError):
+                continue
+
+            size = sum(value[0] for value in index['members'].values())
+            yield last_used, size, dirpath, lock_path
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in
+        *max_size*. Entries in use are skipped.
+        """
+        entries = sorted(self._iter_entries())
+        total_size = sum(size for _last_used, size, _dirpath, _lock_path in entries)
+
+        for _last_used, size, dirpath, lock_path in entries:
+            if total_size <= self.max_size:
+                break
+
+            with open(lock_path, 'a') as lockfp:
+                try:
+                    fcntl.flock(lockfp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+
+                try:
+                    if not self._is_current(lockfp, lock_path): # Evicted meanwhile
+                        continue
+
+                    # Remove the index first, so that a partially removed
+                    # entry is extracted again
+                    try:
+                        os.remove(os.path.join(dirpath, self.INDEX_FILENAME))
+                    except FileNotFoundError: # Evicted by another process
+                        os.remove(lock_path)
+                        continue
+                    shutil.rmtree(dirpath, ignore_errors=True)
+                    os.remove(lock_path)
+                    total_size -= size
+                    EVICTIONS.inc()
+                finally:
+                    fcntl.flock(lockfp, fcntl.LOCK_UN)
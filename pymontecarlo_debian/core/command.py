@@ -0,0 +1,137 @@
+"""Command line arguments and reports shared by the builders"""
+
+# Standard library modules.
+import os
+import sys
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.repository import Repository
+from pymontecarlo_debian.core.cache import ExtractionCache
+from pymontecarlo_debian.core.staging import StagingManager
+from pymontecarlo_debian.core.formats import FORMATS
+from pymontecarlo_debian.core.metrics import REGISTRY
+
+# Globals and constants variables.
+
+def add_build_arguments(parser, split_data=False, split_doc=False):
+    """
+    Adds the arguments of a build, common to all programs, to the
+    :class:`argparse.ArgumentParser` *parser*, after the path of the zip
+    and the arguments of the program. The ``--split-data`` and
+    ``--split-doc`` arguments are only added for the programs supporting
+    them.
+    """
+    parser.add_argument('-o', '--output', help='Path to output directory')
+    parser.add_argument('-i', '--index', action='store_true',
+                        help='Write APT repository index in output directory')
+    parser.add_argument('-n', '--dry-run', action='store_true',
+                        help='Print the files of the package(s) without building them')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='Reuse the extracted zip from this cache directory')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='Write metrics of the build in the Prometheus text format')
+    parser.add_argument('--reproducible', action='store_true',
+                        help='Build identical packages from identical zips '
+                             '(default if SOURCE_DATE_EPOCH is set)')
+    parser.add_argument('--keep-failed', action='store_true',
+                        help='Keep the staging directory of a failed build')
+    parser.add_argument('--timings', action='store_true',
+                        help='Print the critical path of the build stages')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Compress the zip members while they are extracted, '
+                             'without staging them')
+    parser.add_argument('--memory-budget', type=int, metavar='MIB',
+                        help='Size the buffers of the build to fit in this memory')
+    parser.add_argument('--format', dest='formats', action='append', default=[],
+                        choices=sorted(FORMATS),
+                        help='Also write the package(s) in this format (repeatable)')
+    parser.add_argument('--wine-prefix', action='store_true',
+                        help='Create a template Wine prefix at installation')
+    parser.add_argument('--wineserver-timeout', type=int, metavar='SECONDS',
+                        help='Keep wineserver alive between invocations')
+    if split_data:
+        parser.add_argument('--split-data', action='store_true',
+                            help='Put architecture independent files in a separate data package')
+    if split_doc:
+        parser.add_argument('--split-doc', action='store_true',
+                            help='Put the documentation in a separate doc package')
+
+def get_builder_kwargs(args):
+    """
+    Returns the keyword arguments of the
+    :class:`DebBuilder <pymontecarlo_debian.core.debbuilder.DebBuilder>`
+    from the arguments parsed with :func:`add_build_arguments`.
+    """
+    memory_budget = None
+    if args.memory_budget is not None:
+        memory_budget = args.memory_budget * 1024 * 1024
+
+    extraction_cache = None
+    if args.cache:
+        extraction_cache = ExtractionCache(args.cache)
+
+    kwargs = {'wine_prefix': args.wine_prefix,
+              'wineserver_timeout': args.wineserver_timeout,
+              'extraction_cache': extraction_cache,
+              'reproducible': args.reproducible or 'SOURCE_DATE_EPOCH' in os.environ,
+              'staging': StagingManager(keep_failed=args.keep_failed),
+              'streaming': args.streaming,
+              'memory_budget': memory_budget,
+              'formats': args.formats}
+    for name in ['split_data', 'split_doc']:
+        if hasattr(args, name):
+            kwargs[name] = getattr(args, name)
+    return kwargs
+
+def report(debbuilder, fp=None):
+    """
+    Prints the zip members that could not be extracted and the findings
+    of the lint rules of the last build in *fp* (by default, the standard
+    error).
+    """
+    if fp is None:
+        fp = sys.stderr
+
+    for error in debbuilder.extraction_errors:
+        print('Could not extract {0.name}: {0.error}'.format(error), file=fp)
+
+    for finding in debbuilder.lint_findings:
+        print('{0.severity}: {0.package}: {0.path}: {0.message} [{0.rule}]'.format(finding),
+              file=fp)
+
+def run_build(debbuilder, args, *build_args, **build_kwargs):
+    """
+    Plans (``--dry-run``) or builds the packages of *debbuilder* as
+    requested by the arguments parsed with :func:`add_build_arguments`.
+    The *build_args* and *build_kwargs* (e.g. the architecture) are passed
+    to :meth:`plan <pymontecarlo_debian.core.debbuilder.DebBuilder.plan>` and
+    :meth:`build <pymontecarlo_debian.core.debbuilder.DebBuilder.build>`.
+    """
+    if args.dry_run:
+        for plan in debbuilder.plan(*build_args, **build_kwargs):
+            plan.write(sys.stdout)
+        return
+
+    outputdir = args.output
+    if not outputdir:
+        outputdir = os.path.dirname(args.filepath)
+
+    if args.metrics:
+        REGISTRY.enabled = True
+    try:
+        records = debbuilder.build(outputdir, *build_args, **build_kwargs)
+    finally:
+        if args.metrics:
+            REGISTRY.write(args.metrics)
+        for path in debbuilder.staging.kept:
+            print('Staging directory kept: %s' % path, file=sys.stderr)
+
+    if args.timings:
+        debbuilder.stage_report.write(sys.stderr)
+
+    report(debbuilder)
+
+    if args.index:
+        Repository(outputdir).publish(*records)
@@ -2,23 +2,58 @@
 
 # Standard library modules.
 import os
+import stat
 import textwrap
+import datetime
+import calendar
 import gzip
-from io import BytesIO, StringIO
+import io
 import shutil
 import tempfile
+import subprocess
+import time
+import zipfile
 import abc
+import fnmatch
+import lzma
+import tarfile
 
 # Third party modules.
-from debian.deb822 import Deb822
-from debian.changelog import Changelog
-from debian.copyright import Copyright, FilesParagraph, License
-
-from deb_pkg_tools.package import build_package
 
 # Local modules.
+from pymontecarlo_debian.core.repository import PackageRecord, HASH_ALGORITHMS
+from pymontecarlo_debian.core.digest import PayloadManifest
+from pymontecarlo_debian.core.plan import PlannedFile, PackagePlan
+from pymontecarlo_debian.core.extract import ZipExtractor, sanitize_name
+from pymontecarlo_debian.core.metrics import REGISTRY
+from pymontecarlo_debian.core.staging import StagingManager
+from pymontecarlo_debian.core.stages import StageGraph
+from pymontecarlo_debian.core.pipeline import MemberPipeline
+from pymontecarlo_debian.core.debfile import \
+    TarWriter, open_xz, write_deb, read_control_member, XZ_PRESET
+from pymontecarlo_debian.core.budget import MemoryBudget
+from pymontecarlo_debian.core.formats import FORMATS
+from pymontecarlo_debian.core.lint import Linter, CONTROL, DESKTOP_ENTRY, MAN_PAGE, SCRIPT
 
 # Globals and constants variables.
+BUILDS = REGISTRY.counter('pymontecarlo_debian_builds_total',
+                          'Builds by program, architecture and status',
+                          ('program', 'architecture', 'status'))
+PHASE_SECONDS = REGISTRY.histogram('pymontecarlo_debian_build_phase_seconds',
+                                   'Duration of the build phases',
+                                   ('program', 'phase'))
+BYTES_IN = REGISTRY.counter('pymontecarlo_debian_input_bytes_total',
+                            'Size of the zips built', ('program',))
+BYTES_OUT = REGISTRY.counter('pymontecarlo_debian_output_bytes_total',
+                             'Size of the packages written',
+                             ('program', 'architecture'))
+EXTRACTION_ERRORS = REGISTRY.counter('pymontecarlo_debian_extraction_errors_total',
+                                     'Zip members that could not be extracted',
+                                     ('program',))
+
+LICENSE_NAME = 'Custom'
+WINE_PREFIX_TEMPLATE = '/var/lib/{package}/wineprefix' # Created at installation
+PACKAGE_KEYS = ('data', 'doc', 'package') # Order of the packages built
 
 def _format_debian_date(dt):
     s = dt.strftime('%a, %d %b %Y %H:%M:%S %z')
@@ -31,27 +66,130 @@ class DebBuilder(metaclass=abc.ABCMeta):
     def __init__(self, package, fullname, version,
                  maintainer, maintainer_email, authors,
                  section, short_description, long_description, date, license,
-                 homepage, priority='standard', depends=None, recommends=None):
+                 homepage, priority='standard', depends=None, recommends=None,
+                 split_data=False, wine_prefix=False, wineserver_timeout=None,
+                 extract_workers=None, extraction_cache=None, reproducible=False,
+                 staging=None, stage_workers=None, streaming=False,
+                 memory_budget=None, formats=(), split_doc=False, built_dir=None,
+                 zip_sha256=None):
         self.package = package
         self.fullname = fullname
-        self.version = version.rstrip('-1')
+        self._version = version
         self.maintainer = maintainer
         self.maintainer_email = maintainer_email
         self.authors = tuple(authors)
         self.section = section
         self.short_description = short_description
         self.long_description = long_description
-        self.date = date
+        self._date = date
         self.license = license
         self.homepage = homepage
         self.priority = priority
         self.depends = tuple(depends or ())
         self.recommends = tuple(recommends or ())
+        self.split_data = split_data
+        self.split_doc = split_doc
+        self.wine_prefix = wine_prefix
+        self.wineserver_timeout = wineserver_timeout
+        self.extract_workers = extract_workers
+        self.extraction_cache = extraction_cache
+        self.reproducible = reproducible
+        self.staging = staging or StagingManager()
+        self.stage_workers = stage_workers
+        self.streaming = streaming
+        self.memory_budget = memory_budget
+        self._budget = MemoryBudget(memory_budget)
+        self._package_budget = self._budget
+        self.built_dir = built_dir
+        self.zip_sha256 = zip_sha256
+
+        for name in formats:
+            if name not in FORMATS:
+                raise ValueError('Unknown format: %s' % name)
+        if formats and streaming:
+            raise ValueError('Formats other than deb require the members to be staged')
+        self.formats = tuple(formats)
+
+        self._manifest = PayloadManifest()
+        self._linter = Linter(package)
+        self.extraction_errors = []
+        self.stage_report = None
+        self.outputs = {}
+
+    @property
+    def version(self):
+        """
+        Upstream version. The version (and the date) can be given as a
+        callable, which is only called when the value is first needed.
+        """
+        if callable(self._version):
+            self._version = self._version()
+        if self._version.endswith('-1'): # Debian revision
+            return self._version[:-len('-1')]
+        return self._version
+
+    @property
+    def lint_findings(self):
+        """
+        :class:`LintFinding <pymontecarlo_debian.core.lint.LintFinding>` of
+        the control, scripts, man pages and desktop entries of the last
+        build, reported by the rules as they were written.
+        """
+        return self._linter.findings
+
+    @property
+    def date(self):
+        if callable(self._date):
+            self._date = self._date()
+        return self._date
+
+    @property
+    def source_date_epoch(self):
+        """
+        Timestamp of the files and archives of a reproducible build:
+        ``SOURCE_DATE_EPOCH`` if it is set, otherwise the release date.
+        ``None`` if the build is not reproducible.
+        """
+        if not self.reproducible:
+            return None
+        if 'SOURCE_DATE_EPOCH' in os.environ:
+            return int(os.environ['SOURCE_DATE_EPOCH'])
+        return calendar.timegm(self.date.utctimetuple())
+
+    @property
+    def _gzip_mtime(self):
+        """
+        Timestamp of the gzip headers of the man pages and changelog: the
+        one of a reproducible build, otherwise the release date, so that
+        the same files have the same MD5 in every build.
+        """
+        if self.source_date_epoch is not None:
+            return self.source_date_epoch
+        return calendar.timegm(self.date.utctimetuple())
+
+    @property
+    def data_package(self):
+        return '%s-data' % self.package
+
+    @property
+    def doc_package(self):
+        return '%s-doc' % self.package
+
+    @property
+    def wine_prefix_template(self):
+        return WINE_PREFIX_TEMPLATE.format(package=self.package)
+
+    def _get_architecture(self, *args, **kwargs):
+        """
+        Returns the architecture of the main package.
+        """
+        return 'all'
 
     def _create_temp_dir(self, *args, **kwargs):
-        return tempfile.mkdtemp()
+        return self.staging.create()
 
     def _create_control(self, temp_dir, *args, **kwargs):
+        from debian.deb822 import Deb822
         wrapper = textwrap.TextWrapper(initial_indent=' ',
                                        subsequent_indent=' ',
                                        width=80)
@@ -69,8 +207,15 @@ class DebBuilder(metaclass=abc.ABCMeta):
                   'Description': description,
                   'Homepage': self.homepage,
                   }
+        if self.split_data:
+            data_depends = '{0} (= {1}-1)'.format(self.data_package, self.version)
+            fields['Depends'] = ', '.join(self.depends + (data_depends,))
+        if self.split_doc:
+            doc_recommends = '{0} (= {1}-1)'.format(self.doc_package, self.version)
+            fields['Recommends'] = ', '.join(self.recommends + (doc_recommends,))
+
         control = Deb822()
-        control.update(fields)
+        control.update((field, value) for field, value in fields.items() if value)
         return control
 
     def _write_control(self, control, temp_dir, *args, **kwargs):
@@ -79,6 +224,14 @@ class DebBuilder(metaclass=abc.ABCMeta):
         with open(control_filepath, 'wb') as fp:
             control.dump(fp)
 
+    def _write_md5sums(self, md5sums, temp_dir, *args, **kwargs):
+        os.makedirs(os.path.join(temp_dir, 'DEBIAN'), exist_ok=True)
+        filepath = os.path.join(temp_dir, 'DEBIAN', 'md5sums')
+        with open(filepath, 'w') as fp:
+            for path, md5 in md5sums:
+                fp.write('%s  %s\n' % (md5, path))
+        os.chmod(filepath, 0o644)
+
     def _create_preinst(self, temp_dir, *args, **kwargs):
         lines = []
         lines.append('#!/bin/sh')
@@ -96,6 +249,7 @@ class DebBuilder(metaclass=abc.ABCMeta):
     def _write_preinst(self, lines, temp_dir, *args, **kwargs):
         os.makedirs(os.path.join(temp_dir, 'DEBIAN'), exist_ok=True)
         filepath = os.path.join(temp_dir, 'DEBIAN', 'preinst')
+        self._linter.check(SCRIPT, lines, os.path.join('DEBIAN', 'preinst'))
         with open(filepath, 'w') as fp:
             fp.write('\n'.join(lines))
         os.chmod(filepath, 0o555)
@@ -106,6 +260,16 @@ class DebBuilder(metaclass=abc.ABCMeta):
         lines.append('set -e')
         lines.append('if [ "$1" = "configure" ] ; then')
         lines.append('  echo "Configuring %s"' % self.package)
+        if self.wine_prefix:
+            template = self.wine_prefix_template
+            lines.append('  echo "Creating Wine prefix template in %s"' % template)
+            lines.append('  rm -rf %s' % template)
+            lines.append('  mkdir -p %s' % os.path.dirname(template))
+            lines.append('  export WINEPREFIX=%s WINEDEBUG=-all WINEDLLOVERRIDES="mscoree,mshtml="' % template)
+            lines.append('  wineboot --init >/dev/null 2>&1 || true')
+            lines.append('  wineserver -w || true')
+            lines.append('  unset WINEPREFIX WINEDEBUG WINEDLLOVERRIDES')
+            lines.append('  [ -d %s ] && chmod -R a+rX,go-w %s' % (template, template))
         lines.append('fi')
         lines.append('exit 0')
         return lines
@@ -113,6 +277,7 @@ class DebBuilder(metaclass=abc.ABCMeta):
     def _write_postinst(self, lines, temp_dir, *args, **kwargs):
         os.makedirs(os.path.join(temp_dir, 'DEBIAN'), exist_ok=True)
         filepath = os.path.join(temp_dir, 'DEBIAN', 'postinst')
+        self._linter.check(SCRIPT, lines, os.path.join('DEBIAN', 'postinst'))
         with open(filepath, 'w') as fp:
             fp.write('\n'.join(lines))
         os.chmod(filepath, 0o555)
@@ -130,6 +295,7 @@ class DebBuilder(metaclass=abc.ABCMeta):
     def _write_prerm(self, lines, temp_dir, *args, **kwargs):
         os.makedirs(os.path.join(temp_dir, 'DEBIAN'), exist_ok=True)
         filepath = os.path.join(temp_dir, 'DEBIAN', 'prerm')
+        self._linter.check(SCRIPT, lines, os.path.join('DEBIAN', 'prerm'))
         with open(filepath, 'w') as fp:
             fp.write('\n'.join(lines))
         os.chmod(filepath, 0o555)
@@ -138,6 +304,10 @@ class DebBuilder(metaclass=abc.ABCMeta):
         lines = []
         lines.append('#!/bin/sh')
         lines.append('set -e')
+        if self.wine_prefix:
+            lines.append('if [ "$1" = "remove" ] || [ "$1" = "purge" ] ; then')
+            lines.append('  rm -rf %s' % os.path.dirname(self.wine_prefix_template))
+            lines.append('fi')
         lines.append('if [ "$1" = "purge" ] ; then')
         lines.append('  echo "Purging %s"' % self.package)
         lines.append('fi')
@@ -147,10 +317,42 @@ class DebBuilder(metaclass=abc.ABCMeta):
     def _write_postrm(self, lines, temp_dir, *args, **kwargs):
         os.makedirs(os.path.join(temp_dir, 'DEBIAN'), exist_ok=True)
         filepath = os.path.join(temp_dir, 'DEBIAN', 'postrm')
+        self._linter.check(SCRIPT, lines, os.path.join('DEBIAN', 'postrm'))
         with open(filepath, 'w') as fp:
             fp.write('\n'.join(lines))
         os.chmod(filepath, 0o555)
 
+    def _create_launcher(self, filename, arguments=True):
+        """
+        Returns the lines of the shell script running *filename*, located in
+        ``/usr/share/<package>``, with Wine.
+
+        With *wine_prefix*, the Wine prefix of the user is cloned from the
+        template created at installation when it does not exist yet.
+        With *wineserver_timeout*, the wineserver of the user is kept alive
+        for this number of seconds after the program exits, so that the
+        following invocations skip Wine's startup.
+        """
+        lines = []
+        lines.append('#!/bin/sh')
+        if self.wine_prefix:
+            template = self.wine_prefix_template
+            lines.append('WINEPREFIX="${WINEPREFIX:-$HOME/.wine}"')
+            lines.append('export WINEPREFIX')
+            lines.append('if [ ! -d "$WINEPREFIX" ] && [ -d %s ] ; then' % template)
+            lines.append('  mkdir -p "$(dirname "$WINEPREFIX")"')
+            lines.append('  cp -a --reflink=auto %s "$WINEPREFIX.$$"' % template)
+            lines.append('  mv -T "$WINEPREFIX.$$" "$WINEPREFIX" 2>/dev/null || rm -rf "$WINEPREFIX.$$"')
+            lines.append('fi')
+        if self.wineserver_timeout is not None:
+            lines.append('wineserver -p%i 2>/dev/null || true' % self.wineserver_timeout)
+        lines.append('cd /usr/share/%s' % self.package)
+        command = 'exec wine /usr/share/%s/%s' % (self.package, filename)
+        if arguments:
+            command += ' "$@"'
+        lines.append(command)
+        return lines
+
     @abc.abstractmethod
     def _create_man_page(self, temp_dir, *args, **kwargs):
         raise NotImplementedError
@@ -160,10 +362,12 @@ class DebBuilder(metaclass=abc.ABCMeta):
                     exist_ok=True)
         filepath = os.path.join(temp_dir, 'usr', 'share', 'man', 'man1',
                                 '%s.1.gz' % manpage.name)
-        with gzip.open(filepath, 'wb', 9) as z:
-            buf = StringIO()
+        self._linter.check(MAN_PAGE, manpage, os.path.relpath(filepath, temp_dir))
+        with self._manifest.open(filepath, 'wb') as fp, \
+                gzip.GzipFile(fileobj=fp, mode='wb', compresslevel=9,
+                              mtime=self._gzip_mtime) as z, \
+                io.TextIOWrapper(z, encoding='ascii', newline='') as buf:
             manpage.write(buf)
-            z.write(buf.getvalue().encode('ascii'))
 
     @abc.abstractmethod
     def _create_desktop_entry(self, temp_dir, *args, **kwargs):
@@ -176,16 +380,18 @@ class DebBuilder(metaclass=abc.ABCMeta):
         name = os.path.basename(entry.exec_)
         filepath = os.path.join(temp_dir, 'usr', 'share', 'applications',
                                 '%s.desktop' % name)
-        with open(filepath, 'wt') as fp:
+        self._linter.check(DESKTOP_ENTRY, entry, os.path.relpath(filepath, temp_dir))
+        with self._manifest.open(filepath, 'wt') as fp:
             entry.write(fp)
 
     def _create_copyright(self, temp_dir, *args, **kwargs):
+        from debian.copyright import Copyright, FilesParagraph, License
         copyrightobj = Copyright()
         copyrightobj.header.upstream_name = self.fullname
         copyrightobj.header.upstream_contact = (self.maintainer, self.maintainer_email)
 
         copyright = '{0:d} {1}'.format(self.date.year, ', '.join(self.authors))
-        license = License('Custom', self.license)
+        license = License(LICENSE_NAME, self.license)
         paragraph = FilesParagraph.create('*', copyright, license)
         copyrightobj.add_files_paragraph(paragraph)
 
@@ -196,10 +402,11 @@ class DebBuilder(metaclass=abc.ABCMeta):
                     exist_ok=True)
         filepath = os.path.join(temp_dir, 'usr', 'share', 'doc',
                                 self.package, 'copyright')
-        with open(filepath, 'w') as fp:
+        with self._manifest.open(filepath, 'w') as fp:
             copyright.dump(fp)
 
     def _create_changelog(self, temp_dir, *args, **kwargs):
+        from debian.changelog import Changelog
         changelog = Changelog()
         changelog.new_block()
         changelog.set_version(self.version)
@@ -216,44 +423,710 @@ class DebBuilder(metaclass=abc.ABCMeta):
                     exist_ok=True)
         filepath = os.path.join(temp_dir, 'usr', 'share', 'doc',
                                 self.package, 'changelog.Debian.gz')
-        with gzip.open(filepath, 'wb', 9) as z:
-            buf = BytesIO()
-            buf.write(changelog.__bytes__())
-            z.write(buf.getvalue())
+        with self._manifest.open(filepath, 'wb') as fp, \
+                gzip.GzipFile(fileobj=fp, mode='wb', compresslevel=9,
+                              mtime=self._gzip_mtime) as z:
+            z.write(changelog.__bytes__())
+
+    @abc.abstractmethod
+    def _map_zip_members(self, names, *args, **kwargs):
+        """
+        Returns a dictionary with the path, relative to the root of the
+        package, of each zip member that goes in the package. Members
+        missing from the dictionary are excluded.
+        *names* are the sanitized names of the files in the zip.
+        """
+        raise NotImplementedError
+
+    def _plan_zip(self, z, *args, **kwargs):
+        """
+        Returns the list of ``(member, path)`` of the zip members that go in
+        the package and the sorted names of the excluded members.
+        Only the central directory of the zip is read.
+        """
+        members = {}
+        for member in z.infolist():
+            if member.is_dir():
+                continue
+
+            members[sanitize_name(member.filename)] = member
+
+        paths = self._map_zip_members(sorted(members), *args, **kwargs)
+
+        included = [(members[name], paths[name]) for name in sorted(paths)]
+        excluded = sorted(set(members) - set(paths))
+        return included, excluded
+
+    def _extract_zip(self, temp_dir, *args, dry_run=False, **kwargs):
+        if dry_run:
+            return
+
+        with PHASE_SECONDS.time(program=self.package, phase='extract'):
+            self._extract_zip_members(temp_dir, *args, **kwargs)
+        EXTRACTION_ERRORS.inc(len(self.extraction_errors), program=self.package)
+
+    def _extract_zip_members(self, temp_dir, *args, **kwargs):
+        with zipfile.ZipFile(self._zip_path, 'r') as z:
+            included, _excluded = self._plan_zip(z, *args, **kwargs)
+
+        if self.extraction_cache is None:
+            targets = [(member, os.path.join(temp_dir, path))
+                       for member, path in included]
+            extractor = ZipExtractor(self._budget.get_extract_workers(self.extract_workers))
+            self.extraction_errors = \
+                extractor.extract(self._zip_path, targets, self._extract_member)
+            return
+
+        # Link the members from the cache, extracted once for all builds
+        with self.extraction_cache.open(self._zip_path, self._budget,
+                                        self.zip_sha256) as tree:
+            names = set(member.filename for member, _path in included)
+            self.extraction_errors = [error for error in tree.errors
+                                      if error.name in names]
+
+            for member, path in included:
+                if member.filename in tree.members:
+                    tree.link(member.filename, os.path.join(temp_dir, path),
+                              self._manifest)
+
+    def _extract_member(self, z, member, filepath):
+        """
+        Extracts the zip member to *filepath*. The file is hashed while it
+        is written.
+        """
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with z.open(member) as src:
+            self._manifest.copy_stream(src, filepath, self._budget.chunk_size)
+        os.chmod(filepath, 0o644)
+        return filepath
+
+    def _finalize(self, temp_dir, *args, **kwargs):
+        """
+        Writes ``DEBIAN/md5sums`` and the ``Installed-Size`` of the control
+        from the digests recorded while the payload was written.
+        """
+        from debian.deb822 import Deb822
+        self._normalize_modes(temp_dir)
+
+        md5sums, installed_size = self._manifest.summarize(temp_dir)
+        self._write_md5sums(md5sums, temp_dir, *args, **kwargs)
+
+        control_filepath = os.path.join(temp_dir, 'DEBIAN', 'control')
+        with open(control_filepath, 'rb') as fp:
+            control = Deb822(fp)
+        control['Installed-Size'] = str(installed_size)
+        self._linter.check(CONTROL, control, os.path.join('DEBIAN', 'control'),
+                           control.get('Package'))
+        self._write_control(control, temp_dir, *args, **kwargs)
+
+    def _normalize_modes(self, temp_dir):
+        """
+        Sets the modes that depend on the umask: directories are 0755, files
+        are readable by all and executable by all if they are by the owner.
+        The owner write bit is kept, e.g. for the 0555 wrappers.
+        """
+        os.chmod(temp_dir, 0o755)
+        for dirpath, dirnames, filenames in os.walk(temp_dir):
+            for dirname in dirnames:
+                os.chmod(os.path.join(dirpath, dirname), 0o755)
+
+            for filename in filenames:
+                filepath = os.path.join(dirpath, filename)
+                st = os.lstat(filepath)
+                if stat.S_ISLNK(st.st_mode):
+                    continue
+
+                mode = 0o555 if st.st_mode & stat.S_IXUSR else 0o444
+                if st.st_mode & stat.S_IWUSR:
+                    mode |= 0o200
+                # Files linked from the extraction cache are shared
+                if stat.S_IMODE(st.st_mode) != mode:
+                    os.chmod(filepath, mode)
 
     def _build_deb(self, temp_dir, outputdir, *args, **kwargs):
+        from debian.deb822 import Deb822
+        os.makedirs(outputdir, exist_ok=True)
+
+        with open(os.path.join(temp_dir, 'DEBIAN', 'control'), 'rb') as fp:
+            control = Deb822(fp)
+        filename = '{0}_{1}_{2}.deb'.format(control['Package'],
+                                           control['Version'],
+                                           control['Architecture'])
+        filepath = os.path.join(outputdir, filename)
+
+        # dpkg-deb sorts the members, and with SOURCE_DATE_EPOCH uses it as
+        # timestamp of the ar members and clamps the mtimes of the files
+        env = None
+        if self.reproducible:
+            env = dict(os.environ, SOURCE_DATE_EPOCH=str(self.source_date_epoch))
+
+        os.chmod(temp_dir, 0o755)
+        # xz, as the packages written without dpkg-deb
+        command = ['dpkg-deb', '-Zxz', '--root-owner-group', '--build', temp_dir, filepath]
+        threads = self._package_budget.get_compressor_threads()
+        if threads is not None:
+            preset = self._package_budget.get_compressor_preset()
+            command[2:2] = ['-z%i' % preset, '--threads-max=%i' % threads]
+        subprocess.check_call(command, stdout=subprocess.DEVNULL, env=env)
+
+        return PackageRecord.from_built(filepath, control)
+
+    def _is_built(self, filepath, temp_dir):
+        """
+        Returns whether the package *filepath* exists and has the same
+        ``md5sums`` as the package finalized in *temp_dir*, i.e. the same
+        files.
+        """
+        if not os.path.exists(filepath):
+            return False
+
+        with open(os.path.join(temp_dir, 'DEBIAN', 'md5sums'), 'rb') as fp:
+            md5sums = fp.read()
+        try:
+            return read_control_member(filepath, 'md5sums') == md5sums
+        except (ValueError, EOFError, OSError, tarfile.TarError, lzma.LZMAError):
+            return False # Rebuilt
+
+    def _write_format(self, name, temp_dir, outputdir):
+        """
+        Writes the package staged in *temp_dir* in the format *name* and
+        returns its path.
+        """
+        from debian.deb822 import Deb822
+        with open(os.path.join(temp_dir, 'DEBIAN', 'control'), 'rb') as fp:
+            control = Deb822(fp)
+
+        mtime = self.source_date_epoch
+        if mtime is None:
+            mtime = time.time()
+
+        return FORMATS[name](outputdir).write(temp_dir, control, LICENSE_NAME, mtime)
+
+    def _get_arch_paths(self, temp_dir, *args, **kwargs):
+        """
+        Returns the paths, relative to *temp_dir*, of the files in
+        ``/usr/share/<package>`` that differ between architectures.
+        """
+        return []
+
+    def _split_data(self, temp_dir, data_dir, *args, **kwargs):
+        """
+        Moves the architecture independent files of ``/usr/share/<package>``
+        to *data_dir* and creates the control and documentation of the data
+        package.
+        """
+        arch_paths = set(self._get_arch_paths(temp_dir, *args, **kwargs))
+
+        share_dir = os.path.join(temp_dir, 'usr', 'share', self.package)
+        for dirpath, _dirnames, filenames in os.walk(share_dir, topdown=False):
+            for filename in filenames:
+                relpath = os.path.relpath(os.path.join(dirpath, filename), temp_dir)
+                if relpath in arch_paths:
+                    continue
+
+                dst = os.path.join(data_dir, relpath)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                os.rename(os.path.join(temp_dir, relpath), dst)
+
+            if dirpath != share_dir and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+
+        control = self._create_indep_package(temp_dir, data_dir, self.data_package,
+                                             'data files', *args, **kwargs)
+        self._write_control(control, data_dir, *args, **kwargs)
+
+    def _create_indep_package(self, temp_dir, dst_dir, package, label, *args, **kwargs):
+        """
+        Writes in *dst_dir* the control and documentation of *package*,
+        an architecture independent part of the package staged in
+        *temp_dir*, described as its *label*.
+        """
+        # Same copyright and changelog as the main package
+        src_doc_dir = os.path.join(temp_dir, 'usr', 'share', 'doc', self.package)
+        dst_doc_dir = os.path.join(dst_dir, 'usr', 'share', 'doc', package)
+        os.makedirs(dst_doc_dir, exist_ok=True)
+        for filename in ['copyright', 'changelog.Debian.gz']:
+            self._manifest.copy_file(os.path.join(src_doc_dir, filename), dst_doc_dir)
+
+        control = self._create_control(temp_dir, *args, **kwargs)
+        control['Package'] = package
+        control['Architecture'] = 'all'
+        control['Multi-Arch'] = 'foreign'
+        control['Description'] = \
+            control['Description'].replace('\n', ' (%s)\n' % label, 1)
+        control.pop('Depends', None)
+        control.pop('Recommends', None)
+        return control
+
+    def _get_doc_patterns(self, *args, **kwargs):
+        """
+        Returns the patterns (see :mod:`fnmatch`) of the paths, relative to
+        the root of the package, that go in the ``<package>-doc`` package.
+        The copyright and changelog stay in every package.
+        """
+        return [os.path.join('usr', 'share', 'doc', self.package, '*')]
+
+    def _is_doc_path(self, path, patterns):
+        doc_dir = os.path.join('usr', 'share', 'doc', self.package)
+        if path in (os.path.join(doc_dir, 'copyright'),
+                    os.path.join(doc_dir, 'changelog.Debian.gz')):
+            return False
+        return any(fnmatch.fnmatchcase(path, pattern) for pattern in patterns)
+
+    def _split_doc(self, temp_dir, doc_dir, *args, **kwargs):
+        """
+        Moves the documentation, selected by :meth:`_get_doc_patterns`, to
+        *doc_dir* and creates the control and documentation of the doc
+        package.
+        """
+        patterns = self._get_doc_patterns(*args, **kwargs)
+
+        # Directories emptied by the moves are removed
+        emptied = set()
+        for dirpath, _dirnames, filenames in os.walk(temp_dir, topdown=False):
+            relpath = os.path.relpath(dirpath, temp_dir)
+            if relpath == 'DEBIAN':
+                continue
+
+            for filename in filenames:
+                path = os.path.normpath(os.path.join(relpath, filename))
+                if not self._is_doc_path(path, patterns):
+                    continue
+
+                dst = os.path.join(doc_dir, path)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                os.rename(os.path.join(temp_dir, path), dst)
+                emptied.add(dirpath)
+
+            if dirpath in emptied and dirpath != temp_dir and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+                emptied.add(os.path.dirname(dirpath))
+
+        control = self._create_indep_package(temp_dir, doc_dir, self.doc_package,
+                                             'documentation', *args, **kwargs)
+        control['Section'] = 'doc'
+        self._write_control(control, doc_dir, *args, **kwargs)
+
+    def _partition_members(self, temp_dir, included, *args, **kwargs):
+        """
+        Returns the ``(member, path)`` of *included* that go in each
+        package, keyed by ``doc``, ``data`` (if the package is split) and
+        ``package``, with the same rules as :meth:`_split_doc` and
+        :meth:`_split_data`.
+        """
+        members = {'package': []}
+        if self.split_doc:
+            members['doc'] = []
+        if self.split_data:
+            members['data'] = []
+
+        patterns = self._get_doc_patterns(*args, **kwargs)
+        arch_paths = set(self._get_arch_paths(temp_dir, *args, **kwargs))
+        share_dir = os.path.join('usr', 'share', self.package) + os.sep
+        for member, path in included:
+            if self.split_doc and self._is_doc_path(path, patterns):
+                key = 'doc'
+            elif self.split_data and path.startswith(share_dir) and path not in arch_paths:
+                key = 'data'
+            else:
+                key = 'package'
+            members[key].append((member, path))
+        return members
+
+    def _stream_deb(self, temp_dir, members, outputdir, *args, **kwargs):
+        """
+        Writes the package of the files staged in *temp_dir* and of the zip
+        *members* (list of ``(member, path)``). The members are not staged:
+        they are decompressed, hashed and compressed in the data tarball by
+        three threads at the same time (see
+        :class:`MemberPipeline <pymontecarlo_debian.core.pipeline.MemberPipeline>`).
+        A member that cannot be extracted fails the build.
+        """
+        from debian.deb822 import Deb822
+        self._normalize_modes(temp_dir)
+        mtime = self.source_date_epoch
+        if mtime is None:
+            mtime = time.time()
+
+        plan = self._create_plan(temp_dir, members)
+        paths = dict((path, member) for member, path in members)
+
+        # Sorted paths of the data tarball, directories before their content
+        entries = {}
+        for planned in plan.files:
+            entries[planned.path] = planned
+            dirpath = os.path.dirname(planned.path)
+            while dirpath and dirpath not in entries:
+                entries[dirpath] = None
+                dirpath = os.path.dirname(dirpath)
+        for dirpath, dirnames, _filenames in os.walk(temp_dir):
+            if dirpath == temp_dir and 'DEBIAN' in dirnames:
+                dirnames.remove('DEBIAN')
+            for dirname in dirnames:
+                entries[os.path.relpath(os.path.join(dirpath, dirname), temp_dir)] = None
+
+        with open(os.path.join(temp_dir, 'DEBIAN', 'control'), 'rb') as fp:
+            control = Deb822(fp)
+        filename = '{0}_{1}_{2}.deb'.format(control['Package'],
+                                           control['Version'],
+                                           control['Architecture'])
+        filepath = os.path.join(outputdir, filename)
+
         os.makedirs(outputdir, exist_ok=True)
-        build_package(temp_dir, outputdir)
+        scratch_dir = tempfile.mkdtemp(prefix='.', dir=outputdir)
+        try:
+            data_tar_path = os.path.join(scratch_dir, 'data.tar.xz')
+            streamed = [paths[path] for path in sorted(paths)]
+            budget = self._package_budget
+            with MemberPipeline(self._zip_path, streamed,
+                                budget.queue_size, budget.chunk_size) as pipeline, \
+                    open_xz(data_tar_path, XZ_PRESET, budget.compressor_limit) as fp, \
+                    TarWriter(fp, mtime) as tar:
+                readers = iter(pipeline)
+                tar.add_directory('')
+                for path in sorted(entries):
+                    if entries[path] is None:
+                        tar.add_directory(path)
+                    elif path in paths:
+                        member, reader = next(readers)
+                        tar.add_stream(path, reader, member.file_size)
+                    else:
+                        tar.add_file(path, os.path.join(temp_dir, path))
+                next(readers, None) # Checks the end of the last member
+
+            # Same order as PayloadManifest.summarize
+            md5sums = []
+            for path in sorted(entries, key=lambda path: (os.path.dirname(path).split(os.sep),
+                                                          os.path.basename(path))):
+                if path in paths:
+                    md5sums.append((path, pipeline.digests[paths[path].filename][0]))
+                elif entries[path] is not None:
+                    md5sums.append((path, self._manifest.get(os.path.join(temp_dir, path)).md5))
+            self._write_md5sums(md5sums, temp_dir, *args, **kwargs)
+
+            control['Installed-Size'] = str(plan.installed_size)
+            self._linter.check(CONTROL, control, os.path.join('DEBIAN', 'control'),
+                               control.get('Package'))
+            self._write_control(control, temp_dir, *args, **kwargs)
+            self._normalize_modes(os.path.join(temp_dir, 'DEBIAN'))
+
+            control_tar_path = os.path.join(scratch_dir, 'control.tar.xz')
+            with open_xz(control_tar_path, XZ_PRESET, budget.compressor_limit) as fp, \
+                    TarWriter(fp, mtime) as tar:
+                tar.add_tree(os.path.join(temp_dir, 'DEBIAN'))
+
+            temp_filepath = os.path.join(scratch_dir, filename)
+            size, hashes = write_deb(temp_filepath, control_tar_path, data_tar_path,
+                                     mtime, HASH_ALGORITHMS)
+            os.replace(temp_filepath, filepath)
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+        return PackageRecord(filepath, control, size, hashes)
+
+    def _create_plan(self, temp_dir, members, excluded=()):
+        from debian.deb822 import Deb822
+        files = []
+        for dirpath, dirnames, filenames in os.walk(temp_dir):
+            if dirpath == temp_dir and 'DEBIAN' in dirnames:
+                dirnames.remove('DEBIAN')
+
+            for filename in filenames:
+                filepath = os.path.join(dirpath, filename)
+                st = os.lstat(filepath)
+                files.append(PlannedFile(os.path.relpath(filepath, temp_dir),
+                                         st.st_size, stat.S_IMODE(st.st_mode),
+                                         None))
+
+        for member, path in members:
+            files.append(PlannedFile(path, member.file_size, 0o644, member.filename))
+
+        with open(os.path.join(temp_dir, 'DEBIAN', 'control'), 'rb') as fp:
+            control = Deb822(fp)
+
+        return PackagePlan(control['Package'], control['Architecture'],
+                           files, excluded)
+
+    def plan(self, *args, **kwargs):
+        """
+        Returns the :class:`PackagePlan <pymontecarlo_debian.core.plan.PackagePlan>`
+        of each package that :meth:`build` would write, i.e. the final file
+        list and the estimated ``Installed-Size``.
+
+        The zip members are planned from the central directory of the zip,
+        without extracting them, and Wine is not run: if the version and date
+        are not known yet, placeholders are used to generate the
+        documentation, which only slightly changes its size.
+        """
+        version, date = self._version, self._date
+        if callable(version):
+            self._version = '0'
+        if callable(date):
+            self._date = datetime.datetime(1970, 1, 1)
+
+        self._manifest = PayloadManifest()
+        self._linter = Linter(self.package)
+
+        temp_dirs = []
+        failed = True
+        try:
+            with zipfile.ZipFile(self._zip_path, 'r') as z:
+                included, excluded = self._plan_zip(z, *args, **kwargs)
+
+            temp_dir = self._create_temp_dir(*args, **kwargs)
+            temp_dirs.append(temp_dir)
+            self._build(temp_dir, *args, dry_run=True, **kwargs)
+            dirs = {'package': temp_dir}
+
+            if self.split_doc:
+                dirs['doc'] = self._create_temp_dir(*args, **kwargs)
+                temp_dirs.append(dirs['doc'])
+                self._split_doc(temp_dir, dirs['doc'], *args, dry_run=True, **kwargs)
 
-    def _cleanup(self, temp_dir, *args, **kwargs):
-        shutil.rmtree(temp_dir)
+            if self.split_data:
+                dirs['data'] = self._create_temp_dir(*args, **kwargs)
+                temp_dirs.append(dirs['data'])
+                self._split_data(temp_dir, dirs['data'], *args, dry_run=True, **kwargs)
+
+            members = self._partition_members(temp_dir, included, *args, **kwargs)
+            plans = [self._create_plan(dirs[key], members[key],
+                                       excluded if key == 'package' else ())
+                     for key in PACKAGE_KEYS if key in dirs]
+            failed = False
+            return plans
+        finally:
+            self._version, self._date = version, date
+            for temp_dir in temp_dirs:
+                self._cleanup(temp_dir, failed)
+
+    def _cleanup(self, temp_dir, failed=False):
+        self.staging.release(temp_dir, failed)
 
     def build(self, outputdir, *args, **kwargs):
+        """
+        Builds the package(s) in *outputdir* and returns the
+        :class:`PackageRecord <pymontecarlo_debian.core.repository.PackageRecord>`
+        of each written package.
+
+        With *split_data*, the architecture independent files go in a
+        ``<package>-data`` package, which is not built again if the same
+        package, with the same files, is already in *outputdir*, or in
+        *built_dir* if given (except with *streaming*, where the files are
+        only known once the package is written). Likewise with *split_doc*,
+        the documentation goes in a ``<package>-doc`` package, recommended
+        by the main one.
+
+        Zip members that cannot be extracted are left out of the package and
+        reported in :attr:`extraction_errors`.
+
+        The staging directories are given by the
+        :class:`StagingManager <pymontecarlo_debian.core.staging.StagingManager>`
+        *staging*, which deletes them in the background.
+
+        Independent stages run concurrently on *stage_workers* threads; their
+        timings and critical path are in :attr:`stage_report`.
+
+        Each package is also written in the *formats* (``rpm``,
+        ``tar.zst``, ``oci``, see :mod:`pymontecarlo_debian.core.formats`)
+        from the same staged tree, concurrently with the deb. The paths of
+        the written files, debs included, are in :attr:`outputs`, by format.
+
+        With *memory_budget* (bytes), the buffers of the extraction, of the
+        streaming and of the compression are sized to fit in it (see
+        :class:`MemoryBudget <pymontecarlo_debian.core.budget.MemoryBudget>`).
+        It is split between the packages, which are compressed at the same
+        time.
+        """
+        self._manifest = PayloadManifest()
+        self._linter = Linter(self.package)
+        self.extraction_errors = []
+        self.outputs = {}
+
+        # The packages are compressed at the same time
+        self._package_budget = self._budget.split(1 + bool(self.split_data) +
+                                                  bool(self.split_doc))
+
+        program = self.package
+        architecture = self._get_architecture(*args, **kwargs)
+        records = {}
+        outputs = {}
+        temp_dirs = []
+
+        def _timed(phase, func, *func_args, **func_kwargs):
+            def _run():
+                with PHASE_SECONDS.time(program=program, phase=phase):
+                    func(*func_args, **func_kwargs)
+            return _run
+
+        # With streaming, the zip members are not staged: they are written
+        # directly in the packages
+        stage_kwargs = dict(kwargs, dry_run=True) if self.streaming else kwargs
+        members = {}
+
+        def _plan_members():
+            with zipfile.ZipFile(self._zip_path, 'r') as z:
+                included, _excluded = self._plan_zip(z, *args, **kwargs)
+            members.update(self._partition_members(temp_dir, included, *args, **kwargs))
+
+        def _finalize(temp_dir):
+            if not self.streaming:
+                self._finalize(temp_dir, *args, **kwargs)
+
+        def _build_deb(key, temp_dir):
+            if self.streaming:
+                records[key] = self._stream_deb(temp_dir, members[key], outputdir,
+                                                *args, **kwargs)
+            else:
+                records[key] = self._build_deb(temp_dir, outputdir)
+
+        def _build_indep_deb(key, package, temp_dir):
+            with PHASE_SECONDS.time(program=program, phase='finalize'):
+                _finalize(temp_dir)
+            filename = '{0}_{1}-1_all.deb'.format(package, self.version)
+            if not self.streaming and \
+                    self._is_built(os.path.join(self.built_dir or outputdir, filename),
+                                   temp_dir):
+                return
+            with PHASE_SECONDS.time(program=program, phase='deb'):
+                _build_deb(key, temp_dir)
+
+        def _write_format(name, key, temp_dir):
+            with PHASE_SECONDS.time(program=program, phase=name):
+                outputs[name, key] = self._write_format(name, temp_dir, outputdir)
+
+        def _add_format_stages(graph, key, temp_dir, inputs):
+            for name in self.formats:
+                graph.add('%s %s' % (name, key),
+                          lambda name=name: _write_format(name, key, temp_dir),
+                          inputs=inputs)
+
+        failed = True
         try:
             temp_dir = self._create_temp_dir(*args, **kwargs)
-            self._build(temp_dir, *args, **kwargs)
-            self._build_deb(temp_dir, outputdir)
+            temp_dirs.append(temp_dir)
+
+            graph = StageGraph()
+            self._add_stages(graph, temp_dir, *args, **stage_kwargs)
+            staging_names = graph.names
+            staged = graph.outputs
+            planned = []
+            if self.streaming:
+                graph.add('plan zip', _plan_members, outputs=['zip plan'])
+                planned = ['zip plan']
+
+            # The documentation is moved first, as it may be in the data
+            if self.split_doc:
+                doc_dir = self._create_temp_dir(*args, **kwargs)
+                temp_dirs.append(doc_dir)
+                graph.add('split doc',
+                          _timed('split', self._split_doc, temp_dir, doc_dir,
+                                 *args, **stage_kwargs),
+                          inputs=staged, outputs=['doc package', 'package'])
+
+                graph.add('doc deb',
+                          lambda: _build_indep_deb('doc', self.doc_package, doc_dir),
+                          inputs=['doc package'] + planned, outputs=['doc DEBIAN/md5sums'])
+                _add_format_stages(graph, 'doc', doc_dir, ['doc DEBIAN/md5sums'])
+                staged = ['package']
+
+            if self.split_data:
+                data_dir = self._create_temp_dir(*args, **kwargs)
+                temp_dirs.append(data_dir)
+                graph.add('split',
+                          _timed('split', self._split_data, temp_dir, data_dir,
+                                 *args, **stage_kwargs),
+                          inputs=staged, outputs=['data package', 'package'])
+
+                # The data package is built while the other one is finalized
+                graph.add('data deb',
+                          lambda: _build_indep_deb('data', self.data_package, data_dir),
+                          inputs=['data package'] + planned, outputs=['data DEBIAN/md5sums'])
+                _add_format_stages(graph, 'data', data_dir, ['data DEBIAN/md5sums'])
+                staged = ['package']
+
+            graph.add('finalize', _timed('finalize', _finalize, temp_dir),
+                      inputs=staged, outputs=['DEBIAN/md5sums'])
+            graph.add('deb', _timed('deb', _build_deb, 'package', temp_dir),
+                      inputs=['DEBIAN/md5sums'] + planned)
+            _add_format_stages(graph, 'package', temp_dir, ['DEBIAN/md5sums'])
+
+            self.stage_report = graph.run(self.stage_workers)
+            failed = False
+
+            staged_time = max(self.stage_report.timings[name][1] for name in staging_names)
+            PHASE_SECONDS.observe(staged_time, program=program, phase='stage')
+        except Exception:
+            BUILDS.inc(program=program, architecture=architecture, status='failure')
+            raise
         finally:
-            self._cleanup(temp_dir)
+            # Deleted in the background, or kept for inspection on failure
+            for temp_dir in temp_dirs:
+                self._cleanup(temp_dir, failed)
+
+        records = [records[key] for key in PACKAGE_KEYS if key in records]
+        self.outputs['deb'] = [record.filepath for record in records]
+        for name in self.formats:
+            self.outputs[name] = [outputs[name, key] for key in PACKAGE_KEYS
+                                  if (name, key) in outputs]
+
+        BUILDS.inc(program=program, architecture=architecture, status='success')
+        if REGISTRY.enabled:
+            BYTES_IN.inc(os.path.getsize(self._zip_path), program=program)
+            for record in records:
+                BYTES_OUT.inc(record.size, program=program,
+                              architecture=record.architecture)
+
+        return records
 
     def _build(self, temp_dir, *args, **kwargs):
-        control = self._create_control(temp_dir, *args, **kwargs)
-        self._write_control(control, temp_dir, *args, **kwargs)
+        """
+        Writes the content of the package in *temp_dir*.
+        """
+        graph = StageGraph()
+        self._add_stages(graph, temp_dir, *args, **kwargs)
+        self.stage_report = graph.run(self.stage_workers)
 
-        lines = self._create_preinst(temp_dir, *args, **kwargs)
-        self._write_preinst(lines, temp_dir, *args, **kwargs)
+    def _create_stage(self, create, write, temp_dir, *args, **kwargs):
+        """
+        Returns a function calling the *create* method and the *write*
+        method with its result.
+        """
+        def _run():
+            write(create(temp_dir, *args, **kwargs), temp_dir, *args, **kwargs)
+        return _run
 
-        lines = self._create_postinst(temp_dir, *args, **kwargs)
-        self._write_postinst(lines, temp_dir, *args, **kwargs)
+    def _add_stages(self, graph, temp_dir, *args, **kwargs):
+        """
+        Adds the stages writing the content of the package to the
+        :class:`StageGraph <pymontecarlo_debian.core.stages.StageGraph>`
+        *graph*. Subclasses add their stages and call this method last.
+        The version and the date are resolved once, by the ``metadata``
+        stage, as they may require to run Wine.
+        """
+        def _read_metadata():
+            return self.version, self.date
 
-        lines = self._create_prerm(temp_dir, *args, **kwargs)
-        self._write_prerm(lines, temp_dir, *args, **kwargs)
+        doc_dir = os.path.join('usr', 'share', 'doc', self.package)
 
-        copyright = self._create_postrm(temp_dir, *args, **kwargs)
-        self._write_postrm(copyright, temp_dir, *args, **kwargs)
+        graph.add('metadata', _read_metadata, outputs=['version', 'date'])
+        graph.add('control',
+                  self._create_stage(self._create_control, self._write_control,
+                                     temp_dir, *args, **kwargs),
+                  inputs=['version'], outputs=['DEBIAN/control'])
 
-        lines = self._create_copyright(temp_dir, *args, **kwargs)
-        self._write_copyright(lines, temp_dir, *args, **kwargs)
+        for script in ['preinst', 'postinst', 'prerm', 'postrm']:
+            graph.add(script,
+                      self._create_stage(getattr(self, '_create_' + script),
+                                         getattr(self, '_write_' + script),
+                                         temp_dir, *args, **kwargs),
+                      outputs=['DEBIAN/' + script])
 
-        changelog = self._create_changelog(temp_dir, *args, **kwargs)
-        self._write_changelog(changelog, temp_dir, *args, **kwargs)
+        graph.add('copyright',
+                  self._create_stage(self._create_copyright, self._write_copyright,
+                                     temp_dir, *args, **kwargs),
+                  inputs=['date'], outputs=[os.path.join(doc_dir, 'copyright')])
+        graph.add('changelog',
+                  self._create_stage(self._create_changelog, self._write_changelog,
+                                     temp_dir, *args, **kwargs),
+                  inputs=['version', 'date'],
+                  outputs=[os.path.join(doc_dir, 'changelog.Debian.gz')])
@@ -0,0 +1,283 @@
+"""Reading and writing of deb archives without dpkg-deb"""
+
+# Standard library modules.
+import io
+import os
+import lzma
+import shutil
+import tarfile
+import threading
+import subprocess
+import contextlib
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.digest import HashingWriter, BUFFER_SIZE
+
+# Globals and constants variables.
+AR_MAGIC = b'!<arch>\n'
+AR_HEADER_SIZE = 60
+DEBIAN_BINARY = b'2.0\n'
+XZ_PRESET = 6
+XZ_PRESET_MEMORY = [m * 1024 * 1024 for m in (3, 9, 17, 32, 48, 94, 94, 186, 370, 674)]
+"""
+Memory of a single-threaded xz compressor by preset, see xz(1).
+"""
+
+def get_lzma_preset(preset, memlimit):
+    """
+    Returns *preset*, or the highest lower preset whose single-threaded
+    compressor fits in *memlimit* (bytes).
+    """
+    while memlimit is not None and preset > 0 and XZ_PRESET_MEMORY[preset] > memlimit:
+        preset -= 1
+    return preset
+
+@contextlib.contextmanager
+def open_xz(filepath, preset=XZ_PRESET, memlimit=None):
+    """
+    Returns a file object compressing to *filepath* in xz. The compression
+    runs in an ``xz`` process, on all the processors, if it is installed,
+    so that it overlaps with the writing.
+    With *memlimit* (bytes), a lower preset is used if a single thread
+    does not fit in it, and xz runs fewer threads to stay below it. The
+    lowest preset needs 3 MiB.
+    """
+    if memlimit is not None:
+        preset = get_lzma_preset(preset, memlimit)
+        memlimit = max(memlimit, XZ_PRESET_MEMORY[preset])
+
+    xz = shutil.which('xz')
+    with open(filepath, 'wb') as out:
+        if xz is None:
+            with lzma.LZMAFile(out, 'wb', preset=preset) as fp:
+                yield fp
+            return
+
+        command = [xz, '-%i' % preset, '-T0', '-c']
+        if memlimit is not None:
+            command[-1:-1] = ['-q', '--memlimit-compress=%i' % memlimit]
+        proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=out)
+        try:
+            yield proc.stdin
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            proc.stdin.close()
+            returncode = proc.wait()
+
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, proc.args)
+
+class TarWriter(object):
+    """
+    Writes the members of a ``control.tar`` or ``data.tar`` as
+    ``dpkg-deb --root-owner-group`` does: paths starting with ``./``,
+    owned by root and with the same *mtime*.
+    """
+
+    def __init__(self, fileobj, mtime):
+        self.mtime = int(mtime)
+        self._tar = tarfile.open(fileobj=fileobj, mode='w|', format=tarfile.GNU_FORMAT,
+                                 bufsize=BUFFER_SIZE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._tar.close()
+        return False
+
+    def _create_tarinfo(self, path, type, mode, size=0):
+        tarinfo = tarfile.TarInfo('./' + path if path else './')
+        tarinfo.type = type
+        tarinfo.mode = mode
+        tarinfo.size = size
+        tarinfo.mtime = self.mtime
+        tarinfo.uid = tarinfo.gid = 0
+        tarinfo.uname = tarinfo.gname = 'root'
+        return tarinfo
+
+    def add_directory(self, path, mode=0o755):
+        self._tar.addfile(self._create_tarinfo(path, tarfile.DIRTYPE, mode))
+
+    def add_symlink(self, path, target):
+        tarinfo = self._create_tarinfo(path, tarfile.SYMTYPE, 0o777)
+        tarinfo.linkname = target
+        self._tar.addfile(tarinfo)
+
+    def add_stream(self, path, fileobj, size, mode=0o644):
+        """
+        Adds a file of *size* bytes read from *fileobj*.
+        """
+        self._tar.addfile(self._create_tarinfo(path, tarfile.REGTYPE, mode, size), fileobj)
+
+    def add_file(self, path, filepath):
+        """
+        Adds the file, directory or symbolic link at *filepath*.
+        """
+        st = os.lstat(filepath)
+        mode = st.st_mode & 0o7777
+        if os.path.islink(filepath):
+            self.add_symlink(path, os.readlink(filepath))
+        elif os.path.isdir(filepath):
+            self.add_directory(path, mode)
+        else:
+            with open(filepath, 'rb') as fp:
+                self.add_stream(path, fp, st.st_size, mode)
+
+    def add_tree(self, root):
+        """
+        Adds the content of the directory *root*, sorted by path.
+        """
+        self.add_directory('')
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(dirnames + filenames):
+                filepath = os.path.join(dirpath, name)
+                self.add_file(os.path.relpath(filepath, root), filepath)
+
+def _write_ar_member(fp, name, src, size, mtime):
+    header = '{0:<16}{1:<12d}{2:<6d}{3:<6d}{4:<8o}{5:<10d}`\n' \
+        .format(name, int(mtime), 0, 0, 0o100644, size)
+    fp.write(header.encode('ascii'))
+    shutil.copyfileobj(src, fp, BUFFER_SIZE)
+    if size % 2:
+        fp.write(b'\n')
+
+def write_deb(filepath, control_tar_path, data_tar_path, mtime, algorithms=()):
+    """
+    Writes the ar archive of a package from its compressed control and
+    data tarballs, named after their paths (e.g. ``control.tar.xz``).
+    Returns the size of the package and the hexadecimal digest for each of
+    *algorithms*, computed while it is written.
+    """
+    with HashingWriter(io.FileIO(filepath, 'w'), algorithms) as raw, \
+            io.BufferedWriter(raw, BUFFER_SIZE) as fp:
+        fp.write(AR_MAGIC)
+        _write_ar_member(fp, 'debian-binary', io.BytesIO(DEBIAN_BINARY),
+                         len(DEBIAN_BINARY), mtime)
+        for path in [control_tar_path, data_tar_path]:
+            with open(path, 'rb') as src:
+                _write_ar_member(fp, os.path.basename(path), src,
+                                 os.path.getsize(path), mtime)
+
+    hashes = dict((algorithm, hashobj.hexdigest())
+                  for algorithm, hashobj in raw.hashes.items())
+    return raw.size, hashes
+
+class _MemberReader(object):
+    """
+    File object reading the *size* bytes of an ar member from *fp*.
+    """
+
+    def __init__(self, fp, size):
+        self._fp = fp
+        self._remaining = size
+
+    def read(self, size=-1):
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._fp.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def skip(self):
+        """
+        Reads the end of the member.
+        """
+        while self._remaining > 0:
+            if not self.read(BUFFER_SIZE):
+                raise ValueError('Truncated ar member')
+
+def iter_ar_members(fp):
+    """
+    Yields the name, size and a file object reading the content of each
+    member of the ar archive *fp*, in order and without seeking. The
+    content of a member can only be read until the next one is yielded.
+    """
+    if fp.read(len(AR_MAGIC)) != AR_MAGIC:
+        raise ValueError('Not an ar archive')
+
+    while True:
+        header = fp.read(AR_HEADER_SIZE)
+        if not header:
+            return
+        if len(header) != AR_HEADER_SIZE or header[58:60] != b'`\n':
+            raise ValueError('Invalid ar member header')
+
+        name = header[:16].decode('ascii').rstrip().rstrip('/')
+        size = int(header[48:58])
+        reader = _MemberReader(fp, size)
+        yield name, size, reader
+
+        reader.skip()
+        if size % 2:
+            fp.read(1)
+
+@contextlib.contextmanager
+def open_member_tar(name, fileobj):
+    """
+    Returns the :class:`tarfile.TarFile`, opened for streaming, of the
+    ``control.tar`` or ``data.tar`` member *name*, uncompressed or
+    compressed with gzip, bzip2, xz or zstd. The zstd members are
+    decompressed by a ``zstd`` process, fed from a thread.
+    """
+    if not name.endswith('.zst'):
+        with tarfile.open(fileobj=fileobj, mode='r|*', bufsize=BUFFER_SIZE) as tar:
+            yield tar
+        return
+
+    zstd = shutil.which('zstd')
+    if zstd is None:
+        raise ValueError('Unsupported compression: %s (zstd is not installed)' % name)
+
+    proc = subprocess.Popen([zstd, '-q', '-d', '-c'],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL)
+
+    def feed():
+        try:
+            while True:
+                data = fileobj.read(BUFFER_SIZE)
+                if not data:
+                    break
+                proc.stdin.write(data)
+        except BrokenPipeError: # Killed once the tar is read
+            pass
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    thread = threading.Thread(target=feed, daemon=True)
+    thread.start()
+    try:
+        with tarfile.open(fileobj=proc.stdout, mode='r|', bufsize=BUFFER_SIZE) as tar:
+            yield tar
+    finally:
+        proc.kill()
+        thread.join()
+        proc.stdout.close()
+        proc.wait()
+
+def read_control_member(filepath, name):
+    """
+    Returns the content of the file *name* (e.g. ``md5sums``) of the
+    ``control.tar`` of the package *filepath*, or ``None`` if it has no
+    such file.
+    """
+    with open(filepath, 'rb') as fp:
+        for member, _size, reader in iter_ar_members(fp):
+            if not member.startswith('control.tar'):
+                continue
+
+            with open_member_tar(member, reader) as tar:
+                for tarinfo in tar:
+                    if tarinfo.isfile() and os.path.normpath(tarinfo.name) == name:
+                        return tar.extractfile(tarinfo).read()
+            return None
+    return None
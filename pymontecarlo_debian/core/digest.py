@@ -0,0 +1,171 @@
+"""Digests of files"""
+
+# Standard library modules.
+import os
+import io
+import shutil
+import hashlib
+import threading
+import contextlib
+import collections
+
+# Third party modules.
+
+# Local modules.
+
+# Globals and constants variables.
+BUFFER_SIZE = 64 * 1024
+
+def hash_file(filepath, algorithms=('sha256',), buffer_size=BUFFER_SIZE):
+    """
+    Returns a dictionary with the hexadecimal digest of the file for each
+    algorithm.
+    """
+    hashes = dict((algorithm, hashlib.new(algorithm)) for algorithm in algorithms)
+    with open(filepath, 'rb') as fp:
+        for data in iter(lambda: fp.read(buffer_size), b''):
+            for hashobj in hashes.values():
+                hashobj.update(data)
+    return dict((algorithm, hashobj.hexdigest())
+                for algorithm, hashobj in hashes.items())
+
+FileDigest = collections.namedtuple('FileDigest', ['size', 'mtime_ns', 'md5', 'sha256'])
+
+class HashingWriter(io.RawIOBase):
+    """
+    Raw file object hashing with *algorithms* and counting the bytes
+    written to the file object *fp*.
+    """
+
+    def __init__(self, fp, algorithms):
+        super().__init__()
+        self._fp = fp
+        self.name = fp.name
+        self.hashes = dict((algorithm, hashlib.new(algorithm)) for algorithm in algorithms)
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        n = self._fp.write(b)
+        b = memoryview(b)[:n]
+        for hashobj in self.hashes.values():
+            hashobj.update(b)
+        self.size += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._fp.close()
+        super().close()
+
+class PayloadManifest(object):
+    """
+    Digests of the files written in a staging directory.
+
+    Files written with :meth:`open`, :meth:`copy_stream` or :meth:`copy_file`
+    are hashed while they are written. Digests are keyed by inode, so they
+    survive renames within the staging directory. Files written by other
+    means are hashed when their digest is requested.
+    """
+
+    ALGORITHMS = ('md5', 'sha256')
+
+    def __init__(self):
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def _record(self, filepath, hashes):
+        return self.add(filepath, hashes['md5'].hexdigest(),
+                        hashes['sha256'].hexdigest())
+
+    def add(self, filepath, md5, sha256):
+        """
+        Records the known digests of a file written by other means, e.g.
+        linked from a cache.
+        """
+        stat = os.stat(filepath)
+        digest = FileDigest(stat.st_size, stat.st_mtime_ns, md5, sha256)
+        with self._lock:
+            self._digests[(stat.st_dev, stat.st_ino)] = digest
+        return digest
+
+    @contextlib.contextmanager
+    def open(self, filepath, mode='wb', encoding=None):
+        """
+        Opens *filepath* for writing, in binary (``wb``) or text (``w``)
+        mode, and records its digest once closed.
+        """
+        raw = HashingWriter(io.FileIO(filepath, 'w'), self.ALGORITHMS)
+        fp = io.BufferedWriter(raw)
+        if 'b' not in mode:
+            fp = io.TextIOWrapper(fp, encoding=encoding)
+
+        try:
+            yield fp
+        finally:
+            fp.close()
+
+        self._record(filepath, raw.hashes)
+
+    def copy_stream(self, src, filepath, buffer_size=BUFFER_SIZE):
+        with self.open(filepath, 'wb') as fp:
+            shutil.copyfileobj(src, fp, buffer_size)
+
+    def copy_file(self, src, dst):
+        """
+        Same as :func:`shutil.copy`.
+        """
+        if os.path.isdir(dst):
+            dst = os.path.join(dst, os.path.basename(src))
+        with open(src, 'rb') as fp:
+            self.copy_stream(fp, dst)
+        shutil.copymode(src, dst)
+        return dst
+
+    def get(self, filepath):
+        """
+        Returns the :class:`FileDigest` of *filepath*.
+        """
+        stat = os.stat(filepath)
+        with self._lock:
+            digest = self._digests.get((stat.st_dev, stat.st_ino))
+        if digest is not None and \
+                digest.size == stat.st_size and digest.mtime_ns == stat.st_mtime_ns:
+            return digest
+
+        hashes = dict((algorithm, hashlib.new(algorithm)) for algorithm in self.ALGORITHMS)
+        with open(filepath, 'rb') as fp:
+            for data in iter(lambda: fp.read(BUFFER_SIZE), b''):
+                for hashobj in hashes.values():
+                    hashobj.update(data)
+        return self._record(filepath, hashes)
+
+    def summarize(self, root, exclude=('DEBIAN',)):
+        """
+        Returns the list of ``(path, md5)`` of the files in *root*, sorted by
+        path, and the installed size in KiB as computed by
+        ``dpkg-gencontrol`` (size of files rounded up, 1 KiB per directory
+        or symlink).
+        """
+        md5sums = []
+        installed_size = 0
+        for dirpath, dirnames, filenames in os.walk(root):
+            if dirpath == root:
+                dirnames[:] = [dirname for dirname in dirnames
+                               if dirname not in exclude]
+            dirnames.sort()
+            installed_size += len(dirnames)
+
+            for filename in sorted(filenames):
+                filepath = os.path.join(dirpath, filename)
+                if os.path.islink(filepath):
+                    installed_size += 1
+                    continue
+
+                digest = self.get(filepath)
+                installed_size += (digest.size + 1023) // 1024
+                md5sums.append((os.path.relpath(filepath, root), digest.md5))
+
+        return md5sums, installed_size
@@ -0,0 +1,202 @@
+"""Download of upstream archives"""
+
+# Standard library modules.
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Third party modules.
+import requests
+from requests.adapters import HTTPAdapter
+
+# Local modules.
+from pymontecarlo_debian.core.digest import hash_file, BUFFER_SIZE
+
+# Globals and constants variables.
+CHUNK_SIZE = 4 * 1024 * 1024
+
+class DownloadError(Exception):
+    pass
+
+class ContentStore(object):
+    """
+    Local store where files are addressed by their SHA-256 digest.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.partial_dir = os.path.join(root, 'partial')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.partial_dir, exist_ok=True)
+
+    def __contains__(self, sha256):
+        return os.path.exists(self.get_path(sha256))
+
+    def get_path(self, sha256):
+        sha256 = sha256.lower()
+        return os.path.join(self.objects_dir, sha256[:2], sha256[2:])
+
+    def add(self, filepath, sha256=None):
+        """
+        Moves the file into the store and returns its new path.
+        """
+        if sha256 is None:
+            sha256 = hash_file(filepath)['sha256']
+
+        dst = self.get_path(sha256)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        os.replace(filepath, dst)
+        os.chmod(dst, 0o444)
+        return dst
+
+class Downloader(object):
+    """
+    Downloads files in a :class:`ContentStore` using concurrent HTTP range
+    requests. Interrupted downloads are resumed from the completed chunks.
+    """
+
+    def __init__(self, store, max_workers=4, chunk_size=CHUNK_SIZE, session=None):
+        self.store = store
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=max_workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+
+    def _probe(self, url):
+        r = self.session.head(url, allow_redirects=True)
+        r.raise_for_status()
+
+        size = r.headers.get('Content-Length')
+        size = int(size) if size is not None else None
+        accept_ranges = r.headers.get('Accept-Ranges', '').lower() == 'bytes'
+        etag = r.headers.get('ETag')
+
+        return r.url, size, accept_ranges, etag
+
+    def _get_partial_paths(self, url):
+        name = hashlib.sha1(url.encode('utf8')).hexdigest()
+        filepath = os.path.join(self.store.partial_dir, name)
+        return filepath, filepath + '.json'
+
+    def _read_state(self, state_filepath):
+        if not os.path.exists(state_filepath):
+            return {}
+        with open(state_filepath, 'r') as fp:
+            try:
+                return json.load(fp)
+            except ValueError:
+                return {}
+
+    def _write_state(self, state, state_filepath):
+        tmp_filepath = state_filepath + '.tmp'
+        with open(tmp_filepath, 'w') as fp:
+            json.dump(state, fp)
+        os.replace(tmp_filepath, state_filepath)
+
+    def _download_chunk(self, url, fd, start, end):
+        headers = {'Range': 'bytes={0:d}-{1:d}'.format(start, end - 1)}
+        with self.session.get(url, headers=headers, stream=True) as r:
+            r.raise_for_status()
+            if r.status_code != 206:
+                raise DownloadError('Server ignored range request for %s' % url)
+
+            offset = start
+            for data in r.iter_content(BUFFER_SIZE):
+                os.pwrite(fd, data, offset)
+                offset += len(data)
+
+        if offset != end:
+            raise DownloadError('Incomplete chunk {0:d}-{1:d} of {2}'
+                                .format(start, end, url))
+
+    def _download_ranges(self, url, size, filepath, state, state_filepath):
+        done = set(state.setdefault('done', []))
+        chunks = [(index, start, min(start + self.chunk_size, size))
+                  for index, start in enumerate(range(0, size, self.chunk_size))
+                  if index not in done]
+        lock = threading.Lock()
+
+        mode = 'r+b' if os.path.exists(filepath) else 'w+b'
+        with open(filepath, mode) as fp:
+            fp.truncate(size)
+            fd = fp.fileno()
+
+            def _download(chunk):
+                index, start, end = chunk
+                self._download_chunk(url, fd, start, end)
+                with lock:
+                    state['done'].append(index)
+                    self._write_state(state, state_filepath)
+
+            with ThreadPoolExecutor(self.max_workers) as executor:
+                for _ in executor.map(_download, chunks):
+                    pass
+
+    def _download_stream(self, url, filepath):
+        with self.session.get(url, stream=True) as r:
+            r.raise_for_status()
+            with open(filepath, 'wb') as fp:
+                for data in r.iter_content(BUFFER_SIZE):
+                    fp.write(data)
+
+    def download(self, url, size=None, checksums=None):
+        """
+        Downloads the file at *url* and returns its path in the store.
+
+        :arg size: expected size in bytes
+        :arg checksums: dictionary of expected hexadecimal digests, keyed by
+            :mod:`hashlib` algorithm name (e.g. ``{'sha256': '...'}``)
+        """
+        checksums = dict((k.lower(), v.lower()) for k, v in (checksums or {}).items())
+        if 'sha256' in checksums and checksums['sha256'] in self.store:
+            return self.store.get_path(checksums['sha256'])
+
+        url, remote_size, accept_ranges, etag = self._probe(url)
+        if size is not None and remote_size is not None and size != remote_size:
+            raise DownloadError('Expected {0:d} bytes, server reports {1:d} for {2}'
+                                .format(size, remote_size, url))
+
+        filepath, state_filepath = self._get_partial_paths(url)
+
+        if accept_ranges and remote_size:
+            state = self._read_state(state_filepath)
+            if state.get('size') != remote_size or \
+                    state.get('etag') != etag or \
+                    state.get('chunk_size') != self.chunk_size:
+                state = {'url': url, 'size': remote_size, 'etag': etag,
+                         'chunk_size': self.chunk_size, 'done': []}
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+            self._download_ranges(url, remote_size, filepath, state, state_filepath)
+        else:
+            self._download_stream(url, filepath)
+
+        try:
+            actual_size = os.path.getsize(filepath)
+            expected_size = size if size is not None else remote_size
+            if expected_size is not None and actual_size != expected_size:
+                raise DownloadError('Expected {0:d} bytes, downloaded {1:d} for {2}'
+                                    .format(expected_size, actual_size, url))
+
+            algorithms = set(checksums) | set(['sha256'])
+            digests = hash_file(filepath, algorithms)
+            for algorithm, expected in checksums.items():
+                if digests[algorithm] != expected:
+                    raise DownloadError('{0} mismatch for {1}: expected {2}, got {3}'
+                                        .format(algorithm, url, expected, digests[algorithm]))
+        except DownloadError:
+            os.remove(filepath)
+            raise
+        finally:
+            if os.path.exists(state_filepath):
+                os.remove(state_filepath)
+
+        return self.store.add(filepath, digests['sha256'])
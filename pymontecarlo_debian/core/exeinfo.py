@@ -3,12 +3,29 @@
 # Standard library modules.
 import os
 import subprocess
+import tempfile
+import hashlib
+import threading
 
 # Third party modules.
 
 # Local modules.
+from pymontecarlo_debian.core.metrics import REGISTRY
 
 # Globals and constants variables.
+BUFFER_SIZE = 64 * 1024
+
+SIGCHECK_SECONDS = REGISTRY.histogram('pymontecarlo_debian_sigcheck_seconds',
+                                      'Duration of sigcheck under Wine')
+SIGCHECK_FAILURES = REGISTRY.counter('pymontecarlo_debian_sigcheck_failures_total',
+                                     'Sigcheck runs that failed or returned no information')
+EXE_INFO_LOOKUPS = REGISTRY.counter('pymontecarlo_debian_exe_info_lookups_total',
+                                    'Lookups of exe information by result', ('result',))
+
+# Information of the exes already read, keyed by SHA-256, so that
+# long-running processes only run Wine once per exe
+_cache = {}
+_cache_lock = threading.Lock()
 
 def extract_exe_info(filepath):
     """
@@ -19,8 +36,9 @@ def extract_exe_info(filepath):
     """
     cwd = os.path.dirname(__file__)
     command = ['wine', 'sigcheck.exe', '-a', '-q', filepath]
-    proc = subprocess.Popen(command, stdout=subprocess.PIPE, cwd=cwd)
-    proc.wait()
+    with SIGCHECK_SECONDS.time():
+        proc = subprocess.Popen(command, stdout=subprocess.PIPE, cwd=cwd)
+        proc.wait()
 
     exe_info = {}
     for line in proc.stdout.readlines():
@@ -33,4 +51,41 @@ def extract_exe_info(filepath):
 
     proc.stdout.close()
 
-    return exe_info
\ No newline at end of file
+    if proc.returncode != 0 or not exe_info:
+        SIGCHECK_FAILURES.inc()
+
+    return exe_info
+
+def extract_zip_exe_info(z, name):
+    """
+    Extracts the member of the :class:`zipfile.ZipFile` *z* ending with *name*
+    to a temporary file and returns its information.
+    The information is only read once per exe content.
+    """
+    for filename in z.namelist():
+        if filename.endswith(name):
+            break
+    else:
+        raise ValueError('No %s in zip' % name)
+
+    hashobj = hashlib.sha256()
+    temp_file = tempfile.NamedTemporaryFile(suffix='.exe', delete=False)
+    try:
+        with temp_file, z.open(filename) as src:
+            for data in iter(lambda: src.read(BUFFER_SIZE), b''):
+                hashobj.update(data)
+                temp_file.write(data)
+
+        key = hashobj.hexdigest()
+        with _cache_lock:
+            exe_info = _cache.get(key)
+        if exe_info is None:
+            EXE_INFO_LOOKUPS.inc(result='miss')
+            exe_info = extract_exe_info(temp_file.name)
+            with _cache_lock:
+                _cache[key] = exe_info
+        else:
+            EXE_INFO_LOOKUPS.inc(result='hit')
+        return dict(exe_info)
+    finally:
+        os.remove(temp_file.name)
@@ -0,0 +1,116 @@
+"""Parallel extraction of zip members"""
+
+# Standard library modules.
+import os
+import zlib
+import lzma
+import shutil
+import zipfile
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+# Third party modules.
+
+# Local modules.
+
+# Globals and constants variables.
+
+ExtractionError = collections.namedtuple('ExtractionError', ['name', 'error'])
+"""
+Zip member that could not be extracted and the reason.
+"""
+
+FLAG_ENCRYPTED = 0x1
+SUPPORTED_COMPRESSIONS = (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED,
+                          zipfile.ZIP_BZIP2, zipfile.ZIP_LZMA)
+
+class UnsupportedMemberError(Exception):
+    """
+    The zip member is encrypted or compressed with an unsupported method.
+    """
+
+# Errors of a malformed member (bad header, CRC, corrupted data) or of an
+# unsupported one. They only concern the member; errors of the target
+# (e.g. disk full) and any other error fail the extraction.
+MEMBER_ERRORS = (zipfile.BadZipFile, zlib.error, lzma.LZMAError, EOFError,
+                 UnsupportedMemberError)
+
+def check_member(member):
+    """
+    Raises :class:`UnsupportedMemberError` if the zip member *member*, a
+    :class:`zipfile.ZipInfo`, cannot be read by :mod:`zipfile`.
+    """
+    if member.flag_bits & FLAG_ENCRYPTED:
+        raise UnsupportedMemberError('Encrypted member')
+    if member.compress_type not in SUPPORTED_COMPRESSIONS:
+        raise UnsupportedMemberError('Unsupported compression method %i'
+                                     % member.compress_type)
+
+def sanitize_name(filename):
+    """
+    Returns the name of a zip member without drive, absolute path and
+    parent directory components, as :meth:`zipfile.ZipFile.extract` does.
+    """
+    name = os.path.splitdrive(filename)[1]
+    return '/'.join(x for x in name.replace('\\', '/').split('/')
+                    if x not in ('', os.path.curdir, os.path.pardir))
+
+def _extract(z, member, filepath):
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with z.open(member) as src, open(filepath, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+
+class ZipExtractor(object):
+    """
+    Extracts zip members with a pool of threads. Each thread reads from
+    its own handle on the zip; zlib releases the GIL while decompressing.
+    """
+
+    def __init__(self, max_workers=None):
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        self.max_workers = max_workers
+
+    def extract(self, zip_path, targets, extract=_extract):
+        """
+        Extracts each ``(member, filepath)`` of *targets* by calling
+        ``extract(z, member, filepath)`` with the zip handle of the thread.
+        A member that cannot be extracted does not stop the others: the
+        partial file is removed and an :class:`ExtractionError` is returned
+        for it.
+        """
+        # Largest first, so that a large member does not finish last alone
+        targets = sorted(targets, key=lambda target: -target[0].file_size)
+
+        local = threading.local()
+        handles = []
+        lock = threading.Lock()
+
+        def _open():
+            z = getattr(local, 'z', None)
+            if z is None:
+                z = local.z = zipfile.ZipFile(zip_path, 'r')
+                with lock:
+                    handles.append(z)
+            return z
+
+        def _run(target):
+            member, filepath = target
+            try:
+                check_member(member)
+                extract(_open(), member, filepath)
+            except MEMBER_ERRORS as ex:
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+                return ExtractionError(member.filename, ex)
+
+        try:
+            with ThreadPoolExecutor(min(self.max_workers, len(targets)) or 1) as executor:
+                results = list(executor.map(_run, targets))
+        finally:
+            for z in handles:
+                z.close()
+
+        errors = [error for error in results if error is not None]
+        return sorted(errors, key=lambda error: error.name)
@@ -0,0 +1,368 @@
+"""Packages in other formats than deb, from the same staged tree"""
+
+# Standard library modules.
+import os
+import re
+import abc
+import gzip
+import json
+import hashlib
+import shutil
+import tempfile
+import subprocess
+import contextlib
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.digest import hash_file, BUFFER_SIZE
+from pymontecarlo_debian.core.debfile import TarWriter
+
+# Globals and constants variables.
+ZSTD_LEVEL = 10
+
+RPM_ARCHITECTURES = {'amd64': 'x86_64', 'i386': 'i686', 'all': 'noarch'}
+# Architecture independent packages give an image for each architecture
+# of the programs, sharing the same layer
+OCI_ARCHITECTURES = {'amd64': ('amd64',), 'i386': ('386',), 'all': ('amd64', '386')}
+
+RPM_OPERATORS = {'<<': '<', '<=': '<=', '=': '=', '>=': '>=', '>>': '>'}
+DEB_RELATION_PATTERN = re.compile(r'^([^\s(\[:]+)(?::\S+)?\s*(?:\(\s*([<>=]+)\s*([^)\s]+)\s*\))?')
+
+# Directories of /usr/share shared with other packages, not owned by the rpm
+SHARED_DIRS = ('applications', 'doc', 'icons', 'man')
+
+# Scriptlets running the maintainer scripts: Debian script, section, value
+# of $1 at the first installation or the removal (number of instances), and
+# arguments of the Debian script then and at an upgrade
+RPM_SCRIPTLETS = [('preinst', '%pre', 1, 'install', 'upgrade'),
+                  ('postinst', '%post', 1, 'configure', 'configure'),
+                  ('prerm', '%preun', 0, 'remove', 'upgrade'),
+                  ('postrm', '%postun', 0, 'purge', 'upgrade')]
+
+OCI_MEDIA_TYPES = {'layer': 'application/vnd.oci.image.layer.v1.tar+gzip',
+                   'config': 'application/vnd.oci.image.config.v1+json',
+                   'manifest': 'application/vnd.oci.image.manifest.v1+json'}
+
+def _split_version(control):
+    version, _sep, release = control['Version'].rpartition('-')
+    return version, release
+
+def _split_description(control):
+    summary, _sep, body = control['Description'].partition('\n')
+    lines = []
+    for line in body.splitlines():
+        line = line[1:] if line.startswith(' ') else line
+        lines.append('' if line == '.' else line)
+    return summary.strip(), '\n'.join(lines)
+
+def _iter_tree(root):
+    """
+    Yields the sorted paths, relative to *root*, of the directories and
+    files of the payload, i.e. without ``DEBIAN``.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        if dirpath == root and 'DEBIAN' in dirnames:
+            dirnames.remove('DEBIAN')
+        dirnames.sort()
+        for name in sorted(dirnames + filenames):
+            yield os.path.relpath(os.path.join(dirpath, name), root)
+
+def _write_payload_tar(fileobj, root, mtime):
+    with TarWriter(fileobj, mtime) as tar:
+        tar.add_directory('')
+        for path in _iter_tree(root):
+            tar.add_file(path, os.path.join(root, path))
+
+def convert_relations(relations):
+    """
+    Returns the Debian relation fields *relations* (e.g.
+    ``wine (>= 1.0) | wine64``) as rpm dependencies, with the same package
+    names. Alternatives become rich dependencies.
+    """
+    dependencies = []
+    for relation in relations.split(','):
+        alternatives = []
+        for alternative in relation.split('|'):
+            match = DEB_RELATION_PATTERN.match(alternative.strip())
+            if not match:
+                continue
+            name, operator, version = match.groups()
+            if operator is not None:
+                name = '%s %s %s' % (name, RPM_OPERATORS[operator], version)
+            alternatives.append(name)
+
+        if len(alternatives) == 1:
+            dependencies.append(alternatives[0])
+        elif alternatives:
+            dependencies.append('(%s)' % ' or '.join(alternatives))
+    return dependencies
+
+@contextlib.contextmanager
+def open_zstd(filepath, level=ZSTD_LEVEL):
+    """
+    Returns a file object compressing to *filepath* in zstd, in a ``zstd``
+    process using all the processors.
+    """
+    with open(filepath, 'wb') as out:
+        proc = subprocess.Popen(['zstd', '-q', '-%i' % level, '-T0', '-c'],
+                                stdin=subprocess.PIPE, stdout=out)
+        try:
+            yield proc.stdin
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            proc.stdin.close()
+            returncode = proc.wait()
+
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, proc.args)
+
+class PackageFormat(metaclass=abc.ABCMeta):
+    """
+    Writes a package from a staged tree and its Debian control fields.
+    """
+
+    def __init__(self, outputdir):
+        self.outputdir = outputdir
+
+    @abc.abstractmethod
+    def get_filename(self, control):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _write(self, filepath, root, control, license, mtime):
+        raise NotImplementedError
+
+    def write(self, root, control, license, mtime):
+        """
+        Writes the package of the tree *root* and returns its path.
+        The package is written next to its final path and renamed, so that
+        an incomplete package is never visible.
+
+        :arg control: control fields of the deb (``Package``, ``Version``,
+            ``Architecture``, ``Depends``, ...)
+        :arg license: short name of the license
+        :arg mtime: timestamp of the files and of the archive
+        """
+        os.makedirs(self.outputdir, exist_ok=True)
+        filepath = os.path.join(self.outputdir, self.get_filename(control))
+
+        scratch_dir = tempfile.mkdtemp(prefix='.', dir=self.outputdir)
+        try:
+            temp_filepath = os.path.join(scratch_dir, os.path.basename(filepath))
+            self._write(temp_filepath, root, control, license, mtime)
+            os.replace(temp_filepath, filepath)
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+        return filepath
+
+class TarZstFormat(PackageFormat):
+    """
+    Plain tarball of the payload, compressed with zstd, to extract in ``/``.
+    """
+
+    def get_filename(self, control):
+        return '{0}_{1}_{2}.tar.zst'.format(control['Package'], control['Version'],
+                                            control['Architecture'])
+
+    def _write(self, filepath, root, control, license, mtime):
+        with open_zstd(filepath) as fp:
+            _write_payload_tar(fp, root, mtime)
+
+class OciFormat(PackageFormat):
+    """
+    OCI image archive (``oci-archive``) with a single layer containing the
+    payload, to load with ``podman load`` or ``skopeo`` and stack on a base
+    image with Wine. The control fields become labels of the image.
+    An architecture independent package (e.g. ``-data`` or ``-doc``) gives
+    an image for each of ``amd64`` and ``386``, with the same layer, so that
+    it stacks on the images of both architectures of the program.
+    """
+
+    def get_filename(self, control):
+        return '{0}_{1}_{2}.oci.tar'.format(control['Package'], control['Version'],
+                                            control['Architecture'])
+
+    def _create_labels(self, control, license):
+        summary, _description = _split_description(control)
+        labels = {'org.opencontainers.image.title': control['Package'],
+                  'org.opencontainers.image.version': control['Version'],
+                  'org.opencontainers.image.description': summary,
+                  'org.opencontainers.image.licenses':
+                      'LicenseRef-' + re.sub(r'[^A-Za-z0-9.]+', '-', license)}
+        if control.get('Homepage'):
+            labels['org.opencontainers.image.url'] = control['Homepage']
+        if control.get('Maintainer'):
+            labels['org.opencontainers.image.authors'] = control['Maintainer']
+        if control.get('Depends'):
+            labels['org.debian.package.depends'] = control['Depends']
+        return labels
+
+    def _write_blob(self, blobs_dir, content):
+        content = json.dumps(content, sort_keys=True).encode('utf8')
+        digest = hashlib.sha256(content).hexdigest()
+        with open(os.path.join(blobs_dir, digest), 'wb') as fp:
+            fp.write(content)
+        return 'sha256:' + digest, len(content)
+
+    def _write(self, filepath, root, control, license, mtime):
+        layout_dir = os.path.join(os.path.dirname(filepath), 'layout')
+        blobs_dir = os.path.join(layout_dir, 'blobs', 'sha256')
+        os.makedirs(blobs_dir)
+
+        # The uncompressed digest (diff ID) goes in the config
+        tar_path = os.path.join(layout_dir, 'layer.tar')
+        with open(tar_path, 'wb') as fp:
+            _write_payload_tar(fp, root, mtime)
+        diff_id = hash_file(tar_path)['sha256']
+
+        layer_path = os.path.join(layout_dir, 'layer.tar.gz')
+        with open(tar_path, 'rb') as src, open(layer_path, 'wb') as fp, \
+                gzip.GzipFile(fileobj=fp, mode='wb', mtime=mtime) as z:
+            shutil.copyfileobj(src, z, BUFFER_SIZE)
+        os.remove(tar_path)
+
+        layer_digest = hash_file(layer_path)['sha256']
+        layer_size = os.path.getsize(layer_path)
+        os.rename(layer_path, os.path.join(blobs_dir, layer_digest))
+
+        descriptors = []
+        for architecture in OCI_ARCHITECTURES[control['Architecture']]:
+            config = {'architecture': architecture,
+                      'os': 'linux',
+                      'config': {'Labels': self._create_labels(control, license)},
+                      'rootfs': {'type': 'layers', 'diff_ids': ['sha256:' + diff_id]}}
+            config_digest, config_size = self._write_blob(blobs_dir, config)
+
+            manifest = {'schemaVersion': 2,
+                        'mediaType': OCI_MEDIA_TYPES['manifest'],
+                        'config': {'mediaType': OCI_MEDIA_TYPES['config'],
+                                   'digest': config_digest, 'size': config_size},
+                        'layers': [{'mediaType': OCI_MEDIA_TYPES['layer'],
+                                    'digest': 'sha256:' + layer_digest, 'size': layer_size}]}
+            manifest_digest, manifest_size = self._write_blob(blobs_dir, manifest)
+
+            descriptors.append({'mediaType': OCI_MEDIA_TYPES['manifest'],
+                                'digest': manifest_digest, 'size': manifest_size,
+                                'platform': {'architecture': architecture, 'os': 'linux'},
+                                'annotations': {'org.opencontainers.image.ref.name':
+                                                control['Version']}})
+
+        index = {'schemaVersion': 2, 'manifests': descriptors}
+        with open(os.path.join(layout_dir, 'index.json'), 'w') as fp:
+            json.dump(index, fp, sort_keys=True)
+        with open(os.path.join(layout_dir, 'oci-layout'), 'w') as fp:
+            json.dump({'imageLayoutVersion': '1.0.0'}, fp)
+
+        with open(filepath, 'wb') as fp, TarWriter(fp, mtime) as tar:
+            for path in ['oci-layout', 'index.json', 'blobs', 'blobs/sha256']:
+                tar.add_file(path, os.path.join(layout_dir, path))
+            for name in sorted(os.listdir(blobs_dir)):
+                path = os.path.join('blobs', 'sha256', name)
+                tar.add_file(path, os.path.join(layout_dir, path))
+
+class RpmFormat(PackageFormat):
+    """
+    RPM built by ``rpmbuild`` from a spec generated from the control
+    fields. The dependencies keep their Debian names, and the maintainer
+    scripts are run by the scriptlets.
+    """
+
+    def get_filename(self, control):
+        version, release = _split_version(control)
+        return '{0}-{1}-{2}.{3}.rpm'.format(control['Package'], version, release,
+                                            RPM_ARCHITECTURES[control['Architecture']])
+
+    def create_spec(self, root, control, license):
+        """
+        Returns the lines of the spec, installing a copy of *root*.
+        """
+        version, release = _split_version(control)
+        summary, description = _split_description(control)
+
+        lines = []
+        lines.append('Name: %s' % control['Package'])
+        lines.append('Version: %s' % version.replace('-', '_'))
+        lines.append('Release: %s' % release)
+        lines.append('Summary: %s' % summary)
+        lines.append('License: %s' % license)
+        if control.get('Homepage'):
+            lines.append('URL: %s' % control['Homepage'])
+        if control.get('Maintainer'):
+            lines.append('Packager: %s' % control['Maintainer'])
+        lines.append('BuildArch: %s' % RPM_ARCHITECTURES[control['Architecture']])
+        lines.append('AutoReqProv: no')
+        for field, tag in [('Depends', 'Requires'), ('Recommends', 'Recommends')]:
+            for dependency in convert_relations(control.get(field, '')):
+                lines.append('%s: %s' % (tag, dependency))
+        lines.append('')
+        lines.append('%description')
+        lines.append(description.replace('%', '%%') or summary)
+        lines.append('')
+        lines.append('%install')
+        lines.append('mkdir -p %{buildroot}')
+        lines.append("cp -a '%s'/. %%{buildroot}/" % root)
+        lines.append('rm -rf %{buildroot}/DEBIAN')
+        lines.append('')
+        lines.extend(self._create_scriptlets(root))
+        lines.append('%files')
+        lines.append('%defattr(-,root,root,-)')
+        for path in _iter_tree(root):
+            quoted = '"/%s"' % path.replace('%', '%%')
+            filepath = os.path.join(root, path)
+            if os.path.islink(filepath) or not os.path.isdir(filepath):
+                lines.append(quoted)
+                continue
+
+            parts = path.split(os.sep)
+            if parts[:2] == ['usr', 'share'] and len(parts) > 2 and \
+                    (parts[2] not in SHARED_DIRS or (parts[2] == 'doc' and len(parts) > 3)):
+                lines.append('%dir ' + quoted)
+        lines.append('')
+        return lines
+
+    def _create_scriptlets(self, root):
+        """
+        Returns the lines of the scriptlets running the maintainer scripts of
+        *root* (``/bin/sh`` scripts), with the arguments dpkg would give.
+        """
+        lines = []
+        for name, section, count, argument, upgrade_argument in RPM_SCRIPTLETS:
+            filepath = os.path.join(root, 'DEBIAN', name)
+            if not os.path.isfile(filepath):
+                continue
+
+            with open(filepath, 'r') as fp:
+                script = fp.read().splitlines()
+            if script and script[0].startswith('#!'):
+                script = script[1:]
+
+            lines.append(section)
+            lines.append('if [ "$1" -eq %i ] ; then set -- %s ; else set -- %s ; fi'
+                         % (count, argument, upgrade_argument))
+            lines.extend(line.replace('%', '%%') for line in script)
+            lines.append('')
+        return lines
+
+    def _write(self, filepath, root, control, license, mtime):
+        scratch_dir = os.path.dirname(filepath)
+        spec_path = os.path.join(scratch_dir, '%s.spec' % control['Package'])
+        with open(spec_path, 'w') as fp:
+            fp.write('\n'.join(self.create_spec(root, control, license)))
+
+        # No stripping or byte-compilation of the payload, built as is
+        command = ['rpmbuild', '-bb', '--quiet',
+                   '--define', '_topdir %s' % os.path.join(scratch_dir, 'rpmbuild'),
+                   '--define', '_rpmdir %s' % scratch_dir,
+                   '--define', '_build_name_fmt %s' % os.path.basename(filepath),
+                   '--define', '__os_install_post %{nil}',
+                   '--define', 'use_source_date_epoch_as_buildtime 1',
+                   '--define', 'clamp_mtime_to_source_date_epoch 1',
+                   spec_path]
+        env = dict(os.environ, SOURCE_DATE_EPOCH=str(int(mtime)))
+        subprocess.check_call(command, stdout=subprocess.DEVNULL, env=env)
+
+FORMATS = {'rpm': RpmFormat, 'tar.zst': TarZstFormat, 'oci': OciFormat}
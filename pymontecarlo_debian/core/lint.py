@@ -0,0 +1,184 @@
+"""Rules checking the content of a package while it is built"""
+
+# Standard library modules.
+import re
+import threading
+import collections
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.desktopentry import DesktopEntry
+
+# Globals and constants variables.
+LintFinding = collections.namedtuple('LintFinding',
+                                     ['severity', 'rule', 'package', 'path', 'message'])
+"""
+Problem found by a rule: its severity (``error`` or ``warning``), the name
+of the rule, the package and the path of the file concerned, and a
+description.
+"""
+
+ERROR = 'error'
+WARNING = 'warning'
+
+CONTROL = 'control'
+DESKTOP_ENTRY = 'desktop entry'
+MAN_PAGE = 'man page'
+SCRIPT = 'script'
+
+REQUIRED_FIELDS = ('Package', 'Version', 'Architecture', 'Maintainer',
+                   'Description', 'Installed-Size')
+VERSION_PATTERN = re.compile(r'^(?:\d+:)?(?P<upstream>[0-9][A-Za-z0-9.+~-]*?)'
+                             r'(?:-(?P<revision>[A-Za-z0-9.+~]+))?$')
+PACKAGE_PATTERN = re.compile(r'^[a-z0-9][a-z0-9.+-]+$')
+UNQUOTED_ARGUMENTS_PATTERN = re.compile(r'\$(?:[@*]|\{[@*]\})')
+SYNOPSIS_LENGTH = 80
+
+_RULES = collections.defaultdict(list)
+
+def rule(kind, name, severity=ERROR):
+    """
+    Registers the decorated function as the rule *name* for the objects of
+    *kind*. The function yields a message for each problem of the object.
+    """
+    def decorator(func):
+        _RULES[kind].append((name, severity, func))
+        return func
+    return decorator
+
+@rule(CONTROL, 'control-field-missing')
+def _check_control_fields(control):
+    for field in REQUIRED_FIELDS:
+        if field not in control:
+            yield 'Missing field %s' % field
+
+@rule(CONTROL, 'control-field-empty')
+def _check_control_empty_fields(control):
+    for field, value in control.items():
+        if not value.strip():
+            yield 'Empty field %s' % field
+
+@rule(CONTROL, 'package-name')
+def _check_package(control):
+    package = control.get('Package')
+    if package and not PACKAGE_PATTERN.match(package):
+        yield 'Invalid package name %s' % package
+
+@rule(CONTROL, 'version')
+def _check_version(control):
+    version = control.get('Version')
+    if not version:
+        return
+
+    match = VERSION_PATTERN.match(version)
+    if not match:
+        yield 'Invalid version %s' % version
+    elif not match.group('upstream')[-1].isalnum():
+        yield 'Upstream version %s ends with a separator' % match.group('upstream')
+    elif match.group('revision') is None:
+        yield 'Version %s without Debian revision' % version
+
+@rule(CONTROL, 'installed-size')
+def _check_installed_size(control):
+    size = control.get('Installed-Size')
+    if size is not None and not size.isdigit():
+        yield 'Installed-Size %s is not a number of KiB' % size
+
+@rule(CONTROL, 'description-synopsis')
+def _check_synopsis(control):
+    description = control.get('Description')
+    if not description:
+        return
+
+    synopsis = description.splitlines()[0].strip()
+    if not synopsis:
+        yield 'Empty synopsis'
+    elif len(synopsis) > SYNOPSIS_LENGTH:
+        yield 'Synopsis longer than %i characters' % SYNOPSIS_LENGTH
+
+@rule(DESKTOP_ENTRY, 'desktop-entry-name')
+def _check_desktop_entry_name(entry):
+    if not entry.name:
+        yield 'Missing Name'
+
+@rule(DESKTOP_ENTRY, 'desktop-entry-exec')
+def _check_desktop_entry_exec(entry):
+    if entry.type_ == DesktopEntry.TYPE_APPLICATION and not entry.exec_:
+        yield 'Application without Exec'
+
+@rule(DESKTOP_ENTRY, 'desktop-entry-categories', WARNING)
+def _check_desktop_entry_categories(entry):
+    if entry.type_ == DesktopEntry.TYPE_APPLICATION and not entry.categories:
+        yield 'Application without Categories'
+
+@rule(MAN_PAGE, 'man-page-name')
+def _check_man_page_name(manpage):
+    if not manpage.name or '/' in manpage.name:
+        yield 'Invalid name %r' % manpage.name
+
+@rule(MAN_PAGE, 'man-page-description')
+def _check_man_page_description(manpage):
+    if not manpage.short_description:
+        yield 'Empty NAME section'
+
+@rule(MAN_PAGE, 'man-page-ascii')
+def _check_man_page_ascii(manpage):
+    for field in ['name', 'short_description', 'synopsis', 'long_description', 'see_also']:
+        try:
+            getattr(manpage, field).encode('ascii')
+        except UnicodeEncodeError:
+            yield 'Non-ASCII characters in %s' % field
+
+@rule(SCRIPT, 'script-interpreter')
+def _check_script_interpreter(lines):
+    if not lines or not lines[0].startswith('#!'):
+        yield 'Missing interpreter line'
+
+@rule(SCRIPT, 'script-unquoted-arguments')
+def _check_script_arguments(lines):
+    for number, line in enumerate(lines, 1):
+        if line.lstrip().startswith('#'):
+            continue
+        if UNQUOTED_ARGUMENTS_PATTERN.search(line.replace('"$@"', '')):
+            yield 'Line %i: arguments not passed as "$@"' % number
+
+class Linter(object):
+    """
+    Runs the rules on the objects written in the packages of *package*,
+    while they are in memory, and collects the :class:`LintFinding` in
+    :attr:`findings`. The desktop entries of a package must also have
+    distinct names. Objects may be checked concurrently, from the stages of
+    a build.
+    """
+
+    def __init__(self, package):
+        self.package = package
+        self.findings = []
+        self._desktop_names = {}
+        self._lock = threading.Lock()
+
+    def check(self, kind, obj, path, package=None):
+        """
+        Runs the rules of *kind* on *obj*, written at *path* in *package*
+        (by default, the main package), and returns the findings.
+        """
+        package = package or self.package
+        findings = [LintFinding(severity, name, package, path, message)
+                    for name, severity, func in _RULES[kind]
+                    for message in func(obj)]
+
+        with self._lock:
+            if kind == DESKTOP_ENTRY and obj.name:
+                key = package, obj.name.strip().lower()
+                other = self._desktop_names.setdefault(key, path)
+                if other != path:
+                    findings.append(LintFinding(ERROR, 'desktop-entry-duplicate-name',
+                                                package, path, 'Same Name as %s' % other))
+            self.findings.extend(findings)
+
+        return findings
+
+    @property
+    def errors(self):
+        return [finding for finding in self.findings if finding.severity == ERROR]
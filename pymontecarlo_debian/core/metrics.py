@@ -0,0 +1,176 @@
+"""Counters and histograms in the Prometheus text format"""
+
+# Standard library modules.
+import os
+import time
+import bisect
+import threading
+import contextlib
+
+# Third party modules.
+
+# Local modules.
+
+# Globals and constants variables.
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                             for name, value in pairs)
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric(object):
+
+    TYPE = None
+
+    def __init__(self, registry, name, help, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def _render_samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = []
+        lines.append('# HELP %s %s' % (self.name, self.help))
+        lines.append('# TYPE %s %s' % (self.name, self.TYPE))
+        lines.extend(self._render_samples())
+        return lines
+
+class Counter(_Metric):
+
+    TYPE = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return ['%s%s %s' % (self.name, _format_labels(self.labelnames, key),
+                             _format_value(value))
+                for key, value in values]
+
+class Histogram(_Metric):
+
+    TYPE = 'histogram'
+
+    def __init__(self, registry, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def time(self, **labels):
+        """
+        Context manager observing the duration of its block, in seconds.
+        """
+        if not self.registry.enabled:
+            return contextlib.nullcontext()
+        return self._time(labels)
+
+    @contextlib.contextmanager
+    def _time(self, labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get_count(self, **labels):
+        counts, _total = self._values.get(self._key(labels), ([0], 0.0))
+        return sum(counts)
+
+    def _render_samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total))
+                            for key, (counts, total) in self._values.items())
+
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append('%s_bucket%s %i' % (self.name, labels, cumulative))
+            labels = _format_labels(self.labelnames, key)
+            lines.append('%s_sum%s %r' % (self.name, labels, total))
+            lines.append('%s_count%s %i' % (self.name, labels, cumulative))
+        return lines
+
+class Registry(object):
+    """
+    Metrics of the process. Nothing is recorded until the registry is
+    enabled, so that instrumented code only pays a flag check.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, metric_class, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(self, name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help, labelnames, buckets)
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+
+        lines = []
+        for _name, metric in metrics:
+            lines.extend(metric.render())
+        lines.append('')
+        return '\n'.join(lines)
+
+    def write(self, filepath):
+        """
+        Writes the metrics to *filepath*, e.g. for the textfile collector
+        of the Prometheus node exporter.
+        """
+        tmp_filepath = filepath + '.tmp'
+        with open(tmp_filepath, 'w') as fp:
+            fp.write(self.render())
+        os.replace(tmp_filepath, filepath)
+
+REGISTRY = Registry()
@@ -0,0 +1,156 @@
+"""Streaming of zip members through threads and bounded queues"""
+
+# Standard library modules.
+import queue
+import hashlib
+import zipfile
+import threading
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.digest import BUFFER_SIZE
+from pymontecarlo_debian.core.extract import check_member
+
+# Globals and constants variables.
+QUEUE_SIZE = 16
+
+class _QueueReader(object):
+    """
+    File object reading the chunks of a member from the queue.
+    """
+
+    def __init__(self, items, pipeline):
+        self._items = items
+        self._pipeline = pipeline
+        self._buffer = bytearray()
+        self._ended = False
+
+    def _get(self):
+        kind, value = self._pipeline._get(self._items)
+        if kind == 'error':
+            raise value
+        if kind == 'end':
+            self._ended = True
+            return b''
+        return value
+
+    def read(self, size=-1):
+        while not self._ended and (size < 0 or len(self._buffer) < size):
+            self._buffer += self._get()
+
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def drain(self):
+        """
+        Reads the end of the member, which must have been read entirely.
+        """
+        if self._buffer or (not self._ended and self._get()):
+            raise ValueError('Member larger than its size in the zip')
+
+class MemberPipeline(object):
+    """
+    Streams the content of the zip *members*, in order: one thread
+    decompresses the members and another one hashes them, while the
+    consumer reads them. The queues between the threads hold at most
+    *queue_size* chunks of *chunk_size* bytes, so the memory used does not
+    depend on the size of the zip.
+
+    Iterating the pipeline returns each member and a file object to read
+    it; the MD5 and SHA-256 of a member are in :attr:`digests` once it
+    has been read.
+    """
+
+    def __init__(self, zip_path, members, queue_size=QUEUE_SIZE, chunk_size=BUFFER_SIZE):
+        self.zip_path = zip_path
+        self.members = list(members)
+        self.chunk_size = chunk_size
+        self.digests = {}
+
+        self._decompressed = queue.Queue(queue_size)
+        self._hashed = queue.Queue(queue_size)
+        self._cancelled = threading.Event()
+        self._threads = []
+
+    def __enter__(self):
+        for target in [self._decompress, self._hash]:
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._cancelled.set()
+        decompress_thread, hash_thread = self._threads
+        decompress_thread.join()
+
+        # Wakes up the hash thread, unless it already stopped
+        while hash_thread.is_alive():
+            try:
+                self._decompressed.put(('close', None), timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        hash_thread.join()
+        return False
+
+    def __iter__(self):
+        for member in self.members:
+            reader = _QueueReader(self._hashed, self)
+            yield member, reader
+            reader.drain()
+
+    def _put(self, items, item):
+        while not self._cancelled.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, items):
+        while True:
+            try:
+                return items.get(timeout=0.1)
+            except queue.Empty:
+                if not any(thread.is_alive() for thread in self._threads):
+                    raise RuntimeError('Pipeline stopped')
+
+    def _decompress(self):
+        try:
+            with zipfile.ZipFile(self.zip_path, 'r') as z:
+                for member in self.members:
+                    check_member(member)
+                    with z.open(member) as src:
+                        for data in iter(lambda: src.read(self.chunk_size), b''):
+                            if not self._put(self._decompressed, ('data', data)):
+                                return
+                    if not self._put(self._decompressed, ('end', member)):
+                        return
+            self._put(self._decompressed, ('close', None))
+        except Exception as ex:
+            self._put(self._decompressed, ('error', ex))
+
+    def _hash(self):
+        # Blocks until the next item: the decompress thread, or the exit of
+        # the pipeline, ends the stream with a close item
+        md5, sha256 = hashlib.md5(), hashlib.sha256()
+        while True:
+            item = self._decompressed.get()
+            kind, value = item
+            if kind == 'close':
+                return
+            if kind == 'data':
+                md5.update(value)
+                sha256.update(value)
+            elif kind == 'end':
+                self.digests[value.filename] = (md5.hexdigest(), sha256.hexdigest())
+                md5, sha256 = hashlib.md5(), hashlib.sha256()
+
+            if not self._put(self._hashed, item) or kind == 'error':
+                return
@@ -0,0 +1,62 @@
+"""Content of a package before it is built"""
+
+# Standard library modules.
+import os
+import collections
+
+# Third party modules.
+
+# Local modules.
+
+# Globals and constants variables.
+
+PlannedFile = collections.namedtuple('PlannedFile', ['path', 'size', 'mode', 'member'])
+"""
+File of a package: path relative to the root of the package, size in bytes,
+permission bits and name of the zip member it comes from (``None`` for the
+generated files).
+"""
+
+class PackagePlan(object):
+    """
+    Files of a package and the zip members that are left out of it.
+    """
+
+    def __init__(self, package, architecture, files, excluded=()):
+        self.package = package
+        self.architecture = architecture
+        self.files = sorted(files)
+        self.excluded = sorted(excluded)
+
+    @property
+    def size(self):
+        return sum(planned.size for planned in self.files)
+
+    @property
+    def installed_size(self):
+        """
+        Estimated ``Installed-Size`` in KiB, computed as ``dpkg-gencontrol``
+        does: size of files rounded up, 1 KiB per directory.
+        """
+        dirpaths = set()
+        for planned in self.files:
+            dirpath = os.path.dirname(planned.path)
+            while dirpath and dirpath not in dirpaths:
+                dirpaths.add(dirpath)
+                dirpath = os.path.dirname(dirpath)
+
+        return len(dirpaths) + \
+            sum((planned.size + 1023) // 1024 for planned in self.files)
+
+    def write(self, fp):
+        lines = []
+        lines.append('{0} ({1}): {2:d} files, {3:d} bytes, Installed-Size: {4:d} KiB'
+                     .format(self.package, self.architecture, len(self.files),
+                             self.size, self.installed_size))
+        for planned in self.files:
+            lines.append('  {0:04o} {1:12d} {2}'
+                         .format(planned.mode, planned.size, planned.path))
+        for name in self.excluded:
+            lines.append('  excluded: %s' % name)
+        lines.append('')
+        fp.write('\n'.join(lines))
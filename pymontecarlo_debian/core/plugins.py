@@ -0,0 +1,43 @@
+"""Commands and builders registered through setuptools entry points"""
+
+# Standard library modules.
+import importlib
+import importlib.metadata
+
+# Third party modules.
+
+# Local modules.
+
+# Globals and constants variables.
+
+def get_entry_points(group, defaults=None):
+    """
+    Returns a dictionary of the name and ``module:attribute`` reference of
+    the entry points of *group*. Entry points of installed distributions
+    are added to, or override, the *defaults*, so that the programs of this
+    package are available even when it is not installed.
+    Nothing is imported.
+    """
+    references = dict(defaults or {})
+
+    entry_points = importlib.metadata.entry_points()
+    if hasattr(entry_points, 'select'): # Python >= 3.10
+        entry_points = entry_points.select(group=group)
+    else:
+        entry_points = entry_points.get(group, [])
+
+    for entry_point in entry_points:
+        references[entry_point.name] = entry_point.value
+
+    return references
+
+def load_reference(reference):
+    """
+    Imports and returns the object of a ``module:attribute`` reference.
+    """
+    modulename, _, attrname = reference.partition(':')
+    obj = importlib.import_module(modulename.strip())
+    for name in attrname.strip().split('.'):
+        if name:
+            obj = getattr(obj, name)
+    return obj
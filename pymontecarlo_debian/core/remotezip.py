@@ -0,0 +1,144 @@
+"""Read members of a remote zip using HTTP range requests"""
+
+# Standard library modules.
+import io
+import zipfile
+
+# Third party modules.
+import requests
+
+# Local modules.
+from pymontecarlo_debian.core.exeinfo import extract_zip_exe_info
+
+# Globals and constants variables.
+BLOCK_SIZE = 64 * 1024
+
+class HTTPRangeFile(io.RawIOBase):
+    """
+    Read-only, seekable file object over a remote file.
+    Reads are served from a window fetched with a HTTP range request of
+    at least *block_size* bytes.
+    """
+
+    def __init__(self, url, session=None, block_size=BLOCK_SIZE):
+        super().__init__()
+
+        if session is None:
+            session = requests.Session()
+        self.session = session
+        self.block_size = block_size
+
+        r = session.head(url, allow_redirects=True)
+        r.raise_for_status()
+        if r.headers.get('Accept-Ranges', '').lower() != 'bytes':
+            raise IOError('Server does not support range requests: %s' % url)
+
+        self.url = r.url
+        self.size = int(r.headers['Content-Length'])
+        self.bytes_fetched = 0
+        self.request_count = 0
+
+        self._position = 0
+        self._buffer = b''
+        self._buffer_start = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError('Invalid whence: %r' % whence)
+
+        if position < 0:
+            raise ValueError('Negative seek position: %i' % position)
+
+        self._position = position
+        return position
+
+    def prefetch(self, start, end):
+        """
+        Fetches bytes from *start* to *end* (exclusive) in a single request.
+        """
+        start = max(0, start)
+        end = min(end, self.size)
+        if self._buffer_start <= start and \
+                end <= self._buffer_start + len(self._buffer):
+            return
+
+        headers = {'Range': 'bytes={0:d}-{1:d}'.format(start, end - 1)}
+        r = self.session.get(self.url, headers=headers)
+        r.raise_for_status()
+        if r.status_code != 206:
+            raise IOError('Server ignored range request for %s' % self.url)
+
+        self._buffer = r.content
+        self._buffer_start = start
+        self.bytes_fetched += len(r.content)
+        self.request_count += 1
+
+    def readinto(self, b):
+        position = self._position
+        if position >= self.size:
+            return 0
+
+        end = min(position + len(b), self.size)
+        if not (self._buffer_start <= position and
+                end <= self._buffer_start + len(self._buffer)):
+            # Align the window on the end of the file when reading near it,
+            # so that the end of central directory and the central directory
+            # itself usually come in the same request
+            start = max(0, min(position, self.size - self.block_size))
+            self.prefetch(start, max(end, start + self.block_size))
+
+        offset = position - self._buffer_start
+        data = self._buffer[offset:offset + end - position]
+        b[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+class RemoteZipFile(zipfile.ZipFile):
+    """
+    Read-only :class:`zipfile.ZipFile` over HTTP.
+    Only the central directory and the opened members are transferred.
+    """
+
+    def __init__(self, url, session=None, block_size=BLOCK_SIZE):
+        self.rangefile = HTTPRangeFile(url, session, block_size)
+        super().__init__(self.rangefile, 'r')
+
+    def open(self, name, mode='r', pwd=None, **kwargs):
+        if mode == 'r':
+            if isinstance(name, zipfile.ZipInfo):
+                info = name
+            else:
+                info = self.getinfo(name)
+
+            # Local header and data in one request. The local extra field
+            # may differ in length from the central one: any overflow is
+            # read with regular block requests.
+            end = info.header_offset + zipfile.sizeFileHeader + \
+                len(info.orig_filename.encode('utf8')) + len(info.extra) + \
+                info.compress_size
+            self.rangefile.prefetch(info.header_offset, end + 1024)
+
+        return super().open(name, mode, pwd, **kwargs)
+
+def extract_remote_exe_info(url, name, session=None):
+    """
+    Returns the information of the exe ending with *name* inside the remote
+    zip at *url*, without downloading the complete zip.
+    """
+    with RemoteZipFile(url, session) as z:
+        return extract_zip_exe_info(z, name)
@@ -0,0 +1,237 @@
+"""APT repository index of the built packages"""
+
+# Standard library modules.
+import os
+import glob
+import gzip
+import lzma
+import hashlib
+import email.utils
+import sqlite3
+import fcntl
+import contextlib
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.digest import hash_file
+
+# Globals and constants variables.
+HASH_FIELDS = [('md5', 'MD5sum'), ('sha1', 'SHA1'), ('sha256', 'SHA256')]
+RELEASE_HASH_FIELDS = [('md5', 'MD5Sum'), ('sha1', 'SHA1'), ('sha256', 'SHA256')]
+HASH_ALGORITHMS = tuple(algorithm for algorithm, _field in HASH_FIELDS)
+
+class PackageRecord(object):
+    """
+    Control fields, size and digests of a ``.deb``, i.e. everything needed
+    to write its stanza in the ``Packages`` index.
+    """
+
+    def __init__(self, filepath, control, size, hashes):
+        from debian.deb822 import Deb822
+        self.filepath = filepath
+        self.control = Deb822(control)
+        self.size = size
+        self.hashes = dict(hashes)
+
+    @classmethod
+    def from_built(cls, filepath, control):
+        """
+        Creates a record for a package that was just written by another
+        program (e.g. ``dpkg-deb``): the control fields come from memory and
+        the file is read once to compute the digests. The packages written
+        by :func:`write_deb <pymontecarlo_debian.core.debfile.write_deb>`
+        are hashed while they are written instead.
+        """
+        hashes = hash_file(filepath, HASH_ALGORITHMS)
+        return cls(filepath, control, os.path.getsize(filepath), hashes)
+
+    @classmethod
+    def from_file(cls, filepath):
+        """
+        Creates a record for an existing package by reading its control file.
+        """
+        from debian.debfile import DebFile
+        control = DebFile(filepath).debcontrol()
+        return cls.from_built(filepath, control)
+
+    @property
+    def package(self):
+        return self.control['Package']
+
+    @property
+    def version(self):
+        return self.control['Version']
+
+    @property
+    def architecture(self):
+        return self.control['Architecture']
+
+    def create_stanza(self, root):
+        from debian.deb822 import Deb822
+        stanza = Deb822()
+        for key, value in self.control.items():
+            if value:
+                stanza[key] = value
+        stanza['Filename'] = os.path.relpath(self.filepath, root)
+        stanza['Size'] = str(self.size)
+        for algorithm, field in HASH_FIELDS:
+            stanza[field] = self.hashes[algorithm]
+        return stanza
+
+class Repository(object):
+    """
+    Flat APT repository, i.e. ``deb [trusted=yes] file:/path/to/root ./``.
+
+    The stanza of every package is kept in a SQLite manifest in the root
+    directory, so the ``Packages`` indexes are written without re-reading
+    any package. Publishers in concurrent processes are serialized with a
+    lock file.
+    """
+
+    MANIFEST_FILENAME = '.manifest.sqlite'
+    LOCK_FILENAME = '.lock'
+
+    def __init__(self, root, origin='pymontecarlo', label='pymontecarlo'):
+        self.root = os.path.abspath(root)
+        self.origin = origin
+        self.label = label
+
+        os.makedirs(self.root, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS packages ('
+                         'filename TEXT PRIMARY KEY, '
+                         'package TEXT, version TEXT, architecture TEXT, '
+                         'size INTEGER, mtime_ns INTEGER, '
+                         'control TEXT, stanza TEXT)')
+
+    def __contains__(self, filepath):
+        filename = os.path.relpath(os.path.abspath(filepath), self.root)
+        with self._connect() as conn:
+            row = conn.execute('SELECT 1 FROM packages WHERE filename = ?',
+                               (filename,)).fetchone()
+        return row is not None
+
+    def __iter__(self):
+        from debian.deb822 import Deb822
+        with self._connect() as conn:
+            rows = conn.execute('SELECT filename, control, size, stanza FROM packages '
+                                'ORDER BY package, version, architecture').fetchall()
+
+        for filename, control, size, stanza in rows:
+            stanza = Deb822(stanza)
+            hashes = dict((algorithm, stanza[field])
+                          for algorithm, field in HASH_FIELDS)
+            yield PackageRecord(os.path.join(self.root, filename),
+                                Deb822(control), size, hashes)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(os.path.join(self.root, self.MANIFEST_FILENAME),
+                               timeout=60)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @contextlib.contextmanager
+    def lock(self):
+        """
+        Exclusive lock on the repository, shared between processes.
+        """
+        with open(os.path.join(self.root, self.LOCK_FILENAME), 'a') as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fp, fcntl.LOCK_UN)
+
+    def add(self, record):
+        filename = os.path.relpath(os.path.abspath(record.filepath), self.root)
+        mtime_ns = os.stat(record.filepath).st_mtime_ns
+        stanza = record.create_stanza(self.root).dump()
+        control = record.control.dump()
+
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO packages VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         (filename, record.package, record.version,
+                          record.architecture, record.size, mtime_ns,
+                          control, stanza))
+
+    def scan(self):
+        """
+        Adds the packages in the root directory that are missing from the
+        manifest or were modified, and removes the deleted ones.
+        Only the new or modified packages are read.
+        """
+        with self._connect() as conn:
+            rows = conn.execute('SELECT filename, size, mtime_ns FROM packages').fetchall()
+        known = dict((filename, (size, mtime_ns)) for filename, size, mtime_ns in rows)
+
+        for filepath in glob.iglob(os.path.join(self.root, '*.deb')):
+            filename = os.path.relpath(filepath, self.root)
+            stat = os.stat(filepath)
+            if known.pop(filename, None) != (stat.st_size, stat.st_mtime_ns):
+                self.add(PackageRecord.from_file(filepath))
+
+        with self._connect() as conn:
+            conn.executemany('DELETE FROM packages WHERE filename = ?',
+                             [(filename,) for filename in known])
+
+    def publish(self, *records, scan=True):
+        """
+        Adds the records and writes the indexes while holding the lock.
+        """
+        with self.lock():
+            for record in records:
+                self.add(record)
+            if scan:
+                self.scan()
+            self.write_index()
+
+    def _write_file(self, filename, data):
+        filepath = os.path.join(self.root, filename)
+        tmp_filepath = filepath + '.tmp'
+        with open(tmp_filepath, 'wb') as fp:
+            fp.write(data)
+        os.replace(tmp_filepath, filepath)
+
+    def _create_packages(self):
+        with self._connect() as conn:
+            rows = conn.execute('SELECT stanza FROM packages '
+                                'ORDER BY package, version, architecture').fetchall()
+        return '\n'.join(stanza for stanza, in rows).encode('utf8')
+
+    def _create_release(self, indexes):
+        with self._connect() as conn:
+            rows = conn.execute('SELECT DISTINCT architecture FROM packages '
+                                'ORDER BY architecture').fetchall()
+        architectures = [architecture for architecture, in rows]
+
+        lines = []
+        lines.append('Origin: %s' % self.origin)
+        lines.append('Label: %s' % self.label)
+        lines.append('Date: %s' % email.utils.formatdate(usegmt=True))
+        lines.append('Architectures: %s' % ' '.join(architectures))
+        for algorithm, field in RELEASE_HASH_FIELDS:
+            lines.append('%s:' % field)
+            for filename, data in indexes:
+                hashobj = hashlib.new(algorithm, data)
+                lines.append(' {0} {1:d} {2}'.format(hashobj.hexdigest(), len(data), filename))
+        lines.append('')
+        return '\n'.join(lines).encode('utf8')
+
+    def write_index(self):
+        """
+        Writes ``Packages``, ``Packages.gz``, ``Packages.xz`` and ``Release``
+        from the manifest.
+        """
+        packages = self._create_packages()
+        indexes = [('Packages', packages),
+                   ('Packages.gz', gzip.compress(packages, 9, mtime=0)),
+                   ('Packages.xz', lzma.compress(packages))]
+        for filename, data in indexes:
+            self._write_file(filename, data)
+
+        self._write_file('Release', self._create_release(indexes))
@@ -0,0 +1,439 @@
+"""Long-running build service with an HTTP API"""
+
+# Standard library modules.
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import argparse
+import threading
+import subprocess
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Third party modules.
+import requests
+
+# Local modules.
+from pymontecarlo_debian.core.digest import BUFFER_SIZE
+from pymontecarlo_debian.core.download import ContentStore, Downloader, DownloadError
+from pymontecarlo_debian.core.cache import ExtractionCache
+from pymontecarlo_debian.core.staging import StagingManager
+from pymontecarlo_debian.core.repository import Repository
+from pymontecarlo_debian.core.metrics import REGISTRY
+from pymontecarlo_debian.core.plugins import get_entry_points, load_reference
+
+# Globals and constants variables.
+ENTRY_POINT_GROUP = 'pymontecarlo_debian.builders'
+BUILDERS = {'casino2': 'pymontecarlo_debian.casino2.debbuilder:Casino2DebBuilder',
+            'mcxray': 'pymontecarlo_debian.mcxray.debbuilder:MCXrayDebBuilder',
+            'monaco': 'pymontecarlo_debian.monaco.debbuilder:MonacoDebBuilder',
+            'winxray': 'pymontecarlo_debian.winxray.debbuilder:WinXRayDebBuilder'}
+OPTIONS = {'split_data': bool, 'split_doc': bool, 'wine_prefix': bool,
+           'wineserver_timeout': int, 'reproducible': bool, 'streaming': bool,
+           'memory_budget': int}
+
+SUBMISSIONS = REGISTRY.counter('pymontecarlo_debian_server_submissions_total',
+                               'Build requests queued or coalesced with a build in flight',
+                               ('result',))
+
+class BuildError(Exception):
+    pass
+
+class UpstreamError(BuildError):
+    """
+    The zip could not be downloaded from its URL.
+    """
+
+def is_url(location):
+    return urllib.parse.urlparse(location).scheme in ('http', 'https')
+
+def load_builder(program):
+    """
+    Returns the builder class of *program*, one of :data:`BUILDERS` or of
+    the ``pymontecarlo_debian.builders`` entry point group.
+    """
+    builders = get_entry_points(ENTRY_POINT_GROUP, BUILDERS)
+    if program not in builders:
+        raise BuildError('Unknown program: %s' % program)
+    return load_reference(builders[program])
+
+class BuildService(object):
+    """
+    Queues builds on a pool of workers. Zips are kept in a
+    :class:`ContentStore <pymontecarlo_debian.core.download.ContentStore>`
+    and their extracted content in an
+    :class:`ExtractionCache <pymontecarlo_debian.core.cache.ExtractionCache>`;
+    these, the staging directories, the HTTP session of the downloader and
+    the exe information stay warm between builds. Identical builds in flight are coalesced.
+    The clients of the HTTP API may only build the local zips in *zipdir*.
+    """
+
+    def __init__(self, outputdir, workdir, max_workers=2, index=False,
+                 keep_failed=False, zipdir=None):
+        self.outputdir = os.path.abspath(outputdir)
+        self.index = index
+        self.zipdir = os.path.realpath(zipdir) if zipdir else None
+
+        self.store = ContentStore(os.path.join(workdir, 'store'))
+        self.extraction_cache = ExtractionCache(os.path.join(workdir, 'cache'))
+        self.staging = StagingManager(os.path.join(workdir, 'staging'),
+                                      max_spare=max_workers, keep_failed=keep_failed)
+        self.downloader = Downloader(self.store)
+
+        self._executor = ThreadPoolExecutor(max_workers)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+
+        os.makedirs(self.outputdir, exist_ok=True)
+
+    def start(self):
+        # Persistent wineserver, so that builds do not pay Wine's startup
+        try:
+            subprocess.call(['wineserver', '-p'],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError:
+            pass
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+        self.staging.close()
+        try:
+            subprocess.call(['wineserver', '-k'],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError:
+            pass
+
+    def _copy_to_store(self, fp, size=None, sha256=None):
+        """
+        Copies the *size* bytes (or all the bytes) read from *fp* in the
+        store, hashing them while they are copied, and returns their
+        SHA-256, which must be *sha256* if given.
+        """
+        hashobj = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=self.store.partial_dir, delete=False) as temp_file:
+            remaining = size
+            while remaining is None or remaining > 0:
+                length = BUFFER_SIZE if remaining is None else min(BUFFER_SIZE, remaining)
+                data = fp.read(length)
+                if not data:
+                    break
+                hashobj.update(data)
+                temp_file.write(data)
+                if remaining is not None:
+                    remaining -= len(data)
+
+        try:
+            if remaining:
+                raise BuildError('Incomplete upload')
+            digest = hashobj.hexdigest()
+            if sha256 is not None and sha256.lower() != digest:
+                raise BuildError('SHA-256 mismatch: %s' % digest)
+        except BuildError:
+            os.remove(temp_file.name)
+            raise
+
+        if digest in self.store:
+            os.remove(temp_file.name)
+        else:
+            self.store.add(temp_file.name, digest)
+        return digest
+
+    def add_zip_stream(self, fp, size):
+        """
+        Adds the *size* bytes of the zip read from *fp* to the store and
+        returns its SHA-256.
+        """
+        try:
+            return self._copy_to_store(fp, size)
+        except OSError as ex:
+            raise BuildError('Could not store the zip: %s' % ex)
+
+    def add_zip(self, location, sha256=None):
+        """
+        Adds the zip at *location*, a local path or a URL, to the store and
+        returns its SHA-256, which must be *sha256* if given.
+        A local zip is copied: the store never shares the file of the
+        caller, which may change it afterwards.
+        """
+        if is_url(location):
+            checksums = {'sha256': sha256} if sha256 else None
+            try:
+                filepath = self.downloader.download(location, checksums=checksums)
+            except (DownloadError, requests.RequestException, OSError) as ex:
+                raise UpstreamError('Could not download %s: %s' % (location, ex))
+            dirpath, filename = os.path.split(filepath)
+            return os.path.basename(dirpath) + filename
+
+        if not os.path.isfile(location):
+            raise BuildError('No such file: %s' % location)
+        try:
+            with open(location, 'rb') as fp:
+                return self._copy_to_store(fp, sha256=sha256)
+        except OSError as ex:
+            raise BuildError('Could not store %s: %s' % (location, ex))
+
+    def get_local_zip(self, location):
+        """
+        Returns the path of the local zip *location* requested by a client,
+        relative to *zipdir* or in it. Other paths are rejected, so that the
+        clients cannot read the other files of the server.
+        """
+        if self.zipdir is None:
+            raise BuildError('Local zips are not accepted, upload the zip or give its URL')
+
+        filepath = os.path.realpath(os.path.join(self.zipdir, location))
+        if os.path.commonpath([self.zipdir, filepath]) != self.zipdir:
+            raise BuildError('Zip outside of the zip directory: %s' % location)
+        return filepath
+
+    def schedule(self, func, *args, **kwargs):
+        """
+        Runs *func* on a worker of the service and returns its future, e.g.
+        to add a zip and submit its builds without blocking the caller.
+        """
+        return self._executor.submit(func, *args, **kwargs)
+
+    def submit(self, program, sha256, arch=None, **options):
+        """
+        Queues the build of the zip *sha256* and returns a future of the
+        list of :class:`PackageRecord <pymontecarlo_debian.core.repository.PackageRecord>`
+        and of the extraction errors. An identical build in flight is
+        returned instead of queuing a new one.
+        """
+        load_builder(program)
+        for name in options:
+            if name not in OPTIONS:
+                raise BuildError('Unknown option: %s' % name)
+        if sha256 not in self.store:
+            raise BuildError('Unknown zip: %s' % sha256)
+
+        key = (program, sha256, arch, tuple(sorted(options.items())))
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._executor.submit(self._build, program, sha256, arch, options)
+                self._inflight[key] = future
+                future.add_done_callback(lambda _future: self._done(key))
+                SUBMISSIONS.inc(result='queued')
+            else:
+                SUBMISSIONS.inc(result='coalesced')
+        return future
+
+    def _done(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def _build(self, program, sha256, arch, options):
+        # The architecture independent packages already in the output
+        # directory are not built again
+        builder_class = load_builder(program)
+        builder = builder_class(self.store.get_path(sha256),
+                                extraction_cache=self.extraction_cache,
+                                staging=self.staging,
+                                built_dir=self.outputdir,
+                                zip_sha256=sha256,
+                                **options)
+
+        # Packages only appear in the output directory once complete
+        temp_dir = tempfile.mkdtemp(prefix='.build-', dir=self.outputdir)
+        try:
+            kwargs = {} if arch is None else {'arch': arch}
+            records = builder.build(temp_dir, **kwargs)
+
+            # Concurrent builds (e.g. of both architectures) may write the
+            # same architecture independent package: the index must list
+            # the one left in the output directory
+            with self._publish_lock:
+                for record in records:
+                    filepath = os.path.join(self.outputdir, os.path.basename(record.filepath))
+                    os.replace(record.filepath, filepath)
+                    record.filepath = filepath
+
+                if self.index:
+                    Repository(self.outputdir).publish(*records)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+        return records, builder.extraction_errors
+
+class BuildRequestHandler(BaseHTTPRequestHandler):
+    """
+    * ``POST /builds``: builds a package and returns, once it is built, the
+      filename, path, URL, size and SHA-256 of the packages. The zip is
+      either the body (``Content-Type: application/zip``), with the
+      parameters in the query string, or referenced by the ``zip`` field
+      (URL, or path in the zip directory of the service) of a JSON body
+      with the parameters.
+      Parameters: ``program``, ``arch`` and the options of the builder
+      (``split_data``, ``split_doc``, ``wine_prefix``, ``wineserver_timeout``,
+      ``reproducible``, ``streaming``, ``memory_budget`` in bytes).
+    * ``GET /packages/<filename>``: downloads a package.
+    * ``GET /metrics``: metrics in the Prometheus text format.
+    """
+
+    def _send_json(self, code, obj):
+        content = json.dumps(obj, indent=2).encode('utf8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _parse_build_request(self):
+        service = self.server.service
+        url = urllib.parse.urlparse(self.path)
+        try:
+            size = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            raise BuildError('Invalid Content-Length')
+
+        if self.headers.get('Content-Type', '').startswith('application/zip'):
+            params = dict(urllib.parse.parse_qsl(url.query))
+            params['sha256'] = service.add_zip_stream(self.rfile, size)
+        else:
+            try:
+                params = json.loads(self.rfile.read(size).decode('utf8'))
+            except ValueError:
+                raise BuildError('Invalid JSON body')
+            if not isinstance(params, dict):
+                raise BuildError('JSON body must be an object')
+            for name in ('program', 'arch', 'sha256'):
+                if not isinstance(params.get(name, ''), str):
+                    raise BuildError('Invalid value of %s: %r' % (name, params[name]))
+            location = params.pop('zip', None)
+            if not isinstance(location, str):
+                raise BuildError('Missing zip')
+            if not is_url(location):
+                location = service.get_local_zip(location)
+            params['sha256'] = service.add_zip(location, params.get('sha256'))
+
+        if 'program' not in params:
+            raise BuildError('Missing program')
+
+        options = {}
+        for name, value in params.items():
+            if name in ('program', 'arch', 'sha256'):
+                continue
+            if name not in OPTIONS:
+                raise BuildError('Unknown option: %s' % name)
+            if isinstance(value, str) and OPTIONS[name] is bool:
+                value = value.lower() in ('1', 'true', 'yes')
+            try:
+                options[name] = OPTIONS[name](value)
+            except (ValueError, TypeError):
+                raise BuildError('Invalid value of %s: %r' % (name, value))
+
+        return params['program'], params['sha256'], params.get('arch'), options
+
+    def do_POST(self):
+        if urllib.parse.urlparse(self.path).path != '/builds':
+            self._send_json(404, {'error': 'Not found'})
+            return
+
+        try:
+            program, sha256, arch, options = self._parse_build_request()
+            future = self.server.service.submit(program, sha256, arch, **options)
+        except UpstreamError as ex:
+            self._send_json(502, {'error': str(ex)})
+            return
+        except BuildError as ex:
+            self._send_json(400, {'error': str(ex)})
+            return
+
+        try:
+            records, errors = future.result()
+        except Exception as ex:
+            self._send_json(500, {'error': '%s: %s' % (type(ex).__name__, ex)})
+            return
+
+        packages = []
+        for record in records:
+            filename = os.path.basename(record.filepath)
+            packages.append({'filename': filename,
+                             'path': record.filepath,
+                             'url': '/packages/%s' % urllib.parse.quote(filename),
+                             'size': record.size,
+                             'sha256': record.hashes['sha256']})
+        errors = [{'name': error.name, 'error': str(error.error)} for error in errors]
+        self._send_json(200, {'packages': packages, 'errors': errors})
+
+    def do_GET(self):
+        path = urllib.parse.unquote(urllib.parse.urlparse(self.path).path)
+        if path == '/health':
+            self._send_json(200, {'status': 'ok'})
+            return
+
+        if path == '/metrics':
+            content = REGISTRY.render().encode('utf8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+            return
+
+        filename = path[len('/packages/'):]
+        filepath = os.path.join(self.server.service.outputdir, filename)
+        if not path.startswith('/packages/') or \
+                os.path.basename(filename) != filename or \
+                not filename.endswith('.deb') or not os.path.isfile(filepath):
+            self._send_json(404, {'error': 'Not found'})
+            return
+
+        with open(filepath, 'rb') as fp:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/vnd.debian.binary-package')
+            self.send_header('Content-Length', str(os.fstat(fp.fileno()).st_size))
+            self.end_headers()
+            shutil.copyfileobj(fp, self.wfile, BUFFER_SIZE)
+
+    def log_message(self, format, *args):
+        pass
+
+def create_server(service, host='127.0.0.1', port=8080):
+    server = ThreadingHTTPServer((host, port), BuildRequestHandler)
+    server.service = service
+    return server
+
+def run(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description='Serve builds over HTTP')
+
+    parser.add_argument('-o', '--output', required=True,
+                        help='Path to output directory')
+    parser.add_argument('-w', '--workdir', required=True,
+                        help='Path to directory of the zip store and extraction cache')
+    parser.add_argument('-j', '--jobs', type=int, default=2,
+                        help='Number of builds running at the same time')
+    parser.add_argument('-i', '--index', action='store_true',
+                        help='Write APT repository index in output directory')
+    parser.add_argument('--keep-failed', action='store_true',
+                        help='Keep the staging directories of failed builds in the work directory')
+    parser.add_argument('--zip-dir', metavar='DIR',
+                        help='Directory of the local zips that clients may build '
+                             '(default: only uploaded zips and URLs)')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on')
+
+    args = parser.parse_args(argv)
+
+    REGISTRY.enabled = True
+
+    service = BuildService(args.output, args.workdir, args.jobs, args.index,
+                           args.keep_failed, args.zip_dir)
+    service.start()
+
+    server = create_server(service, args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+if __name__ == '__main__':
+    run()
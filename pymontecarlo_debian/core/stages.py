@@ -0,0 +1,161 @@
+"""Stages of a build run concurrently according to their dependencies"""
+
+# Standard library modules.
+import time
+import collections
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Third party modules.
+
+# Local modules.
+
+# Globals and constants variables.
+Stage = collections.namedtuple('Stage', ['name', 'func', 'inputs', 'outputs'])
+
+class StageReport(object):
+    """
+    Start and end times, in seconds from the start of the build, of the
+    stages, and the critical path: the chain of dependent stages that
+    bounds the duration of the build.
+    """
+
+    def __init__(self, timings, dependencies):
+        self.timings = dict(timings)
+        self.elapsed = max([end for _start, end in self.timings.values()] or [0.0])
+
+        # Longest chain of durations through the dependencies
+        finishes = {}
+        previous = {}
+        for name in _sort(dependencies):
+            start, end = self.timings[name]
+            before = max(dependencies[name], key=lambda dep: finishes[dep], default=None)
+            finishes[name] = end - start + (finishes[before] if before is not None else 0.0)
+            previous[name] = before
+
+        path = []
+        name = max(finishes, key=finishes.get, default=None)
+        while name is not None:
+            path.append(name)
+            name = previous[name]
+        self.critical_path = path[::-1]
+
+    def get_duration(self, name):
+        start, end = self.timings[name]
+        return end - start
+
+    def write(self, fp):
+        total = sum(self.get_duration(name) for name in self.critical_path)
+        fp.write('Critical path: %.3f s of %.3f s\n' % (total, self.elapsed))
+        for name in self.critical_path:
+            fp.write('  %-24s %8.3f s\n' % (name, self.get_duration(name)))
+
+def _sort(dependencies):
+    """
+    Returns the names in a topological order, stages added first first.
+    """
+    order = []
+    done = set()
+    remaining = list(dependencies)
+    while remaining:
+        ready = [name for name in remaining if dependencies[name] <= done]
+        if not ready:
+            raise ValueError('Cycle between stages: %s' % ', '.join(remaining))
+        order.extend(ready)
+        done.update(ready)
+        remaining = [name for name in remaining if name not in done]
+    return order
+
+class StageGraph(object):
+    """
+    Stages of a build, each declaring the resources (files, directories or
+    values, named by strings) it reads and writes. A stage runs once all
+    the stages writing its inputs are done, so that independent stages run
+    concurrently on a pool of threads.
+    """
+
+    def __init__(self):
+        self._stages = collections.OrderedDict()
+
+    def add(self, name, func, inputs=(), outputs=()):
+        """
+        Adds the stage *name* calling *func* without arguments.
+        """
+        if name in self._stages:
+            raise ValueError('Duplicate stage: %s' % name)
+        self._stages[name] = Stage(name, func, tuple(inputs), tuple(outputs))
+
+    @property
+    def names(self):
+        return list(self._stages)
+
+    @property
+    def outputs(self):
+        """
+        Resources written by the stages.
+        """
+        return set(output for stage in self._stages.values() for output in stage.outputs)
+
+    def _get_dependencies(self):
+        writers = collections.defaultdict(set)
+        for stage in self._stages.values():
+            for output in stage.outputs:
+                writers[output].add(stage.name)
+
+        dependencies = collections.OrderedDict()
+        for stage in self._stages.values():
+            dependencies[stage.name] = set()
+            for resource in stage.inputs:
+                if resource not in writers:
+                    raise ValueError('No stage writes %s, read by %s' % (resource, stage.name))
+                dependencies[stage.name] |= writers[resource] - set([stage.name])
+        return dependencies
+
+    def run(self, max_workers=None):
+        """
+        Runs the stages and returns a :class:`StageReport`. If a stage
+        fails, the stages that have not started are skipped and the
+        exception is raised once the running ones are done.
+        """
+        dependencies = self._get_dependencies()
+        _sort(dependencies) # Check for cycles before running anything
+
+        start = time.perf_counter()
+        timings = {}
+
+        def _run(stage):
+            stage_start = time.perf_counter() - start
+            try:
+                stage.func()
+            finally:
+                timings[stage.name] = (stage_start, time.perf_counter() - start)
+
+        waiting = collections.OrderedDict((name, set(deps))
+                                          for name, deps in dependencies.items())
+        running = {}
+        error = None
+
+        with ThreadPoolExecutor(max_workers) as executor:
+            while waiting or running:
+                if error is None:
+                    for name in [name for name, deps in waiting.items() if not deps]:
+                        del waiting[name]
+                        future = executor.submit(_run, self._stages[name])
+                        running[future] = name
+
+                if not running:
+                    break
+
+                done, _not_done = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    if future.exception() is not None:
+                        if error is None:
+                            error = future.exception()
+                        continue
+                    for deps in waiting.values():
+                        deps.discard(name)
+
+        if error is not None:
+            raise error
+
+        return StageReport(timings, dependencies)
@@ -0,0 +1,134 @@
+"""Staging directories deleted in the background"""
+
+# Standard library modules.
+import os
+import queue
+import errno
+import atexit
+import shutil
+import tempfile
+import threading
+
+# Third party modules.
+
+# Local modules.
+
+# Globals and constants variables.
+
+class StagingManager(object):
+    """
+    Staging directories of the builds, created in *root*.
+
+    Released directories are renamed into a trash directory and deleted by
+    a background thread, so that builds return without waiting for the
+    deletion of the extracted tree. At most *max_pending* directories wait
+    for deletion; releasing more blocks until the thread catches up.
+    The thread also keeps up to *max_spare* empty directories ready for
+    the next builds.
+
+    With *keep_failed*, the directories of failed builds are kept for
+    inspection and listed in :attr:`kept`.
+    """
+
+    PREFIX = 'pymontecarlo-debian-'
+
+    def __init__(self, root=None, max_spare=2, max_pending=4, keep_failed=False):
+        self.root = os.path.abspath(root or tempfile.gettempdir())
+        self.max_spare = max_spare
+        self.keep_failed = keep_failed
+        self.kept = []
+
+        self._spares = []
+        self._trash_dir = None
+        self._queue = queue.Queue(max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+        os.makedirs(self.root, exist_ok=True)
+
+    def create(self):
+        """
+        Returns an empty staging directory.
+        """
+        with self._lock:
+            if self._spares:
+                return self._spares.pop()
+        return tempfile.mkdtemp(prefix=self.PREFIX, dir=self.root)
+
+    def release(self, path, failed=False):
+        """
+        Schedules the deletion of the staging directory *path*, or keeps it
+        if the build *failed* and failed builds are kept.
+        """
+        if failed and self.keep_failed:
+            with self._lock:
+                self.kept.append(path)
+            return
+
+        self._start()
+        trash_path = os.path.join(self._trash_dir, os.path.basename(path))
+        try:
+            os.rename(path, trash_path)
+        except OSError as ex:
+            if ex.errno != errno.EXDEV:
+                raise
+            shutil.rmtree(path) # Not created by the manager
+            return
+
+        self._queue.put(trash_path)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            self._trash_dir = tempfile.mkdtemp(prefix='.trash-', dir=self.root)
+            self._thread = threading.Thread(target=self._run,
+                                            name='staging-cleanup', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            try:
+                if path is None:
+                    return
+                shutil.rmtree(path, ignore_errors=True)
+                self._fill_spares()
+            finally:
+                self._queue.task_done()
+
+    def _fill_spares(self):
+        while True:
+            with self._lock:
+                if len(self._spares) >= self.max_spare:
+                    return
+            path = tempfile.mkdtemp(prefix=self.PREFIX, dir=self.root)
+            with self._lock:
+                self._spares.append(path)
+
+    def wait(self):
+        """
+        Waits until the released directories are deleted.
+        """
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """
+        Deletes the released directories and the spare ones.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+            shutil.rmtree(self._trash_dir, ignore_errors=True)
+            atexit.unregister(self.close)
+
+        with self._lock:
+            spares, self._spares = self._spares, []
+        for path in spares:
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import sys
+import tempfile
+import shutil
+import zipfile
+import subprocess
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.budget import MemoryBudget, MIN_CHUNK_SIZE
+from pymontecarlo_debian.core.digest import BUFFER_SIZE
+from pymontecarlo_debian.core.pipeline import QUEUE_SIZE
+
+# Globals and constants variables.
+MIB = 1024 * 1024
+
+# Streams the zip through the pipeline and the xz compressor, and prints
+# the growth of the peak RSS (KiB on Linux)
+PEAK_RSS_SCRIPT = """
+import sys, resource, zipfile
+from pymontecarlo_debian.core.budget import MemoryBudget
+from pymontecarlo_debian.core.pipeline import MemberPipeline
+from pymontecarlo_debian.core.debfile import TarWriter, open_xz
+
+zip_path, tar_path, limit = sys.argv[1], sys.argv[2], int(sys.argv[3])
+budget = MemoryBudget(limit)
+with zipfile.ZipFile(zip_path, 'r') as z:
+    members = z.infolist()
+
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+with MemberPipeline(zip_path, members, budget.queue_size, budget.chunk_size) as pipeline, \\
+        open_xz(tar_path, 0, budget.compressor_limit) as fp, TarWriter(fp, 0) as tar:
+    for member, reader in pipeline:
+        tar.add_stream(member.filename, reader, member.file_size)
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(after - before)
+"""
+
+# Builds the packages of the zip, and prints the peak RSS of the child
+# processes (dpkg-deb or xz; KiB on Linux)
+BUILD_PEAK_RSS_SCRIPT = """
+import sys, resource
+from pymontecarlo_debian.casino2.debbuilder import Casino2DebBuilder
+
+zip_path, outputdir, limit, streaming = sys.argv[1], sys.argv[2], int(sys.argv[3]), sys.argv[4]
+debbuilder = Casino2DebBuilder(zip_path, memory_budget=limit, split_data=True,
+                               streaming=streaming == 'streaming')
+debbuilder._exe_info = {'File version': '2.48', 'Link date': '10:30 AM 01/02/2015'}
+debbuilder.build(outputdir, arch='amd64')
+print(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+"""
+
+class TestMemoryBudget(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir)
+
+    def testunlimited(self):
+        budget = MemoryBudget()
+        self.assertEqual(BUFFER_SIZE, budget.chunk_size)
+        self.assertEqual(QUEUE_SIZE, budget.queue_size)
+        self.assertEqual(8, budget.get_extract_workers(8))
+        self.assertIsNone(budget.compressor_limit)
+        self.assertIsNone(budget.get_compressor_threads())
+
+    def testlimited(self):
+        budget = MemoryBudget(MIB)
+        self.assertEqual(8 * 1024, budget.chunk_size)
+        self.assertEqual(QUEUE_SIZE, budget.queue_size)
+        self.assertLessEqual(2 * budget.queue_size * budget.chunk_size, MIB // 2)
+        self.assertEqual(7, budget.get_extract_workers(16))
+        self.assertEqual(1, budget.get_extract_workers(1))
+        self.assertEqual(MIB // 2, budget.compressor_limit)
+        self.assertEqual(1, budget.get_compressor_threads())
+
+        budget = MemoryBudget(1024)
+        self.assertEqual(MIN_CHUNK_SIZE, budget.chunk_size)
+        self.assertEqual(1, budget.queue_size)
+        self.assertEqual(1, budget.get_extract_workers(16))
+
+        self.assertRaises(ValueError, MemoryBudget, 0)
+
+    def testsplit(self):
+        budget = MemoryBudget()
+        self.assertIs(budget, budget.split(3))
+
+        budget = MemoryBudget(32 * MIB).split(2)
+        self.assertEqual(16 * MIB, budget.limit)
+        self.assertEqual(8 * MIB, budget.compressor_limit)
+
+    def testcompressor_preset(self):
+        self.assertEqual(6, MemoryBudget().get_compressor_preset())
+        self.assertEqual(6, MemoryBudget(1024 * MIB).get_compressor_preset())
+        self.assertEqual(0, MemoryBudget(8 * MIB).get_compressor_preset())
+        self.assertEqual(1, MemoryBudget(8 * MIB).get_compressor_threads())
+
+    def testpeak_rss(self):
+        # The peak RSS must not depend on the size of the member
+        zip_path = os.path.join(self.tmpdir, 'a.zip')
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as z, \
+                z.open('a.dat', 'w', force_zip64=True) as fp:
+            chunk = b'\0' * MIB
+            for _ in range(256):
+                fp.write(chunk)
+
+        tar_path = os.path.join(self.tmpdir, 'a.tar.xz')
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        output = subprocess.check_output([sys.executable, '-c', PEAK_RSS_SCRIPT,
+                                          zip_path, tar_path, str(4 * MIB)], env=env)
+
+        self.assertLess(int(output) * 1024, 16 * MIB)
+
+    def testbuild_peak_rss(self):
+        # The compressors of all the packages must fit in the budget
+        zip_path = os.path.join(self.tmpdir, 'casino2.zip')
+        with zipfile.ZipFile(zip_path, 'w') as z:
+            z.writestr('wincasino2_64.exe', b'a' * 4000)
+            z.writestr('data/elements.dat', os.urandom(16 * MIB))
+
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        for streaming in ['staged', 'streaming']:
+            outputdir = tempfile.mkdtemp(dir=self.tmpdir)
+            output = subprocess.check_output([sys.executable, '-c', BUILD_PEAK_RSS_SCRIPT,
+                                              zip_path, outputdir, str(64 * MIB), streaming],
+                                             env=env)
+            self.assertLess(int(output) * 1024, 64 * MIB, streaming)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
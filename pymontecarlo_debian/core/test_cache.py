@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import glob
+import hashlib
+import tempfile
+import shutil
+import zipfile
+from unittest import mock
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.cache import ExtractionCache
+from pymontecarlo_debian.core.digest import PayloadManifest, hash_file
+from pymontecarlo_debian.core.extract import ZipExtractor
+
+# Globals and constants variables.
+
+def create_zip(filepath, contents):
+    with zipfile.ZipFile(filepath, 'w', zipfile.ZIP_DEFLATED) as z:
+        for name, content in sorted(contents.items()):
+            z.writestr(name, content)
+
+class TestExtractionCache(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = ExtractionCache(os.path.join(self.tmpdir, 'cache'), max_size=3000)
+
+        self.contents = {'program.exe': b'a' * 1000, 'data/b.dat': b'b' * 1000}
+        self.zip_path = os.path.join(self.tmpdir, 'a.zip')
+        create_zip(self.zip_path, self.contents)
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir)
+
+    def testopen(self):
+        with self.cache.open(self.zip_path) as tree:
+            self.assertEqual([], tree.errors)
+            self.assertEqual(sorted(self.contents), sorted(tree.members))
+
+        # Second build does not extract
+        with mock.patch.object(ZipExtractor, 'extract',
+                               side_effect=AssertionError('extracted again')), \
+                self.cache.open(self.zip_path) as tree:
+            manifest = PayloadManifest()
+            filepath = tree.link('data/b.dat',
+                                 os.path.join(self.tmpdir, 'stage', 'b.dat'),
+                                 manifest)
+
+        with open(filepath, 'rb') as fp:
+            self.assertEqual(self.contents['data/b.dat'], fp.read())
+        self.assertEqual(hashlib.md5(self.contents['data/b.dat']).hexdigest(),
+                         manifest.get(filepath).md5)
+
+    def testevict(self):
+        with self.cache.open(self.zip_path):
+            pass
+
+        other_zip_path = os.path.join(self.tmpdir, 'b.zip')
+        create_zip(other_zip_path, {'other.exe': b'c' * 2000})
+
+        # Entry in use is not evicted
+        with self.cache.open(self.zip_path), self.cache.open(other_zip_path):
+            pass
+        self.assertEqual(2, len(list(self.cache._iter_entries())))
+
+        # Least recently used entry is evicted
+        key = hash_file(self.zip_path)['sha256']
+        os.utime(os.path.join(self.cache.root, key, ExtractionCache.INDEX_FILENAME),
+                 (0, 0))
+        self.cache.evict()
+
+        entries = list(self.cache._iter_entries())
+        self.assertEqual(1, len(entries))
+        self.assertEqual(2000, entries[0][1])
+
+        # With its lock file
+        self.assertFalse(os.path.exists(os.path.join(self.cache.root, key + '.lock')))
+        self.assertEqual(1, len(glob.glob(os.path.join(self.cache.root, '*.lock'))))
+
+        # Extracted again
+        with self.cache.open(self.zip_path) as tree:
+            self.assertEqual(sorted(self.contents), sorted(tree.members))
+
+    def testopen_hash(self):
+        # The zip is hashed once, and not at all if its SHA-256 is given
+        sha256 = hash_file(self.zip_path)['sha256']
+        with mock.patch('pymontecarlo_debian.core.cache.hash_file',
+                        return_value={'sha256': sha256}) as mock_hash_file:
+            for _ in range(2):
+                with self.cache.open(self.zip_path):
+                    pass
+            self.assertEqual(1, mock_hash_file.call_count)
+
+            cache = ExtractionCache(self.cache.root)
+            with cache.open(self.zip_path, sha256=sha256.upper()) as tree:
+                self.assertEqual(sorted(self.contents), sorted(tree.members))
+            self.assertEqual(1, mock_hash_file.call_count)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import argparse
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.command import add_build_arguments, get_builder_kwargs
+
+# Globals and constants variables.
+
+class TestCommand(unittest.TestCase):
+
+    def testget_builder_kwargs(self):
+        parser = argparse.ArgumentParser()
+        parser.add_argument('filepath')
+        add_build_arguments(parser, split_doc=True)
+
+        args = parser.parse_args(['a.zip', '--memory-budget', '32', '--format', 'rpm',
+                                  '--split-doc'])
+        kwargs = get_builder_kwargs(args)
+
+        self.assertEqual(32 * 1024 * 1024, kwargs['memory_budget'])
+        self.assertEqual(['rpm'], kwargs['formats'])
+        self.assertTrue(kwargs['split_doc'])
+        self.assertNotIn('split_data', kwargs)
+        self.assertIsNone(kwargs['extraction_cache'])
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import re
+import hashlib
+import tempfile
+import shutil
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.download import \
+    ContentStore, Downloader, DownloadError
+
+# Globals and constants variables.
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the bytes in ``server.files`` and honours ``Range`` headers.
+    Each request is recorded in ``server.requests``.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_headers(self):
+        content = self.server.files.get(self.path)
+        if content is None:
+            self.send_error(404)
+            return None, None
+
+        start, end = 0, len(content)
+        match = re.match(r'bytes=(\d*)-(\d*)$', self.headers.get('Range', ''))
+        if match:
+            if match.group(1):
+                start = int(match.group(1))
+                if match.group(2):
+                    end = int(match.group(2)) + 1
+            else:
+                start = len(content) - int(match.group(2))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {0:d}-{1:d}/{2:d}'
+                             .format(start, end - 1, len(content)))
+        else:
+            self.send_response(200)
+
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start))
+        self.end_headers()
+        return content, (start, end)
+
+    def do_HEAD(self):
+        self.server.requests.append(('HEAD', self.path, None))
+        self._send_headers()
+
+    def do_GET(self):
+        content, byterange = self._send_headers()
+        self.server.requests.append(('GET', self.path, byterange))
+        if content is not None:
+            self.wfile.write(content[byterange[0]:byterange[1]])
+
+def start_server(files):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+    server.files = files
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+class TestDownloader(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.content = os.urandom(1000)
+        self.sha256 = hashlib.sha256(self.content).hexdigest()
+        self.server = start_server({'/CASINO_v2.51.zip': self.content})
+        self.url = 'http://127.0.0.1:%i/CASINO_v2.51.zip' % self.server.server_port
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = ContentStore(self.tmpdir)
+        self.downloader = Downloader(self.store, max_workers=3, chunk_size=128)
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
+
+    def testdownload(self):
+        filepath = self.downloader.download(self.url, size=1000,
+                                            checksums={'sha256': self.sha256})
+        self.assertEqual(self.store.get_path(self.sha256), filepath)
+        with open(filepath, 'rb') as fp:
+            self.assertEqual(self.content, fp.read())
+
+        ranges = [r[2] for r in self.server.requests if r[0] == 'GET']
+        self.assertEqual(8, len(ranges))
+
+    def testdownload_in_store(self):
+        self.downloader.download(self.url)
+        del self.server.requests[:]
+
+        self.downloader.download(self.url, checksums={'sha256': self.sha256})
+        self.assertEqual(0, len(self.server.requests))
+
+    def testdownload_resume(self):
+        filepath, state_filepath = self.downloader._get_partial_paths(self.url)
+        with open(filepath, 'wb') as fp:
+            fp.write(self.content[:256])
+        state = {'url': self.url, 'size': 1000, 'etag': None,
+                 'chunk_size': 128, 'done': [0, 1]}
+        self.downloader._write_state(state, state_filepath)
+
+        filepath = self.downloader.download(self.url, checksums={'sha256': self.sha256})
+        with open(filepath, 'rb') as fp:
+            self.assertEqual(self.content, fp.read())
+
+        ranges = [r[2] for r in self.server.requests if r[0] == 'GET']
+        self.assertEqual(6, len(ranges))
+        self.assertNotIn((0, 128), ranges)
+        self.assertNotIn((128, 256), ranges)
+
+    def testdownload_checksum_mismatch(self):
+        self.assertRaises(DownloadError, self.downloader.download,
+                          self.url, checksums={'md5': '0' * 32})
+        self.assertNotIn(self.sha256, self.store)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import errno
+import tempfile
+import shutil
+import zipfile
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.extract import ZipExtractor, UnsupportedMemberError
+
+# Globals and constants variables.
+
+class TestZipExtractor(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.zip_path = os.path.join(self.tmpdir, 'test.zip')
+
+        self.contents = dict(('data/file%i.dat' % i, os.urandom(1000) * (i + 1))
+                             for i in range(8))
+        with zipfile.ZipFile(self.zip_path, 'w', zipfile.ZIP_DEFLATED) as z:
+            for name, content in sorted(self.contents.items()):
+                z.writestr(name, content)
+            z.writestr('bad.dat', b'bad' * 10000)
+
+        # Corrupt the compressed data of the last member
+        with zipfile.ZipFile(self.zip_path, 'r') as z:
+            info = z.getinfo('bad.dat')
+        with open(self.zip_path, 'r+b') as fp:
+            fp.seek(info.header_offset + zipfile.sizeFileHeader +
+                    len(info.filename) + 10)
+            fp.write(b'\xff' * 16)
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir)
+
+    def testextract(self):
+        outputdir = os.path.join(self.tmpdir, 'output')
+        with zipfile.ZipFile(self.zip_path, 'r') as z:
+            targets = [(member, os.path.join(outputdir, member.filename))
+                       for member in z.infolist()]
+
+        errors = ZipExtractor(max_workers=3).extract(self.zip_path, targets)
+
+        self.assertEqual(1, len(errors))
+        self.assertEqual('bad.dat', errors[0].name)
+        self.assertFalse(os.path.exists(os.path.join(outputdir, 'bad.dat')))
+
+        for name, content in self.contents.items():
+            with open(os.path.join(outputdir, name), 'rb') as fp:
+                self.assertEqual(content, fp.read())
+
+    def testextract_target_error(self):
+        def _extract(z, member, filepath):
+            raise OSError(errno.ENOSPC, 'No space left on device')
+
+        with zipfile.ZipFile(self.zip_path, 'r') as z:
+            targets = [(member, os.path.join(self.tmpdir, member.filename))
+                       for member in z.infolist()]
+
+        extractor = ZipExtractor(max_workers=3)
+        self.assertRaises(OSError, extractor.extract, self.zip_path, targets, _extract)
+
+    def testextract_unsupported(self):
+        with zipfile.ZipFile(self.zip_path, 'r') as z:
+            members = [member for member in z.infolist() if member.filename != 'bad.dat']
+        members[0].flag_bits |= 0x1 # Encrypted
+        members[1].compress_type = 99 # AE-x encryption
+        targets = [(member, os.path.join(self.tmpdir, 'output', member.filename))
+                   for member in members]
+
+        errors = ZipExtractor(max_workers=3).extract(self.zip_path, targets)
+
+        self.assertEqual(sorted(member.filename for member in members[:2]),
+                         [error.name for error in errors])
+        for error in errors:
+            self.assertIsInstance(error.error, UnsupportedMemberError)
+
+    def testextract_bug(self):
+        # Only the errors of the members are reported
+        def _extract(z, member, filepath):
+            raise RuntimeError('bug')
+
+        with zipfile.ZipFile(self.zip_path, 'r') as z:
+            targets = [(member, os.path.join(self.tmpdir, member.filename))
+                       for member in z.infolist()]
+
+        extractor = ZipExtractor(max_workers=3)
+        self.assertRaises(RuntimeError, extractor.extract, self.zip_path, targets, _extract)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import json
+import shutil
+import tarfile
+import tempfile
+import subprocess
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.formats import \
+    convert_relations, TarZstFormat, OciFormat, RpmFormat
+
+# Globals and constants variables.
+CONTROL = {'Package': 'foo',
+           'Version': '1.2-1',
+           'Architecture': 'amd64',
+           'Depends': 'wine, bar (>= 2.0) | baz',
+           'Maintainer': 'John Doe <john@example.com>',
+           'Homepage': 'http://example.com',
+           'Description': 'Foo program\n Does foo.\n .\n With 100% bar.'}
+
+class TestFormats(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+
+        self.root = os.path.join(self.tmpdir, 'root')
+        for dirpath in ['DEBIAN', 'usr/bin', 'usr/share/foo/My Data', 'usr/share/doc/foo']:
+            os.makedirs(os.path.join(self.root, dirpath))
+        for path in ['DEBIAN/control', 'usr/bin/foo', 'usr/share/foo/My Data/a.dat',
+                     'usr/share/doc/foo/copyright']:
+            with open(os.path.join(self.root, path), 'w') as fp:
+                fp.write(path)
+
+        self.outputdir = os.path.join(self.tmpdir, 'output')
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir)
+
+    def testconvert_relations(self):
+        self.assertEqual(['wine', '(bar >= 2.0 or baz)', 'qux < 3'],
+                         convert_relations('wine, bar (>= 2.0) | baz, qux:any (<< 3)'))
+        self.assertEqual([], convert_relations(''))
+
+    @unittest.skipIf(shutil.which('zstd') is None, 'zstd is not installed')
+    def testtarzst(self):
+        filepath = TarZstFormat(self.outputdir).write(self.root, CONTROL, 'Custom', 0)
+        self.assertEqual('foo_1.2-1_amd64.tar.zst', os.path.basename(filepath))
+
+        content = subprocess.check_output(['zstd', '-dc', filepath])
+        tar_path = os.path.join(self.tmpdir, 'a.tar')
+        with open(tar_path, 'wb') as fp:
+            fp.write(content)
+        with tarfile.open(tar_path) as tar:
+            names = tar.getnames()
+        self.assertIn('./usr/share/foo/My Data/a.dat', names)
+        self.assertNotIn('./DEBIAN/control', names)
+        self.assertEqual(['foo_1.2-1_amd64.tar.zst'], os.listdir(self.outputdir))
+
+    def testoci(self):
+        filepath = OciFormat(self.outputdir).write(self.root, CONTROL, 'Custom', 0)
+        self.assertEqual('foo_1.2-1_amd64.oci.tar', os.path.basename(filepath))
+
+        layout_dir = os.path.join(self.tmpdir, 'layout')
+        with tarfile.open(filepath) as tar:
+            tar.extractall(layout_dir)
+
+        def _read_blob(descriptor):
+            algorithm, digest = descriptor['digest'].split(':')
+            blob_path = os.path.join(layout_dir, 'blobs', algorithm, digest)
+            self.assertEqual(descriptor['size'], os.path.getsize(blob_path))
+            return blob_path
+
+        with open(os.path.join(layout_dir, 'index.json')) as fp:
+            index = json.load(fp)
+        with open(_read_blob(index['manifests'][0])) as fp:
+            manifest = json.load(fp)
+        with open(_read_blob(manifest['config'])) as fp:
+            config = json.load(fp)
+
+        labels = config['config']['Labels']
+        self.assertEqual('foo', labels['org.opencontainers.image.title'])
+        self.assertEqual('LicenseRef-Custom', labels['org.opencontainers.image.licenses'])
+        self.assertEqual('amd64', config['architecture'])
+
+        with tarfile.open(_read_blob(manifest['layers'][0])) as tar:
+            self.assertIn('./usr/bin/foo', tar.getnames())
+
+    def testoci_all(self):
+        # An image for each architecture, with the same layer
+        control = dict(CONTROL, Architecture='all')
+        filepath = OciFormat(self.outputdir).write(self.root, control, 'Custom', 0)
+        self.assertEqual('foo_1.2-1_all.oci.tar', os.path.basename(filepath))
+
+        with tarfile.open(filepath) as tar:
+            def _read_json(path):
+                return json.load(tar.extractfile(path))
+
+            index = _read_json('./index.json')
+            architectures = []
+            layers = set()
+            for descriptor in index['manifests']:
+                manifest = _read_json('./blobs/sha256/' + descriptor['digest'].split(':')[1])
+                config = _read_json('./blobs/sha256/' +
+                                    manifest['config']['digest'].split(':')[1])
+                self.assertEqual(descriptor['platform']['architecture'], config['architecture'])
+                architectures.append(config['architecture'])
+                layers.add(manifest['layers'][0]['digest'])
+
+        self.assertEqual(['amd64', '386'], architectures)
+        self.assertEqual(1, len(layers))
+
+    def testrpm_spec(self):
+        lines = RpmFormat(self.outputdir).create_spec(self.root, CONTROL, 'Custom')
+
+        self.assertIn('Version: 1.2', lines)
+        self.assertIn('Release: 1', lines)
+        self.assertIn('BuildArch: x86_64', lines)
+        self.assertIn('Requires: (bar >= 2.0 or baz)', lines)
+        self.assertIn('Does foo.\n\nWith 100%% bar.', lines)
+        self.assertIn('"/usr/bin/foo"', lines)
+        self.assertIn('%dir "/usr/share/foo/My Data"', lines)
+        self.assertIn('%dir "/usr/share/doc/foo"', lines)
+        self.assertNotIn('%dir "/usr/share/doc"', lines)
+        self.assertNotIn('%dir "/usr/bin"', lines)
+        self.assertEqual('foo-1.2-1.x86_64.rpm', RpmFormat(self.outputdir).get_filename(CONTROL))
+
+    def testrpm_spec_scriptlets(self):
+        with open(os.path.join(self.root, 'DEBIAN', 'postrm'), 'w') as fp:
+            fp.write('#!/bin/sh\nset -e\nif [ "$1" = "purge" ] ; then\n  date +%s\nfi\nexit 0')
+
+        lines = RpmFormat(self.outputdir).create_spec(self.root, CONTROL, 'Custom')
+
+        index = lines.index('%postun')
+        self.assertEqual('if [ "$1" -eq 0 ] ; then set -- purge ; else set -- upgrade ; fi',
+                         lines[index + 1])
+        self.assertEqual(['set -e', 'if [ "$1" = "purge" ] ; then', '  date +%%s', 'fi', 'exit 0'],
+                         lines[index + 2:index + 7])
+        self.assertNotIn('#!/bin/sh', lines)
+        self.assertNotIn('%post', lines)
+
+    def testrpm_spec_scriptlet_arguments(self):
+        # $1 of rpm (number of installed instances) -> argument of dpkg
+        expected = {('preinst', '%pre'): {1: 'install', 2: 'upgrade'},
+                    ('postinst', '%post'): {1: 'configure', 2: 'configure'},
+                    ('prerm', '%preun'): {0: 'remove', 1: 'upgrade'},
+                    ('postrm', '%postun'): {0: 'purge', 1: 'upgrade'}}
+        for name, _section in expected:
+            with open(os.path.join(self.root, 'DEBIAN', name), 'w') as fp:
+                fp.write('#!/bin/sh\nset -e\necho "%s $1"\nexit 0' % name)
+
+        lines = RpmFormat(self.outputdir).create_spec(self.root, CONTROL, 'Custom')
+
+        for (name, section), arguments in expected.items():
+            index = lines.index(section)
+            body = '\n'.join(lines[index + 1:lines.index('', index)])
+            for count, argument in arguments.items():
+                output = subprocess.check_output(['sh', '-c', body, section, str(count)])
+                self.assertEqual('%s %s\n' % (name, argument), output.decode('ascii'))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+
+# Third party modules.
+from debian.deb822 import Deb822
+
+# Local modules.
+from pymontecarlo_debian.core.lint import \
+    Linter, LintFinding, CONTROL, DESKTOP_ENTRY, MAN_PAGE, SCRIPT, ERROR, WARNING
+from pymontecarlo_debian.core.desktopentry import DesktopEntry
+from pymontecarlo_debian.core.manpage import ManPage
+
+# Globals and constants variables.
+
+class TestLinter(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.linter = Linter('foo')
+
+        self.control = Deb822()
+        self.control.update([('Package', 'foo'),
+                             ('Version', '2.51-1'),
+                             ('Architecture', 'all'),
+                             ('Maintainer', 'John Doe <john@example.com>'),
+                             ('Installed-Size', '12'),
+                             ('Description', 'Foo\n Foo program.')])
+
+    def _check(self, kind, obj, path='a'):
+        return [(finding.rule, finding.message)
+                for finding in self.linter.check(kind, obj, path)]
+
+    def testcheck_control(self):
+        self.assertEqual([], self._check(CONTROL, self.control))
+
+        del self.control['Installed-Size']
+        self.control['Recommends'] = ''
+        self.control['Version'] = '2.4.-1'
+        findings = self._check(CONTROL, self.control)
+        self.assertIn(('control-field-missing', 'Missing field Installed-Size'), findings)
+        self.assertIn(('control-field-empty', 'Empty field Recommends'), findings)
+        self.assertIn(('version', 'Upstream version 2.4. ends with a separator'), findings)
+
+        self.control['Version'] = '2.51'
+        self.assertIn(('version', 'Version 2.51 without Debian revision'),
+                      self._check(CONTROL, self.control))
+
+    def testcheck_desktop_entry(self):
+        entry = DesktopEntry(DesktopEntry.TYPE_APPLICATION, 'MC Demo',
+                             exec_='/usr/bin/mcdemo', categories=['Science'])
+        self.assertEqual([], self._check(DESKTOP_ENTRY, entry, 'mcdemo.desktop'))
+
+        entry = DesktopEntry(DesktopEntry.TYPE_APPLICATION, 'MC Demo',
+                             exec_='/usr/bin/mclib')
+        findings = self.linter.check(DESKTOP_ENTRY, entry, 'mclib.desktop')
+        self.assertIn(LintFinding(ERROR, 'desktop-entry-duplicate-name', 'foo',
+                                  'mclib.desktop', 'Same Name as mcdemo.desktop'), findings)
+        self.assertIn(LintFinding(WARNING, 'desktop-entry-categories', 'foo',
+                                  'mclib.desktop', 'Application without Categories'), findings)
+
+        # Same name in another package
+        entry = DesktopEntry(DesktopEntry.TYPE_APPLICATION, 'MC Demo',
+                             exec_='/usr/bin/mcdemo', categories=['Science'])
+        self.assertEqual([], self.linter.check(DESKTOP_ENTRY, entry, 'mcdemo.desktop', 'bar'))
+
+    def testcheck_man_page(self):
+        manpage = ManPage('foo', 'foo', 'Foo program')
+        self.assertEqual([], self._check(MAN_PAGE, manpage))
+
+        manpage = ManPage('foo', 'foo', long_description='Foö')
+        findings = self._check(MAN_PAGE, manpage)
+        self.assertIn(('man-page-description', 'Empty NAME section'), findings)
+        self.assertIn(('man-page-ascii', 'Non-ASCII characters in long_description'), findings)
+
+    def testcheck_script(self):
+        lines = ['#!/bin/sh', '# Passes $@', 'exec wine foo.exe "$@"']
+        self.assertEqual([], self._check(SCRIPT, lines))
+
+        lines = ['cd /usr/share/foo', 'exec wine foo.exe $@ ${*}']
+        findings = self._check(SCRIPT, lines)
+        self.assertIn(('script-interpreter', 'Missing interpreter line'), findings)
+        self.assertIn(('script-unquoted-arguments', 'Line 2: arguments not passed as "$@"'),
+                      findings)
+
+        self.assertEqual(len(self.linter.errors), 2)
+        self.assertEqual(len(self.linter.findings), 2)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
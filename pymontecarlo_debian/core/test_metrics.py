@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.metrics import Registry
+
+# Globals and constants variables.
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.registry = Registry()
+        self.counter = self.registry.counter('builds_total', 'Builds', ('program',))
+        self.histogram = self.registry.histogram('phase_seconds', 'Phases',
+                                                 ('phase',), buckets=(1.0, 10.0))
+
+    def testdisabled(self):
+        self.counter.inc(program='casino2')
+        with self.histogram.time(phase='extract'):
+            pass
+        self.assertEqual(0, self.counter.get(program='casino2'))
+        self.assertEqual(0, self.histogram.get_count(phase='extract'))
+
+    def testrender(self):
+        self.registry.enabled = True
+        self.assertIs(self.counter, self.registry.counter('builds_total', 'Builds'))
+
+        self.counter.inc(program='casino2')
+        self.counter.inc(2, program='casino2')
+        self.histogram.observe(0.5, phase='extract')
+        self.histogram.observe(20.0, phase='extract')
+
+        text = self.registry.render()
+        self.assertIn('# TYPE builds_total counter\n', text)
+        self.assertIn('builds_total{program="casino2"} 3\n', text)
+        self.assertIn('# TYPE phase_seconds histogram\n', text)
+        self.assertIn('phase_seconds_bucket{phase="extract",le="1.0"} 1\n', text)
+        self.assertIn('phase_seconds_bucket{phase="extract",le="10.0"} 1\n', text)
+        self.assertIn('phase_seconds_bucket{phase="extract",le="+Inf"} 2\n', text)
+        self.assertIn('phase_seconds_sum{phase="extract"} 20.5\n', text)
+        self.assertIn('phase_seconds_count{phase="extract"} 2\n', text)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
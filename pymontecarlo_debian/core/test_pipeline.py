@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import hashlib
+import tempfile
+import shutil
+import zipfile
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.pipeline import MemberPipeline
+
+# Globals and constants variables.
+
+class TestMemberPipeline(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.contents = {'a.dat': os.urandom(100000), 'b.dat': b'b' * 10, 'c.dat': b''}
+        self.zip_path = os.path.join(self.tmpdir, 'a.zip')
+        with zipfile.ZipFile(self.zip_path, 'w', zipfile.ZIP_DEFLATED) as z:
+            for name, content in sorted(self.contents.items()):
+                z.writestr(name, content)
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir)
+
+    def testiter(self):
+        with zipfile.ZipFile(self.zip_path, 'r') as z:
+            members = z.infolist()
+
+        with MemberPipeline(self.zip_path, members, queue_size=2, chunk_size=1000) as pipeline:
+            for member, reader in pipeline:
+                data = reader.read(member.file_size)
+                self.assertEqual(self.contents[member.filename], data)
+
+        for name, content in self.contents.items():
+            md5, sha256 = pipeline.digests[name]
+            self.assertEqual(hashlib.md5(content).hexdigest(), md5)
+            self.assertEqual(hashlib.sha256(content).hexdigest(), sha256)
+
+    def testexit(self):
+        with zipfile.ZipFile(self.zip_path, 'r') as z:
+            members = z.infolist()
+
+        # Read entirely: the threads stop on their own
+        with MemberPipeline(self.zip_path, members) as pipeline:
+            for member, reader in pipeline:
+                reader.read()
+            for thread in pipeline._threads:
+                thread.join(5)
+                self.assertFalse(thread.is_alive())
+
+        # Left early, with full queues
+        with MemberPipeline(self.zip_path, members, queue_size=1, chunk_size=10) as pipeline:
+            for member, reader in pipeline:
+                reader.read(10)
+                break
+        for thread in pipeline._threads:
+            self.assertFalse(thread.is_alive())
+
+    def testiter_corrupted(self):
+        with zipfile.ZipFile(self.zip_path, 'w', zipfile.ZIP_STORED) as z:
+            z.writestr('a.dat', self.contents['a.dat'])
+            member = z.getinfo('a.dat')
+
+        with open(self.zip_path, 'r+b') as fp:
+            fp.seek(member.header_offset + 30 + len(member.filename) + 100)
+            fp.write(b'\0' * 100)
+
+        with self.assertRaises(zipfile.BadZipFile), \
+                MemberPipeline(self.zip_path, [member]) as pipeline:
+            for member, reader in pipeline:
+                reader.read()
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os.path
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.plugins import get_entry_points, load_reference
+from pymontecarlo_debian.cli import COMMANDS, ENTRY_POINT_GROUP
+
+# Globals and constants variables.
+
+class Testplugins(unittest.TestCase):
+
+    def testget_entry_points(self):
+        references = get_entry_points(ENTRY_POINT_GROUP, COMMANDS)
+        self.assertEqual(set(COMMANDS), set(references) & set(COMMANDS))
+
+        references = get_entry_points('pymontecarlo_debian.unknown', {'a': 'os:sep'})
+        self.assertEqual({'a': 'os:sep'}, references)
+
+    def testload_reference(self):
+        self.assertIs(os.path.join, load_reference('os.path:join'))
+        self.assertIs(os.path, load_reference('os:path'))
+
+        for reference in COMMANDS.values():
+            self.assertTrue(callable(load_reference(reference)))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
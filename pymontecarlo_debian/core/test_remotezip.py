@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import io
+import zipfile
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.remotezip import RemoteZipFile
+from pymontecarlo_debian.core.test_download import start_server
+
+# Globals and constants variables.
+
+class TestRemoteZipFile(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.exe = os.urandom(100000)
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr('casino/data.bin', os.urandom(2000000))
+            z.writestr('casino/wincasino2.exe', self.exe)
+            z.writestr('casino/readme.txt', b'readme')
+        self.content = buf.getvalue()
+
+        self.server = start_server({'/CASINO_v2.51.zip': self.content})
+        self.url = 'http://127.0.0.1:%i/CASINO_v2.51.zip' % self.server.server_port
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def testread(self):
+        with RemoteZipFile(self.url, block_size=4096) as z:
+            self.assertEqual(3, len(z.namelist()))
+            self.assertEqual(self.exe, z.read('casino/wincasino2.exe'))
+            self.assertEqual(b'readme', z.read('casino/readme.txt'))
+
+            self.assertLess(z.rangefile.bytes_fetched, 200000)
+            self.assertLessEqual(z.rangefile.request_count, 4)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import gzip
+import lzma
+import hashlib
+import tempfile
+import shutil
+import subprocess
+from unittest import mock
+
+# Third party modules.
+from debian.deb822 import Deb822
+
+# Local modules.
+from pymontecarlo_debian.core.repository import Repository, PackageRecord
+
+# Globals and constants variables.
+
+def create_deb(outputdir, package, version='1.0-1', architecture='all'):
+    temp_dir = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(temp_dir, 'DEBIAN'))
+        os.makedirs(os.path.join(temp_dir, 'usr', 'share', package))
+        with open(os.path.join(temp_dir, 'usr', 'share', package, 'data'), 'w') as fp:
+            fp.write(package)
+
+        control = Deb822({'Package': package,
+                          'Version': version,
+                          'Architecture': architecture,
+                          'Maintainer': 'John Doe <john@doe.com>',
+                          'Description': 'Test package\n Long description'})
+        with open(os.path.join(temp_dir, 'DEBIAN', 'control'), 'wb') as fp:
+            control.dump(fp)
+
+        filepath = os.path.join(outputdir, '{0}_{1}_{2}.deb'
+                                .format(package, version, architecture))
+        subprocess.check_call(['dpkg-deb', '--root-owner-group', '--build',
+                               temp_dir, filepath], stdout=subprocess.DEVNULL)
+        return PackageRecord.from_built(filepath, control)
+    finally:
+        shutil.rmtree(temp_dir)
+
+class TestRepository(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.record = create_deb(self.tmpdir, 'casino2', architecture='amd64')
+        create_deb(self.tmpdir, 'mcxray-lite')
+
+        self.repository = Repository(self.tmpdir)
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir)
+
+    def testwrite_index(self):
+        self.repository.publish(self.record)
+
+        with open(os.path.join(self.tmpdir, 'Packages'), 'rb') as fp:
+            packages = fp.read()
+        stanzas = list(Deb822.iter_paragraphs(packages))
+        self.assertEqual(2, len(stanzas))
+        self.assertEqual('casino2', stanzas[0]['Package'])
+        self.assertEqual('amd64', stanzas[0]['Architecture'])
+        self.assertEqual(self.record.hashes['sha256'], stanzas[0]['SHA256'])
+        self.assertEqual('mcxray-lite', stanzas[1]['Package'])
+        self.assertEqual('mcxray-lite_1.0-1_all.deb', stanzas[1]['Filename'])
+
+        with gzip.open(os.path.join(self.tmpdir, 'Packages.gz'), 'rb') as fp:
+            self.assertEqual(packages, fp.read())
+        with lzma.open(os.path.join(self.tmpdir, 'Packages.xz'), 'rb') as fp:
+            self.assertEqual(packages, fp.read())
+
+        with open(os.path.join(self.tmpdir, 'Release'), 'r') as fp:
+            release = fp.read()
+        self.assertIn('Architectures: all amd64', release)
+        line = ' {0} {1:d} Packages\n'.format(hashlib.sha256(packages).hexdigest(),
+                                                len(packages))
+        self.assertIn(line, release)
+
+    def testscan_removed(self):
+        self.repository.publish(self.record)
+        os.remove(self.record.filepath)
+        self.repository.scan()
+        self.assertNotIn(self.record.filepath, self.repository)
+        self.assertEqual(1, len(list(self.repository)))
+
+    def testpublish_incremental(self):
+        self.repository.publish(self.record)
+
+        record = create_deb(self.tmpdir, 'winxray')
+        repository = Repository(self.tmpdir)
+        with mock.patch.object(PackageRecord, 'from_file',
+                               side_effect=AssertionError('package re-read')):
+            repository.publish(record)
+
+        records = list(repository)
+        self.assertEqual(3, len(records))
+        self.assertEqual(self.record.hashes, records[0].hashes)
+        self.assertEqual('amd64', records[0].architecture)
+
+        with open(os.path.join(self.tmpdir, 'Packages'), 'rb') as fp:
+            stanzas = list(Deb822.iter_paragraphs(fp))
+        self.assertEqual(['casino2', 'mcxray-lite', 'winxray'],
+                         [stanza['Package'] for stanza in stanzas])
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
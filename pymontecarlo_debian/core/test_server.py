@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import io
+import tempfile
+import shutil
+import threading
+import zipfile
+from unittest import mock
+
+# Third party modules.
+import requests
+
+# Local modules.
+from pymontecarlo_debian.core.server import BuildService, BuildError, create_server
+from pymontecarlo_debian.core.test_repository import create_deb
+from pymontecarlo_debian.core.digest import hash_file
+
+# Globals and constants variables.
+
+class FakeDebBuilder(object):
+
+    event = threading.Event()
+    count = 0
+    kwargs = {}
+
+    def __init__(self, zip_path, extraction_cache=None, **kwargs):
+        self.zip_path = zip_path
+        self.extraction_errors = []
+        FakeDebBuilder.kwargs = kwargs
+
+    def build(self, outputdir, arch='all'):
+        FakeDebBuilder.count += 1
+        self.event.wait(10)
+        return [create_deb(outputdir, 'fake', architecture=arch)]
+
+BUILDERS = {'fake': 'pymontecarlo_debian.core.test_server:FakeDebBuilder'}
+
+@mock.patch.dict('pymontecarlo_debian.core.server.BUILDERS', BUILDERS)
+class TestBuildService(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.zipdir = os.path.join(self.tmpdir, 'zips')
+        os.makedirs(self.zipdir)
+        self.service = BuildService(os.path.join(self.tmpdir, 'output'),
+                                    os.path.join(self.tmpdir, 'work'), zipdir=self.zipdir)
+
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w') as z:
+            z.writestr('fake.exe', b'fake')
+        self.content = buf.getvalue()
+
+        FakeDebBuilder.event.set()
+        FakeDebBuilder.count = 0
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        FakeDebBuilder.event.set()
+        self.service.shutdown()
+        shutil.rmtree(self.tmpdir)
+
+    def testsubmit_coalesce(self):
+        sha256 = self.service.add_zip_stream(io.BytesIO(self.content), len(self.content))
+
+        FakeDebBuilder.event.clear()
+        future = self.service.submit('fake', sha256, 'amd64')
+        self.assertIs(future, self.service.submit('fake', sha256, 'amd64'))
+        FakeDebBuilder.event.set()
+
+        records, errors = future.result()
+        self.assertEqual(1, FakeDebBuilder.count)
+        self.assertEqual([], errors)
+        self.assertEqual(os.path.join(self.service.outputdir, 'fake_1.0-1_amd64.deb'),
+                         records[0].filepath)
+        self.assertTrue(os.path.exists(records[0].filepath))
+        self.assertEqual(self.service.outputdir, FakeDebBuilder.kwargs['built_dir'])
+
+        self.assertRaises(BuildError, self.service.submit, 'unknown', sha256)
+        self.assertRaises(BuildError, self.service.submit, 'fake', '0' * 64)
+
+    def testadd_zip(self):
+        zip_path = os.path.join(self.tmpdir, 'fake.zip')
+        with open(zip_path, 'wb') as fp:
+            fp.write(self.content)
+        os.chmod(zip_path, 0o644)
+
+        sha256 = self.service.add_zip(zip_path)
+        self.assertEqual(sha256, self.service.add_zip(zip_path, sha256.upper()))
+
+        # The file of the caller is copied, not linked
+        st = os.stat(zip_path)
+        self.assertEqual(0o644, st.st_mode & 0o777)
+        self.assertEqual(1, st.st_nlink)
+        with open(zip_path, 'wb') as fp:
+            fp.write(b'changed')
+        self.assertEqual(sha256, hash_file(self.service.store.get_path(sha256))['sha256'])
+
+        self.assertRaises(BuildError, self.service.add_zip, zip_path, sha256)
+        self.assertEqual([], os.listdir(self.service.store.partial_dir))
+
+    def testhttp(self):
+        server = create_server(self.service, port=0)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            url = 'http://127.0.0.1:%i' % server.server_port
+            r = requests.post(url + '/builds?program=fake&arch=i386', data=self.content,
+                              headers={'Content-Type': 'application/zip'})
+            self.assertEqual(200, r.status_code)
+            package, = r.json()['packages']
+            self.assertEqual('fake_1.0-1_i386.deb', package['filename'])
+
+            r = requests.get(url + package['url'])
+            self.assertEqual(200, r.status_code)
+            with open(package['path'], 'rb') as fp:
+                self.assertEqual(fp.read(), r.content)
+
+            zip_path = os.path.join(self.zipdir, 'fake.zip')
+            with open(zip_path, 'wb') as fp:
+                fp.write(self.content)
+            for location in [zip_path, 'fake.zip']:
+                r = requests.post(url + '/builds', json={'program': 'fake', 'zip': location,
+                                                         'split_data': 'yes'})
+                self.assertEqual(200, r.status_code)
+
+            # Bad requests
+            outside_path = os.path.join(self.tmpdir, 'outside.zip')
+            shutil.copy(zip_path, outside_path)
+            for body in [{'program': 'fake', 'zip': zip_path, 'unknown': 1},
+                         {'program': 'fake', 'zip': zip_path, 'memory_budget': 'abc'},
+                         {'program': 'fake', 'zip': zip_path, 'wineserver_timeout': [1]},
+                         {'program': ['fake'], 'zip': zip_path},
+                         {'program': 'fake', 'zip': outside_path},
+                         {'program': 'fake', 'zip': '../outside.zip'},
+                         {'program': 'fake', 'zip': 'missing.zip'},
+                         ['fake', zip_path]]:
+                r = requests.post(url + '/builds', json=body)
+                self.assertEqual(400, r.status_code, body)
+                self.assertIn('error', r.json())
+
+            with mock.patch.object(self.service.downloader, 'download',
+                                   side_effect=requests.ConnectionError('refused')):
+                r = requests.post(url + '/builds', json={'program': 'fake',
+                                                         'zip': 'http://example.com/a.zip'})
+            self.assertEqual(502, r.status_code)
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import io
+import time
+import threading
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.stages import StageGraph
+
+# Globals and constants variables.
+
+class TestStageGraph(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.calls = []
+        self.graph = StageGraph()
+
+    def _create_func(self, name, duration=0.0):
+        def _func():
+            time.sleep(duration)
+            self.calls.append(name)
+        return _func
+
+    def testrun(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        # a and b only run concurrently
+        self.graph.add('a', barrier.wait, outputs=['x'])
+        self.graph.add('b', barrier.wait, outputs=['y'])
+        self.graph.add('c', self._create_func('c', 0.1), inputs=['x'], outputs=['z'])
+        self.graph.add('d', self._create_func('d'), inputs=['x', 'y', 'z'])
+
+        report = self.graph.run(max_workers=4)
+
+        self.assertEqual(['c', 'd'], self.calls)
+        self.assertEqual(['a', 'c', 'd'], report.critical_path)
+        self.assertGreaterEqual(report.get_duration('c'), 0.1)
+
+        buf = io.StringIO()
+        report.write(buf)
+        self.assertIn('Critical path', buf.getvalue())
+
+    def testrun_error(self):
+        def _fail():
+            raise RuntimeError('failed')
+
+        self.graph.add('a', _fail, outputs=['x'])
+        self.graph.add('b', self._create_func('b'), inputs=['x'])
+
+        self.assertRaises(RuntimeError, self.graph.run)
+        self.assertEqual([], self.calls)
+
+    def testrun_invalid(self):
+        self.graph.add('a', self._create_func('a'), inputs=['y'], outputs=['x'])
+        self.assertRaises(ValueError, self.graph.run)
+
+        self.graph.add('b', self._create_func('b'), inputs=['x'], outputs=['y'])
+        self.assertRaises(ValueError, self.graph.run)
+        self.assertRaises(ValueError, self.graph.add, 'a', self._create_func('a'))
+        self.assertEqual([], self.calls)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import tempfile
+import shutil
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.staging import StagingManager
+
+# Globals and constants variables.
+
+class TestStagingManager(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.staging = StagingManager(self.tmpdir, max_spare=1, keep_failed=True)
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        self.staging.close()
+        shutil.rmtree(self.tmpdir)
+
+    def _create_tree(self):
+        path = self.staging.create()
+        os.makedirs(os.path.join(path, 'usr', 'share'))
+        with open(os.path.join(path, 'usr', 'share', 'a.txt'), 'w') as fp:
+            fp.write('a')
+        return path
+
+    def testrelease(self):
+        path = self._create_tree()
+        self.staging.release(path)
+        self.assertFalse(os.path.exists(path))
+
+        self.staging.wait()
+        trash_dir = self.staging._trash_dir
+        self.assertEqual([], os.listdir(trash_dir))
+
+        # Spare directory is recycled
+        self.assertEqual(1, len(self.staging._spares))
+        spare = self.staging._spares[0]
+        self.assertEqual(spare, self.staging.create())
+        self.assertEqual([], os.listdir(spare))
+
+        self.staging.close()
+        self.assertFalse(os.path.exists(trash_dir))
+
+    def testrelease_failed(self):
+        path = self._create_tree()
+        self.staging.release(path, failed=True)
+        self.staging.wait()
+
+        self.assertEqual([path], self.staging.kept)
+        self.assertTrue(os.path.exists(os.path.join(path, 'usr', 'share', 'a.txt')))
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import hashlib
+import tempfile
+import shutil
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.debfile import \
+    TarWriter, open_xz, write_deb, read_control_member
+from pymontecarlo_debian.core.formats import open_zstd
+from pymontecarlo_debian.core.digest import hash_file
+from pymontecarlo_debian.core.verify import verify_deb, VerificationError
+
+# Globals and constants variables.
+CONTROL = """Package: foo
+Version: 1.0-1
+Architecture: all
+Maintainer: John Doe <john@example.com>
+Description: Foo
+ Foo program.
+"""
+
+class TestVerify(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmpdir, 'root')
+
+        self.files = {'usr/bin/foo': b'#!/bin/sh\n',
+                      'usr/share/man/man1/foo.1.gz': b'man',
+                      'usr/share/applications/foo.desktop': b'[Desktop Entry]\nExec=foo\n',
+                      'usr/share/doc/foo/copyright': b'copyright',
+                      'usr/share/doc/foo/changelog.Debian.gz': b'changelog'}
+        for path, content in self.files.items():
+            self._write(path, content)
+
+        self._write('DEBIAN/control', CONTROL.encode('ascii'))
+        self._write('DEBIAN/postinst', b'#!/bin/sh\nexit 0\n', 0o555)
+        self._write_md5sums(self.files)
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, path, content, mode=0o644):
+        filepath = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, 'wb') as fp:
+            fp.write(content)
+        os.chmod(filepath, mode)
+
+    def _write_md5sums(self, files):
+        lines = ['%s  %s\n' % (hashlib.md5(content).hexdigest(), path)
+                 for path, content in sorted(files.items())]
+        self._write('DEBIAN/md5sums', ''.join(lines).encode('ascii'))
+
+    def _build(self, open_compressor=open_xz, extension='xz'):
+        control_tar_path = os.path.join(self.tmpdir, 'control.tar.' + extension)
+        with open_compressor(control_tar_path) as fp, TarWriter(fp, 0) as tar:
+            tar.add_tree(os.path.join(self.root, 'DEBIAN'))
+
+        shutil.move(os.path.join(self.root, 'DEBIAN'), self.tmpdir)
+        data_tar_path = os.path.join(self.tmpdir, 'data.tar.' + extension)
+        with open_compressor(data_tar_path) as fp, TarWriter(fp, 0) as tar:
+            tar.add_tree(self.root)
+
+        filepath = os.path.join(self.tmpdir, 'foo_1.0-1_all.deb')
+        self.written = write_deb(filepath, control_tar_path, data_tar_path, 0,
+                                 ('md5', 'sha256'))
+        return filepath
+
+    def testverify_deb(self):
+        filepath = self._build()
+        self.assertEqual([], verify_deb(filepath))
+        self.assertEqual([], verify_deb(filepath, check_md5sums=False))
+
+        # Hashed while written
+        size, hashes = self.written
+        self.assertEqual(os.path.getsize(filepath), size)
+        self.assertEqual(hash_file(filepath, ('md5', 'sha256')), hashes)
+
+    @unittest.skipIf(shutil.which('zstd') is None, 'zstd is not installed')
+    def testverify_deb_zstd(self):
+        filepath = self._build(open_zstd, 'zst')
+        self.assertEqual([], verify_deb(filepath))
+
+        md5sums = read_control_member(filepath, 'md5sums')
+        self.assertIn(b'usr/bin/foo', md5sums)
+
+    def testverify_deb_errors(self):
+        self._write('DEBIAN/postinst', b'exit 0\n', 0o644)
+        self._write('usr/bin/bar', b'bar')
+        self._write('usr/share/doc/foo/copyright', b'modified')
+        os.remove(os.path.join(self.root, 'usr/share/doc/foo/changelog.Debian.gz'))
+
+        errors = verify_deb(self._build())
+
+        self.assertIn(VerificationError('DEBIAN/postinst', 'Missing interpreter line'), errors)
+        self.assertIn(VerificationError('DEBIAN/postinst', 'Mode 0644 instead of 0555 or 0755'), errors)
+        self.assertIn(VerificationError('usr/bin/bar', 'Missing from md5sums'), errors)
+        self.assertIn(VerificationError('usr/bin/bar', 'Program without man page'), errors)
+        self.assertIn(VerificationError('usr/share/doc/foo/copyright', 'MD5 differs from md5sums'), errors)
+        self.assertIn(VerificationError('usr/share/doc/foo/changelog.Debian.gz', 'Missing'), errors)
+        self.assertIn(VerificationError('usr/share/doc/foo/changelog.Debian.gz',
+                                        'Listed in md5sums but missing'), errors)
+
+    def testverify_deb_invalid(self):
+        filepath = os.path.join(self.tmpdir, 'invalid.deb')
+        with open(filepath, 'wb') as fp:
+            fp.write(b'!<arch>\ninvalid')
+
+        errors = verify_deb(filepath)
+        self.assertIn(VerificationError('', 'Invalid archive: Invalid ar member header'), errors)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
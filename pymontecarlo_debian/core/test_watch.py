@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import io
+import time
+import tempfile
+import shutil
+import threading
+import zipfile
+from unittest import mock
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.watch import DirectoryWatcher, WatchBuilder, probe_program
+from pymontecarlo_debian.core.server import BuildService
+from pymontecarlo_debian.core.test_server import FakeDebBuilder
+
+# Globals and constants variables.
+BUILDERS = {'winxray': 'pymontecarlo_debian.core.test_server:FakeDebBuilder'}
+
+def create_zip(filepath, name):
+    with zipfile.ZipFile(filepath, 'w') as z:
+        z.writestr(name, b'a' * 1000)
+
+class TestDirectoryWatcher(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.dropdir = os.path.join(self.tmpdir, 'drop')
+        os.makedirs(self.dropdir)
+
+        self.received = []
+        self.event = threading.Event()
+        def _callback(filepath):
+            self.received.append((filepath, time.monotonic()))
+            self.event.set()
+
+        self.watcher = DirectoryWatcher(self.dropdir, _callback, delay=0.2)
+        self.thread = None
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        self.watcher.stop()
+        if self.thread is not None:
+            self.thread.join(10)
+        shutil.rmtree(self.tmpdir)
+
+    def _start(self, existing=False):
+        self.thread = threading.Thread(target=self.watcher.run, args=(existing,))
+        self.thread.start()
+
+    def testprobe_program(self):
+        filepath = os.path.join(self.tmpdir, 'a.zip')
+        create_zip(filepath, 'monaco/MCLIB32.EXE')
+        self.assertEqual('monaco', probe_program(filepath))
+
+        create_zip(filepath, 'other.exe')
+        self.assertIsNone(probe_program(filepath))
+
+    def testrun_debounce(self):
+        self._start()
+
+        filepath = os.path.join(self.dropdir, 'winxray.zip')
+        with open(os.path.join(self.dropdir, 'notes.txt'), 'w') as fp:
+            fp.write('notes')
+
+        # Written in several times, reported once
+        for _ in range(3):
+            time.sleep(0.05)
+            with open(filepath, 'ab') as fp:
+                fp.write(b'a' * 1000)
+        written = time.monotonic()
+
+        self.assertTrue(self.event.wait(5))
+        time.sleep(0.4)
+        self.assertEqual(1, len(self.received))
+        received_filepath, received = self.received[0]
+        self.assertEqual(filepath, received_filepath)
+        self.assertGreaterEqual(received - written, 0.2)
+        self.assertLess(received - written, 1.0)
+
+        self.watcher.stop()
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+
+    def testrun_existing(self):
+        filepath = os.path.join(self.dropdir, 'winxray.zip')
+        create_zip(filepath, 'winxray/WinXRay.exe')
+        self._start(existing=True)
+
+        self.assertTrue(self.event.wait(5))
+        self.assertEqual(filepath, self.received[0][0])
+
+@mock.patch.dict('pymontecarlo_debian.core.server.BUILDERS', BUILDERS)
+class TestWatchBuilder(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.service = BuildService(os.path.join(self.tmpdir, 'output'),
+                                    os.path.join(self.tmpdir, 'work'), index=True)
+        self.log = io.StringIO()
+        self.builder = WatchBuilder(self.service, log=self.log)
+
+        FakeDebBuilder.event.set()
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        self.service.shutdown()
+        shutil.rmtree(self.tmpdir)
+
+    def testcall(self):
+        filepath = os.path.join(self.tmpdir, 'winxray.zip')
+        create_zip(filepath, 'winxray/WinXRay.exe')
+
+        future, = self.builder(filepath).result()
+        records, _errors = future.result()
+        self.assertTrue(os.path.exists(records[0].filepath))
+        self.assertTrue(os.path.exists(os.path.join(self.service.outputdir, 'Packages')))
+
+        # Unchanged
+        self.assertEqual([], self.builder(filepath).result())
+
+        create_zip(filepath, 'other.exe')
+        self.assertIsNone(self.builder(filepath))
+        self.assertIn('winxray.zip: skipped, unknown program', self.log.getvalue())
+
+    @mock.patch('pymontecarlo_debian.core.watch.probe_program', return_value='winxray')
+    def testcall_removed(self, _probe_program):
+        # Removed between the probe and the copy in the store
+        filepath = os.path.join(self.tmpdir, 'winxray.zip')
+
+        self.assertEqual([], self.builder(filepath).result())
+        self.assertIn('winxray.zip: skipped, could not be added', self.log.getvalue())
+
+    def testcall_nonblocking(self):
+        # The zip is added in the store by a worker of the service
+        filepath = os.path.join(self.tmpdir, 'winxray.zip')
+        create_zip(filepath, 'winxray/WinXRay.exe')
+
+        event = threading.Event()
+        add_zip = self.service.add_zip
+        def _add_zip(location):
+            event.wait(10)
+            return add_zip(location)
+
+        with mock.patch.object(self.service, 'add_zip', side_effect=_add_zip):
+            future = self.builder(filepath)
+            self.assertFalse(future.done())
+            event.set()
+            build_future, = future.result()
+        build_future.result()
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,229 @@
+"""Structural checks of built packages, without dpkg-deb"""
+
+# Standard library modules.
+import os
+import re
+import sys
+import glob
+import zlib
+import lzma
+import hashlib
+import tarfile
+import argparse
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.debfile import \
+    DEBIAN_BINARY, iter_ar_members, open_member_tar
+from pymontecarlo_debian.core.digest import BUFFER_SIZE
+
+# Globals and constants variables.
+VerificationError = collections.namedtuple('VerificationError', ['path', 'message'])
+"""
+Problem found in a package: the path of the file concerned (empty for the
+package itself) and a description.
+"""
+
+REQUIRED_FIELDS = ('Package', 'Version', 'Architecture', 'Maintainer', 'Description')
+MAINTAINER_SCRIPTS = ('preinst', 'postinst', 'prerm', 'postrm')
+SCRIPT_MODES = (0o555, 0o755)
+MAN_PAGE_PATTERN = re.compile(r'^usr/share/man/man(\d)/[^/]+\.\1\.gz$')
+
+def _normalize_path(name):
+    path = os.path.normpath(name)
+    return '' if path == os.curdir else path
+
+def _read_control(tar, errors):
+    """
+    Returns the content of the files of the ``control.tar``, by name, and
+    checks the maintainer scripts.
+    """
+    files = {}
+    for tarinfo in tar:
+        name = _normalize_path(tarinfo.name)
+        if not tarinfo.isfile():
+            continue
+
+        with tar.extractfile(tarinfo) as fp:
+            files[name] = fp.read()
+
+        if name in MAINTAINER_SCRIPTS:
+            if tarinfo.mode & 0o7777 not in SCRIPT_MODES:
+                errors.append(VerificationError(
+                    'DEBIAN/' + name, 'Mode {0:04o} instead of 0555 or 0755'.format(tarinfo.mode)))
+            if not files[name].startswith(b'#!'):
+                errors.append(VerificationError('DEBIAN/' + name, 'Missing interpreter line'))
+    return files
+
+def _read_data(tar, check_md5sums, errors):
+    """
+    Returns the :mod:`tarfile` types and the MD5 of the
+    regular files of the ``data.tar``, by path, and the content of the
+    desktop entries.
+    """
+    types = {}
+    md5s = {}
+    desktop_entries = {}
+    for tarinfo in tar:
+        path = _normalize_path(tarinfo.name)
+        if os.path.isabs(tarinfo.name) or path.startswith('..'):
+            errors.append(VerificationError(tarinfo.name, 'Path outside of the root'))
+            continue
+        types[path] = tarinfo.type
+
+        if not tarinfo.isfile():
+            continue
+
+        if path.endswith('.desktop'):
+            with tar.extractfile(tarinfo) as fp:
+                content = fp.read()
+            desktop_entries[path] = content.decode('utf8', 'replace')
+            md5s[path] = hashlib.md5(content).hexdigest()
+        elif check_md5sums:
+            md5 = hashlib.md5()
+            with tar.extractfile(tarinfo) as fp:
+                for data in iter(lambda: fp.read(BUFFER_SIZE), b''):
+                    md5.update(data)
+            md5s[path] = md5.hexdigest()
+
+    return types, md5s, desktop_entries
+
+def _check_md5sums(content, types, md5s, errors):
+    listed = {}
+    for line in content.decode('utf8', 'replace').splitlines():
+        md5, _sep, path = line.partition('  ')
+        listed[path] = md5
+
+    for path, md5 in sorted(listed.items()):
+        if path not in types:
+            errors.append(VerificationError(path, 'Listed in md5sums but missing'))
+        elif path in md5s and md5s[path] != md5:
+            errors.append(VerificationError(path, 'MD5 differs from md5sums'))
+
+    for path, type in sorted(types.items()):
+        if type in tarfile.REGULAR_TYPES and path not in listed:
+            errors.append(VerificationError(path, 'Missing from md5sums'))
+
+def _check_paths(package, types, desktop_entries, errors):
+    doc_dir = 'usr/share/doc/%s' % package
+    for filename in ['copyright', 'changelog.Debian.gz']:
+        if '%s/%s' % (doc_dir, filename) not in types:
+            errors.append(VerificationError('%s/%s' % (doc_dir, filename), 'Missing'))
+
+    for path in sorted(types):
+        if path.startswith('usr/share/man/') and types[path] != tarfile.DIRTYPE and \
+                not MAN_PAGE_PATTERN.match(path):
+            errors.append(VerificationError(path, 'Man page not in usr/share/man/manN/<name>.N.gz'))
+
+        if path.startswith('usr/bin/') and types[path] != tarfile.DIRTYPE:
+            manpage = 'usr/share/man/man1/%s.1.gz' % os.path.basename(path)
+            if manpage not in types:
+                errors.append(VerificationError(path, 'Program without man page'))
+
+    for path, content in sorted(desktop_entries.items()):
+        if not path.startswith('usr/share/applications/'):
+            errors.append(VerificationError(path, 'Desktop entry not in usr/share/applications'))
+
+        for line in content.splitlines():
+            if not line.startswith('Exec='):
+                continue
+            arguments = line[len('Exec='):].split()
+            command = arguments[0] if arguments else ''
+            if '/' not in command and 'usr/bin/%s' % command not in types:
+                errors.append(VerificationError(path, 'Exec %s not in usr/bin' % command))
+
+def verify_deb(filepath, check_md5sums=True):
+    """
+    Reads the package *filepath* once, as a stream, and returns the
+    sorted list of :class:`VerificationError`: format of the archive,
+    control fields, modes of the maintainer scripts, copyright and
+    changelog, paths of the man pages and desktop entries, and ``md5sums``.
+    Without *check_md5sums*, the files are not hashed, only their presence
+    in ``md5sums`` is checked.
+    """
+    from debian.deb822 import Deb822
+    errors = []
+    control_files = None
+    data = None
+
+    with open(filepath, 'rb') as fp:
+        try:
+            for index, (name, _size, reader) in enumerate(iter_ar_members(fp)):
+                if index == 0:
+                    if name != 'debian-binary' or reader.read() != DEBIAN_BINARY:
+                        errors.append(VerificationError('', 'Invalid debian-binary member'))
+                elif index == 1 and name.startswith('control.tar'):
+                    with open_member_tar(name, reader) as tar:
+                        control_files = _read_control(tar, errors)
+                elif index == 2 and name.startswith('data.tar'):
+                    with open_member_tar(name, reader) as tar:
+                        data = _read_data(tar, check_md5sums, errors)
+                elif not name.startswith('_'):
+                    errors.append(VerificationError('', 'Unexpected member %s' % name))
+        except (ValueError, EOFError, OSError, tarfile.TarError,
+                lzma.LZMAError, zlib.error) as ex:
+            errors.append(VerificationError('', 'Invalid archive: %s' % ex))
+
+    if control_files is None or data is None:
+        errors.append(VerificationError('', 'Missing control.tar or data.tar member'))
+        return sorted(errors)
+
+    if 'control' not in control_files:
+        errors.append(VerificationError('DEBIAN/control', 'Missing'))
+        return sorted(errors)
+
+    control = Deb822(control_files['control'].decode('utf8', 'replace'))
+    for field in REQUIRED_FIELDS:
+        if not control.get(field):
+            errors.append(VerificationError('DEBIAN/control', 'Missing field %s' % field))
+
+    types, md5s, desktop_entries = data
+    if 'md5sums' in control_files:
+        _check_md5sums(control_files['md5sums'], types, md5s, errors)
+    else:
+        errors.append(VerificationError('DEBIAN/md5sums', 'Missing'))
+
+    if control.get('Package'):
+        _check_paths(control['Package'], types, desktop_entries, errors)
+
+    return sorted(errors)
+
+def run(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description='Check built packages')
+
+    parser.add_argument('paths', nargs='+', metavar='PATH',
+                        help='Package, or directory of packages')
+    parser.add_argument('--no-md5sums', action='store_true',
+                        help='Only check that the files are listed in md5sums, '
+                             'without hashing them')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='Number of packages checked concurrently')
+
+    args = parser.parse_args(argv)
+
+    filepaths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            filepaths.extend(sorted(glob.glob(os.path.join(path, '*.deb'))))
+        else:
+            filepaths.append(path)
+
+    # zlib, lzma and hashlib release the GIL
+    with ThreadPoolExecutor(args.jobs) as executor:
+        results = executor.map(lambda filepath: verify_deb(filepath, not args.no_md5sums),
+                               filepaths)
+
+        failed = False
+        for filepath, errors in zip(filepaths, results):
+            for error in errors:
+                print('{0}: {1}: {2}'.format(os.path.basename(filepath),
+                                             error.path or '-', error.message))
+            failed = failed or bool(errors)
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -2,6 +2,7 @@
 
 # Standard library modules.
 from distutils.version import LooseVersion, Version
+from urllib.parse import urljoin
 
 # Third party modules.
 import requests
@@ -21,13 +22,25 @@ class WebpageVersionParser(VersionParser):
 
     def __init__(self, url):
         content = self._retrieve_webpage(url)
-        version = self._parse_webpage(content)
+        releases = self._parse_webpage(content)
+
+        if releases:
+            version, href = max(releases, key=lambda release: release[0])
+            self.latest_url = urljoin(url, href)
+        else:
+            version = None
+            self.latest_url = None
+
         super().__init__(version)
 
     def _retrieve_webpage(self, url):
         return requests.get(url).content
 
     def _parse_webpage(self, content):
+        """
+        Returns a :class:`list` of ``(version, href)`` for each release
+        found on the webpage.
+        """
         raise NotImplementedError
 
 class PackageCloudVersionParser(VersionParser):
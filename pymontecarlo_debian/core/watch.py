@@ -0,0 +1,331 @@
+"""Builds the zips dropped in a directory, watched with inotify"""
+
+# Standard library modules.
+import os
+import sys
+import time
+import glob
+import errno
+import fcntl
+import select
+import struct
+import ctypes
+import ctypes.util
+import zipfile
+import argparse
+import threading
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.core.server import BuildService, BuildError
+
+# Globals and constants variables.
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_CLOEXEC = os.O_CLOEXEC
+IN_NONBLOCK = os.O_NONBLOCK
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | \
+    IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct('iIII') # wd, mask, cookie, len
+EVENT_BUFFER_SIZE = 64 * (EVENT_HEADER.size + 256)
+
+DEBOUNCE_DELAY = 0.5 # s
+
+PROBES = {'wincasino2.exe': 'casino2',
+          'mcxraylite.exe': 'mcxray',
+          'winxray.exe': 'winxray',
+          'mclib32.exe': 'monaco'}
+"""Program of a zip, by the lowercase name of an executable it contains."""
+
+ARCH_PROGRAMS = ('casino2', 'mcxray')
+
+class Inotify(object):
+    """
+    Non-blocking inotify instance, through the system calls of the C
+    library.
+    """
+
+    def __init__(self):
+        libname = ctypes.util.find_library('c')
+        self._libc = ctypes.CDLL(libname, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            self._raise()
+
+    def _raise(self):
+        number = ctypes.get_errno()
+        raise OSError(number, os.strerror(number))
+
+    def add_watch(self, path, mask):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), ctypes.c_uint32(mask))
+        if wd < 0:
+            self._raise()
+        return wd
+
+    def read(self):
+        """
+        Returns the list of pending events as tuples of the mask and the
+        name of the file (empty for the watched directory itself).
+        """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, EVENT_BUFFER_SIZE)
+            except BlockingIOError:
+                return events
+
+            offset = 0
+            while offset < len(data):
+                _wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                events.append((mask, os.fsdecode(name)))
+
+    def close(self):
+        os.close(self.fd)
+
+def probe_program(zip_path):
+    """
+    Returns the program of the zip *zip_path*, from the names of its
+    central directory (see :data:`PROBES`), or ``None``.
+    """
+    with zipfile.ZipFile(zip_path, 'r') as z:
+        for name in z.namelist():
+            program = PROBES.get(name.rsplit('/', 1)[-1].lower())
+            if program is not None:
+                return program
+    return None
+
+class DirectoryWatcher(object):
+    """
+    Watches *dirpath* with inotify and calls *callback* with the path of
+    each zip created, modified or moved in it, once no event was received
+    for this zip during *delay* seconds (i.e. once it is completely
+    written). The thread running :meth:`run` sleeps in :func:`select.poll`
+    until an event, a deadline or :meth:`stop`.
+    """
+
+    def __init__(self, dirpath, callback, delay=DEBOUNCE_DELAY):
+        self.dirpath = os.path.abspath(dirpath)
+        self.callback = callback
+        self.delay = delay
+
+        self._inotify = Inotify()
+        try:
+            self._inotify.add_watch(self.dirpath, WATCH_MASK)
+        except OSError:
+            self._inotify.close()
+            raise
+
+        self._stop_rfd, self._stop_wfd = os.pipe()
+        for fd in (self._stop_rfd, self._stop_wfd):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self._stopped = threading.Event()
+
+    def _scan(self):
+        return sorted(os.path.basename(filepath)
+                      for filepath in glob.glob(os.path.join(self.dirpath, '*.zip')))
+
+    def run(self, existing=False):
+        """
+        Calls the callback until :meth:`stop`, first for the zips already in
+        the directory with *existing*.
+        """
+        pending = {}
+        if existing:
+            now = time.monotonic()
+            pending.update((filename, now) for filename in self._scan())
+
+        poller = select.poll()
+        poller.register(self._inotify.fd, select.POLLIN)
+        poller.register(self._stop_rfd, select.POLLIN)
+
+        try:
+            while not self._stopped.is_set():
+                timeout = None
+                if pending:
+                    timeout = max(0, min(pending.values()) - time.monotonic())
+                    timeout = int(timeout * 1000) + 1 # ms, rounded up
+
+                poller.poll(timeout)
+
+                now = time.monotonic()
+                for mask, name in self._inotify.read():
+                    if mask & IN_Q_OVERFLOW:
+                        # Events were lost
+                        pending.update((filename, now + self.delay) for filename in self._scan())
+                    elif mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                        raise OSError(errno.ENOENT, 'Watched directory removed', self.dirpath)
+                    elif name.endswith('.zip') and not name.startswith('.'):
+                        pending[name] = now + self.delay
+
+                for filename, deadline in sorted(pending.items()):
+                    if deadline <= now:
+                        del pending[filename]
+                        self._dispatch(os.path.join(self.dirpath, filename))
+        finally:
+            self._inotify.close()
+            os.close(self._stop_rfd)
+            os.close(self._stop_wfd)
+
+    def _dispatch(self, filepath):
+        if os.path.isfile(filepath):
+            self.callback(filepath)
+
+    def stop(self):
+        self._stopped.set()
+        try:
+            os.write(self._stop_wfd, b'\0')
+        except OSError: # Already woken up, or stopped
+            pass
+
+class WatchBuilder(object):
+    """
+    Queues the build of the zips given by a :class:`DirectoryWatcher` on a
+    :class:`BuildService <pymontecarlo_debian.core.server.BuildService>`,
+    which publishes the packages in its output repository.
+    A zip is rebuilt only if its content changed; zips that are not
+    recognized by :func:`probe_program` are skipped.
+    The architecture dependent programs are built for each of *archs*.
+    """
+
+    def __init__(self, service, archs=('amd64',), log=sys.stderr, **options):
+        self.service = service
+        self.archs = tuple(archs)
+        self.log = log
+        self.options = options
+
+        self._sha256s = {}
+        self._lock = threading.Lock()
+
+    def _print(self, message):
+        with self._lock:
+            print(message, file=self.log, flush=True)
+
+    def __call__(self, filepath):
+        """
+        Probes the zip *filepath* and returns the future of the list of the
+        futures of its builds, or ``None`` if it is skipped. The zip is
+        copied in the store and its builds are queued on a worker of the
+        service, so that the watcher keeps reading its events meanwhile.
+        """
+        filename = os.path.basename(filepath)
+        try:
+            program = probe_program(filepath)
+        except (zipfile.BadZipFile, OSError) as ex:
+            self._print('%s: skipped, not a zip (%s)' % (filename, ex))
+            return None
+        if program is None:
+            self._print('%s: skipped, unknown program' % filename)
+            return None
+
+        return self.service.schedule(self._submit, filepath, program)
+
+    def _submit(self, filepath, program):
+        filename = os.path.basename(filepath)
+
+        # The zip may be removed or replaced since it was probed
+        try:
+            sha256 = self.service.add_zip(filepath)
+        except (BuildError, OSError) as ex:
+            self._print('%s: skipped, could not be added (%s)' % (filename, ex))
+            return []
+
+        with self._lock:
+            if self._sha256s.get(filepath) == sha256:
+                return []
+            self._sha256s[filepath] = sha256
+
+        archs = self.archs if program in ARCH_PROGRAMS else (None,)
+        futures = []
+        for arch in archs:
+            try:
+                future = self.service.submit(program, sha256, arch, **self.options)
+            except BuildError as ex:
+                self._print('%s: %s' % (filename, ex))
+                continue
+            future.add_done_callback(lambda future: self._done(filepath, future))
+            futures.append(future)
+            self._print('%s: queued %s build%s' % (filename, program,
+                                                    ' (%s)' % arch if arch else ''))
+        return futures
+
+    def _done(self, filepath, future):
+        filename = os.path.basename(filepath)
+        try:
+            records, errors = future.result()
+        except Exception as ex:
+            with self._lock:
+                # Built again if the zip is dropped again
+                self._sha256s.pop(filepath, None)
+            self._print('%s: failed: %s: %s' % (filename, type(ex).__name__, ex))
+            return
+
+        for record in records:
+            self._print('%s: built %s' % (filename, os.path.basename(record.filepath)))
+        for error in errors:
+            self._print('%s: could not extract %s: %s' % (filename, error.name, error.error))
+
+def run(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog,
+                                     description='Build the zips dropped in a directory')
+
+    parser.add_argument('directory', help='Path to the directory to watch')
+    parser.add_argument('-o', '--output', required=True,
+                        help='Path to output directory')
+    parser.add_argument('-w', '--workdir', required=True,
+                        help='Path to directory of the zip store and extraction cache')
+    parser.add_argument('-j', '--jobs', type=int, default=2,
+                        help='Number of builds running at the same time')
+    parser.add_argument('--arch', dest='archs', action='append',
+                        choices=['amd64', 'i386'],
+                        help='Architecture of the programs Casino 2 and MCX-Ray '
+                             '(repeatable, default: amd64)')
+    parser.add_argument('--existing', action='store_true',
+                        help='Also build the zips already in the directory')
+    parser.add_argument('--delay', type=float, default=DEBOUNCE_DELAY, metavar='SECONDS',
+                        help='Wait this long after the last change of a zip before building it')
+    parser.add_argument('--reproducible', action='store_true',
+                        help='Build identical packages from identical zips')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Compress the zip members while they are extracted, '
+                             'without staging them')
+    parser.add_argument('--wine-prefix', action='store_true',
+                        help='Create a template Wine prefix at installation')
+    parser.add_argument('--keep-failed', action='store_true',
+                        help='Keep the staging directories of failed builds in the work directory')
+
+    args = parser.parse_args(argv)
+
+    options = {'reproducible': args.reproducible or 'SOURCE_DATE_EPOCH' in os.environ,
+               'streaming': args.streaming,
+               'wine_prefix': args.wine_prefix}
+
+    service = BuildService(args.output, args.workdir, args.jobs, index=True,
+                           keep_failed=args.keep_failed)
+    service.start()
+
+    builder = WatchBuilder(service, args.archs or ['amd64'], **options)
+    watcher = DirectoryWatcher(args.directory, builder, args.delay)
+    try:
+        watcher.run(args.existing)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.shutdown()
+
+if __name__ == '__main__':
+    run()
@@ -4,93 +4,75 @@
 # Standard library modules.
 import os
 import zipfile
-import tempfile
 from datetime import datetime
-import shutil
-import glob
 import argparse
 
 # Third party modules.
-from debian.copyright import License, FilesParagraph
 
 # Local modules.
 from pymontecarlo_debian.core.debbuilder import DebBuilder
-from pymontecarlo_debian.core.exeinfo import extract_exe_info
+from pymontecarlo_debian.core.exeinfo import extract_zip_exe_info
 from pymontecarlo_debian.core.manpage import ManPage
 from pymontecarlo_debian.core.desktopentry import DesktopEntry
+from pymontecarlo_debian.core.lint import SCRIPT
+from pymontecarlo_debian.core.command import \
+    add_build_arguments, get_builder_kwargs, run_build
 
 # Globals and constants variables.
 
 class MCXrayDebBuilder(DebBuilder):
 
-    def __init__(self, zip_path):
+    def __init__(self, zip_path, **kwargs):
         self._zip_path = zip_path
-
-        # Exe info
-        temp_file = tempfile.NamedTemporaryFile(suffix='.exe', delete=False)
-        try:
-            with zipfile.ZipFile(zip_path, 'r') as z:
-                for filename in z.namelist():
-                    if filename.endswith('McXRayLite.exe'):
-                        break
-                temp_file.write(z.read(filename))
-                temp_file.close()
-            self.exe_info = extract_exe_info(temp_file.name)
-        finally:
-            os.remove(temp_file.name)
+        self._exe_info = None
 
         super().__init__(package='mcxray-lite',
                          fullname='MCX-Ray Lite',
-                         version=self.exe_info['File version'], # dummy
+                         version=lambda: self.exe_info['File version'], # dummy
                          maintainer='Raynald Gauvin',
                          maintainer_email='raynald.gauvin@mcgill.ca',
                          authors=['Raynald Gauvin', 'Pierre Michaud', 'Hendrix Demers'],
                          section='science',
                          short_description='Monte Carlo simulation of electron trajectory in solid',
                          long_description='MC X-Ray is a new Monte Carlo program that is an extension of the Monte Carlo programs Casino and Win X-Ray since it computes the complete x-ray spectra from the simulation of electron scattering in solids of various types of geometries. MC X-Ray allows up to 256 different regions in the materials having shape of spheres, cylinders and combinations of horizontal and vertical planes. All these regions can have a different composition. This program was written by Pierre Michaud under the supervision of Pr. Gauvin. Dr. Hendrix Demers improved and validated the x-ray spectrum computation of MC X-Ray.',
-                         date=datetime.strptime(self.exe_info['Link date'], '%I:%M %p %d/%m/%Y'), # dummy
+                         date=lambda: datetime.strptime(self.exe_info['Link date'], '%I:%M %p %d/%m/%Y'), # dummy
                          license='Private',
                          homepage='http://montecarlomodeling.mcgill.ca/software/mcxray/mcxray.html',
-                         depends=['wine'])
-
-    def _extract_zip(self, temp_dir, arch, *args, **kwargs):
-        dirpath = os.path.join(temp_dir, 'zip')
-        os.makedirs(dirpath)
-        with zipfile.ZipFile(self._zip_path, 'r') as z:
-            for filename in z.namelist(): # Cannot use extract all, problem in zip
-                z.extract(filename, dirpath)
-
-    def _organize_files(self, temp_dir, arch, *args, **kwargs):
-        # Copy zip content in share
-        dst = os.path.join(temp_dir, 'usr', 'share', self.package)
-        os.makedirs(dst, exist_ok=True)
-
-        src_dir = os.path.join(temp_dir, 'zip')
-        for filename in os.listdir(src_dir):
-            shutil.move(os.path.join(src_dir, filename), dst)
-
-        # Move documentation
-        dst = os.path.join(temp_dir, 'usr', 'share', 'doc', self.package)
-        os.makedirs(dst, exist_ok=True)
-
-        for src in glob.iglob(os.path.join(temp_dir, 'usr', 'share',
-                                           self.package, 'Documentations', '*')):
-            shutil.copy(src, dst)
-        shutil.rmtree(os.path.join(temp_dir, 'usr', 'share',
-                                   self.package, 'Documentations'))
-
-        # Remove other architecture exe
+                         depends=['wine'],
+                         **kwargs)
+
+    @property
+    def exe_info(self):
+        if self._exe_info is None:
+            with zipfile.ZipFile(self._zip_path, 'r') as z:
+                self._exe_info = extract_zip_exe_info(z, 'McXRayLite.exe')
+        return self._exe_info
+
+    def _map_zip_members(self, names, arch, *args, **kwargs):
+        # Exe from other architecture
         if arch == 'amd64':
-            os.remove(os.path.join(temp_dir, 'usr', 'share',
-                                   self.package, 'McXRayLite.exe'))
+            excluded = 'McXRayLite.exe'
         elif arch == 'i386':
-            os.remove(os.path.join(temp_dir, 'usr', 'share',
-                                   self.package, 'McXRayLite_x64.exe'))
+            excluded = 'McXRayLite_x64.exe'
+
+        paths = {}
+        for name in names:
+            if name == excluded:
+                continue
+
+            # Boost license (added to copyright file)
+            if name.startswith('licenses/'):
+                continue
 
-        # Remove Boost license (added to copyright file)
-        shutil.rmtree(os.path.join(temp_dir, 'usr', 'share', self.package, 'licenses'))
+            # Documentation
+            if name.startswith('Documentations/'):
+                paths[name] = os.path.join('usr', 'share', 'doc', self.package,
+                                           os.path.basename(name))
+                continue
 
-        shutil.rmtree(src_dir)
+            paths[name] = os.path.join('usr', 'share', self.package, name)
+
+        return paths
 
     def _create_executable(self, temp_dir, arch, *args, **kwargs):
         if arch == 'amd64':
@@ -98,16 +80,20 @@ class MCXrayDebBuilder(DebBuilder):
         elif arch == 'i386':
             filename = 'McXRayLite.exe'
 
-        lines = []
-        lines.append('#!/bin/sh')
-        lines.append('cd /usr/share/%s' % self.package)
-        lines.append('wine /usr/share/%s/%s $@' % (self.package, filename))
-        return lines
+        return self._create_launcher(filename)
+
+    def _get_arch_paths(self, temp_dir, arch, *args, **kwargs):
+        if arch == 'amd64':
+            filename = 'McXRayLite_x64.exe'
+        elif arch == 'i386':
+            filename = 'McXRayLite.exe'
+        return [os.path.join('usr', 'share', self.package, filename)]
 
     def _write_executable(self, lines, temp_dir, arch, *args, **kwargs):
         os.makedirs(os.path.join(temp_dir, 'usr', 'bin'), exist_ok=True)
         filepath = os.path.join(temp_dir, 'usr', 'bin', 'mcxray')
-        with open(filepath, 'w') as fp:
+        self._linter.check(SCRIPT, lines, os.path.relpath(filepath, temp_dir))
+        with self._manifest.open(filepath, 'w') as fp:
             fp.write('\n'.join(lines))
         os.chmod(filepath, 0o555)
 
@@ -139,7 +125,10 @@ class MCXrayDebBuilder(DebBuilder):
 
         src = os.path.join(os.path.dirname(__file__), 'McXRayLite.png')
         dst = os.path.join(dst_dir, 'mcxray.png')
-        shutil.copy(src, dst)
+        self._manifest.copy_file(src, dst)
+
+    def _get_architecture(self, arch, *args, **kwargs):
+        return arch
 
     def _create_control(self, temp_dir, arch, *args, **kwargs):
         control = super()._create_control(temp_dir, arch, *args, **kwargs)
@@ -147,6 +136,7 @@ class MCXrayDebBuilder(DebBuilder):
         return control
 
     def _create_copyright(self, temp_dir, arch, *args, **kwargs):
+        from debian.copyright import License, FilesParagraph
         copyrightobj = super()._create_copyright(temp_dir, arch, *args, **kwargs)
 
         # Add Boost license
@@ -180,47 +170,49 @@ DEALINGS IN THE SOFTWARE.
 
         return copyrightobj
 
-    def _build(self, temp_dir, arch, *args, **kwargs):
-        self._extract_zip(temp_dir, arch, *args, **kwargs)
-
-        self._organize_files(temp_dir, arch, *args, **kwargs)
-
-        lines = self._create_executable(temp_dir, arch, *args, **kwargs)
-        self._write_executable(lines, temp_dir, arch, *args, **kwargs)
-
-        manpage = self._create_man_page(temp_dir, arch, *args, **kwargs)
-        self._write_man_page(manpage, temp_dir, arch, *args, **kwargs)
-
-        entry = self._create_desktop_entry(temp_dir, arch, *args, **kwargs)
-        self._write_desktop_entry(entry, temp_dir, arch, *args, **kwargs)
-
-        super()._build(temp_dir, arch, *args, **kwargs)
+    def _add_stages(self, graph, temp_dir, arch, *args, **kwargs):
+        graph.add('extract', lambda: self._extract_zip(temp_dir, arch, *args, **kwargs),
+                  outputs=['zip members'])
+
+        graph.add('executable',
+                  self._create_stage(self._create_executable, self._write_executable,
+                                     temp_dir, arch, *args, **kwargs),
+                  outputs=[os.path.join('usr', 'bin', self.package)])
+        # Date of the gzip header
+        graph.add('man page',
+                  self._create_stage(self._create_man_page, self._write_man_page,
+                                     temp_dir, arch, *args, **kwargs),
+                  inputs=['date'], outputs=[os.path.join('usr', 'share', 'man')])
+        graph.add('desktop entry',
+                  self._create_stage(self._create_desktop_entry, self._write_desktop_entry,
+                                     temp_dir, arch, *args, **kwargs),
+                  outputs=[os.path.join('usr', 'share', 'applications'),
+                           os.path.join('usr', 'share', 'icons')])
+
+        super()._add_stages(graph, temp_dir, arch, *args, **kwargs)
 
     def build(self, outputdir, arch, *args, **kwargs):
         if arch not in ['amd64', 'i386']:
             raise ValueError('Invalid architecture: amd64 or i386')
-        super().build(outputdir, arch, *args, **kwargs)
+        return super().build(outputdir, arch, *args, **kwargs)
+
+    def plan(self, arch, *args, **kwargs):
+        if arch not in ['amd64', 'i386']:
+            raise ValueError('Invalid architecture: amd64 or i386')
+        return super().plan(arch, *args, **kwargs)
 
-def run():
-    parser = argparse.ArgumentParser(description='Create deb for MCXray')
+def run(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description='Create deb for MCXray')
 
     parser.add_argument('filepath', help='Path to ZIP containing MCXray')
     parser.add_argument('-a', '--arch', choices=('amd64', 'i386'), required=True,
                         help='Architecture')
-    parser.add_argument('-o', '--output', help='Path to output directory')
-
-    args = parser.parse_args()
-
-    filepath = args.filepath
-
-    outputdir = args.output
-    if not outputdir:
-        outputdir = os.path.dirname(filepath)
+    add_build_arguments(parser, split_data=True, split_doc=True)
 
-    arch = args.arch
+    args = parser.parse_args(argv)
 
-    debbuilder = MCXrayDebBuilder(filepath)
-    debbuilder.build(outputdir, arch=arch)
+    debbuilder = MCXrayDebBuilder(args.filepath, **get_builder_kwargs(args))
+    run_build(debbuilder, args, arch=args.arch)
 
 if __name__ == '__main__':
     run()
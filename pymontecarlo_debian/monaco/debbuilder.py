@@ -4,65 +4,66 @@
 # Standard library modules.
 import os
 import zipfile
-import tempfile
 from datetime import datetime
-import shutil
 import argparse
 
 # Third party modules.
 
 # Local modules.
 from pymontecarlo_debian.core.debbuilder import DebBuilder
-from pymontecarlo_debian.core.exeinfo import extract_exe_info
+from pymontecarlo_debian.core.exeinfo import extract_zip_exe_info
 from pymontecarlo_debian.core.manpage import ManPage
 from pymontecarlo_debian.core.desktopentry import DesktopEntry
+from pymontecarlo_debian.core.lint import SCRIPT
+from pymontecarlo_debian.core.command import \
+    add_build_arguments, get_builder_kwargs, run_build
 
 # Globals and constants variables.
 
 class MonacoDebBuilder(DebBuilder):
 
-    def __init__(self, zip_path):
+    def __init__(self, zip_path, **kwargs):
         self._zip_path = zip_path
-
-        # Exe info
-        temp_file = tempfile.NamedTemporaryFile(suffix='.exe', delete=False)
-        try:
-            with zipfile.ZipFile(zip_path, 'r') as z:
-                for filename in z.namelist():
-                    if filename.endswith('Mclib32.exe'):
-                        break
-                temp_file.write(z.read(filename))
-                temp_file.close()
-            self.exe_info = extract_exe_info(temp_file.name)
-        finally:
-            os.remove(temp_file.name)
+        self._exe_info = None
 
         super().__init__(package='monaco',
                          fullname='MONACO',
-                         version=self.exe_info['File version'], # dummy
+                         version=lambda: self.exe_info['File version'], # dummy
                          maintainer='Silvia Richter',
                          maintainer_email='richter@gfe.rwth-aachen.de',
                          authors=['P. Karduck', 'R. Amman', 'S. Richter', 'and collaborators'],
                          section='science',
                          short_description='Monte Carlo simulation of electron trajectory in solid',
                          long_description='Monte Carlo simulation software package developed at the Gemeinschaftslabor fuer Elektronenmikroskopie, RWTH Aachen University',
-                         date=datetime.strptime(self.exe_info['Link date'], '%I:%M %p %d/%m/%Y'), # dummy
+                         date=lambda: datetime.strptime(self.exe_info['Link date'], '%I:%M %p %d/%m/%Y'), # dummy
                          license='Freeware',
                          homepage='http://www.gfe.rwth-aachen.de',
-                         depends=['wine'])
+                         depends=['wine', 'python3'],
+                         **kwargs)
 
-    def _extract_zip(self, temp_dir, *args, **kwargs):
-        with zipfile.ZipFile(self._zip_path, 'r') as z:
-            z.extractall(temp_dir)
+    @property
+    def exe_info(self):
+        if self._exe_info is None:
+            with zipfile.ZipFile(self._zip_path, 'r') as z:
+                self._exe_info = extract_zip_exe_info(z, 'Mclib32.exe')
+        return self._exe_info
 
-    def _organize_files(self, temp_dir, *args, **kwargs):
-        # Copy files to share
-        src_dir = os.path.join(temp_dir, 'monaco')
-        dst = os.path.join(temp_dir, 'usr', 'share', self.package)
-        for filename in os.listdir(src_dir):
-            shutil.move(os.path.join(src_dir, filename), dst)
-        os.remove(os.path.join(dst, 'Mcconv.exe'))
+    def _map_zip_members(self, names, *args, **kwargs):
+        paths = {}
+        for name in names:
+            # Files in the monaco directory
+            if not name.startswith('monaco/'):
+                continue
+
+            relpath = name[len('monaco/'):]
+            if relpath == 'Mcconv.exe':
+                continue
+
+            paths[name] = os.path.join('usr', 'share', self.package, relpath)
 
+        return paths
+
+    def _organize_files(self, temp_dir, *args, **kwargs):
         # Copy icon
         dst_dir = os.path.join(temp_dir, 'usr', 'share', 'icons',
                                'hicolor', '48x48', 'apps')
@@ -70,16 +71,10 @@ class MonacoDebBuilder(DebBuilder):
 
         src = os.path.join(os.path.dirname(__file__), 'monaco.png')
         dst = os.path.join(dst_dir, 'monaco.png')
-        shutil.copy(src, dst)
-
-        # Remove temporary directory
-        shutil.rmtree(src_dir)
+        self._manifest.copy_file(src, dst)
 
     def _create_mccli(self, temp_dir, *args, **kwargs):
-        lines = []
-        lines.append('#!/bin/sh')
-        lines.append('cd /usr/share/%s' % self.package)
-        lines.append('wine /usr/share/%s/Mccli32.exe $@' % self.package)
+        lines = self._create_launcher('Mccli32.exe')
 
         appname = 'mccli'
         short_description = 'Command line interface to the MONACO software package'
@@ -93,10 +88,7 @@ class MonacoDebBuilder(DebBuilder):
         return lines, manpage, None
 
     def _create_mccorr(self, temp_dir, *args, **kwargs):
-        lines = []
-        lines.append('#!/bin/sh')
-        lines.append('cd /usr/share/%s' % self.package)
-        lines.append('wine /usr/share/%s/Mccorr32.exe' % self.package)
+        lines = self._create_launcher('Mccorr32.exe', arguments=False)
 
         appname = 'mccorr'
         short_description = 'Analyze, process and extract data from simulations'
@@ -119,10 +111,7 @@ class MonacoDebBuilder(DebBuilder):
         return lines, manpage, entry
 
     def _create_mcdemo(self, temp_dir, *args, **kwargs):
-        lines = []
-        lines.append('#!/bin/sh')
-        lines.append('cd /usr/share/%s' % self.package)
-        lines.append('wine /usr/share/%s/Mcdemo32.exe' % self.package)
+        lines = self._create_launcher('Mcdemo32.exe', arguments=False)
 
         appname = 'mcdemo'
         short_description = 'Demonstration program for tracking the electron trajectories'
@@ -145,10 +134,7 @@ class MonacoDebBuilder(DebBuilder):
         return lines, manpage, entry
 
     def _create_mclib(self, temp_dir, *args, **kwargs):
-        lines = []
-        lines.append('#!/bin/sh')
-        lines.append('cd /usr/share/%s' % self.package)
-        lines.append('wine /usr/share/%s/Mclib32.exe' % self.package)
+        lines = self._create_launcher('Mclib32.exe', arguments=False)
 
         appname = 'mclib'
         short_description = 'Setup material parameters to create simulation'
@@ -160,7 +146,7 @@ class MonacoDebBuilder(DebBuilder):
                           see_also=self.homepage)
 
         entry = DesktopEntry(type_=DesktopEntry.TYPE_APPLICATION,
-                             name="MC Demo",
+                             name="MC Lib",
                              genericname=short_description,
                              nodisplay=False,
                              icon='monaco',
@@ -171,10 +157,7 @@ class MonacoDebBuilder(DebBuilder):
         return lines, manpage, entry
 
     def _create_mcpack(self, temp_dir, *args, **kwargs):
-        lines = []
-        lines.append('#!/bin/sh')
-        lines.append('cd /usr/share/%s' % self.package)
-        lines.append('wine /usr/share/%s/Mcpack32.exe' % self.package)
+        lines = self._create_launcher('Mcpack32.exe', arguments=False)
 
         appname = 'mcpack'
         short_description = 'Control program to start individual applications'
@@ -197,10 +180,7 @@ class MonacoDebBuilder(DebBuilder):
         return lines, manpage, entry
 
     def _create_mcsim(self, temp_dir, *args, **kwargs):
-        lines = []
-        lines.append('#!/bin/sh')
-        lines.append('cd /usr/share/%s' % self.package)
-        lines.append('wine /usr/share/%s/Mcsim32.exe' % self.package)
+        lines = self._create_launcher('Mcsim32.exe', arguments=False)
 
         appname = 'mcsim'
         short_description = 'Run simulations added to the batch'
@@ -222,10 +202,34 @@ class MonacoDebBuilder(DebBuilder):
 
         return lines, manpage, entry
 
+    def _create_mcbatch(self, temp_dir, *args, **kwargs):
+        with open(os.path.join(os.path.dirname(__file__), 'mcbatch.py'), 'r') as fp:
+            lines = fp.read().splitlines()
+
+        # Same template as the one created by the postinst
+        index = next((i for i, line in enumerate(lines)
+                      if line.startswith('WINE_PREFIX_TEMPLATE = ')), None)
+        if index is None:
+            raise ValueError('WINE_PREFIX_TEMPLATE not found in mcbatch.py')
+        lines[index] = 'WINE_PREFIX_TEMPLATE = %r' % self.wine_prefix_template
+
+        appname = 'mcbatch'
+        short_description = 'Run simulation jobs in parallel, each in its own Wine prefix'
+
+        manpage = ManPage(package=self.package,
+                          name=appname,
+                          short_description=short_description,
+                          synopsis='.B %s [\n.I -j jobs\n.B ] [\n.I -o output\n.B ]\n.I jobfile' % appname,
+                          long_description='Each line of the job file is a MONACO program followed by its arguments, e.g. "mccli sim sample.sim". Each job runs in its own directory of the output directory, which keeps the files it creates, and each worker has its own Wine prefix, cloned once from the template created at installation and kept in $XDG_CACHE_HOME/mcbatch for the following runs. A report with the duration of each job is written in report.json.',
+                          see_also=self.homepage)
+
+        return lines, manpage, None
+
     def _write_executable(self, lines, manpage, entry, temp_dir, *args, **kwargs):
         os.makedirs(os.path.join(temp_dir, 'usr', 'bin'), exist_ok=True)
         filepath = os.path.join(temp_dir, 'usr', 'bin', manpage.name)
-        with open(filepath, 'w') as fp:
+        self._linter.check(SCRIPT, lines, os.path.relpath(filepath, temp_dir))
+        with self._manifest.open(filepath, 'w') as fp:
             fp.write('\n'.join(lines))
         os.chmod(filepath, 0o555)
 
@@ -240,47 +244,35 @@ class MonacoDebBuilder(DebBuilder):
     def _create_man_page(self, temp_dir, *args, **kwargs):
         pass
 
-    def _build(self, temp_dir, *args, **kwargs):
-        self._extract_zip(temp_dir, *args, **kwargs)
-
-        self._organize_files(temp_dir, *args, **kwargs)
+    def _add_stages(self, graph, temp_dir, *args, **kwargs):
+        def _create_stage(create):
+            def _run():
+                lines, manpage, entry = create(temp_dir, *args, **kwargs)
+                self._write_executable(lines, manpage, entry, temp_dir, *args, **kwargs)
+            return _run
 
-        lines, manpage, entry = self._create_mccli(temp_dir, *args, **kwargs)
-        self._write_executable(lines, manpage, entry, temp_dir, *args, **kwargs)
+        graph.add('extract', lambda: self._extract_zip(temp_dir, *args, **kwargs),
+                  outputs=['zip members'])
+        graph.add('icons', lambda: self._organize_files(temp_dir, *args, **kwargs),
+                  outputs=[os.path.join('usr', 'share', 'icons')])
 
-        lines, manpage, entry = self._create_mccorr(temp_dir, *args, **kwargs)
-        self._write_executable(lines, manpage, entry, temp_dir, *args, **kwargs)
+        # Date of the gzip header of the man pages
+        for appname in ['mccli', 'mccorr', 'mcdemo', 'mclib', 'mcpack', 'mcsim', 'mcbatch']:
+            graph.add(appname, _create_stage(getattr(self, '_create_' + appname)),
+                      inputs=['date'], outputs=[os.path.join('usr', 'bin', appname)])
 
-        lines, manpage, entry = self._create_mcdemo(temp_dir, *args, **kwargs)
-        self._write_executable(lines, manpage, entry, temp_dir, *args, **kwargs)
+        super()._add_stages(graph, temp_dir, *args, **kwargs)
 
-        lines, manpage, entry = self._create_mclib(temp_dir, *args, **kwargs)
-        self._write_executable(lines, manpage, entry, temp_dir, *args, **kwargs)
-
-        lines, manpage, entry = self._create_mcpack(temp_dir, *args, **kwargs)
-        self._write_executable(lines, manpage, entry, temp_dir, *args, **kwargs)
-
-        lines, manpage, entry = self._create_mcsim(temp_dir, *args, **kwargs)
-        self._write_executable(lines, manpage, entry, temp_dir, *args, **kwargs)
-
-        super()._build(temp_dir, *args, **kwargs)
-
-def run():
-    parser = argparse.ArgumentParser(description='Create deb for Monaco')
+def run(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description='Create deb for Monaco')
 
     parser.add_argument('filepath', help='Path to ZIP containing Monaco')
-    parser.add_argument('-o', '--output', help='Path to output directory')
-
-    args = parser.parse_args()
-
-    filepath = args.filepath
+    add_build_arguments(parser)
 
-    outputdir = args.output
-    if not outputdir:
-        outputdir = os.path.dirname(filepath)
+    args = parser.parse_args(argv)
 
-    debbuilder = MonacoDebBuilder(filepath)
-    debbuilder.build(outputdir)
+    debbuilder = MonacoDebBuilder(args.filepath, **get_builder_kwargs(args))
+    run_build(debbuilder, args)
 
 if __name__ == '__main__':
     run()
@@ -0,0 +1,232 @@
+#!/usr/bin/python3
+"""
+Runs a list of MONACO jobs in parallel.
+
+Each line of the job file is a MONACO program followed by its arguments,
+e.g. ``mccli sim sample.sim``. Empty lines and lines starting with ``#``
+are skipped. Each job runs in its own directory of the output directory,
+where the content of the MONACO installation is linked, and each worker
+has its own Wine prefix, so jobs neither share the working directory nor
+the wineserver. Files created by a job stay in its directory.
+
+The Wine prefixes of the workers are cloned from the template created at
+installation, once: they are kept in ``$XDG_CACHE_HOME/mcbatch`` for the
+following runs. A prefix is locked by the worker using it, so concurrent
+runs use distinct prefixes.
+
+Installed as ``/usr/bin/mcbatch`` by the MONACO package; only depends on
+the standard library.
+"""
+
+# Standard library modules.
+import os
+import sys
+import json
+import time
+import shlex
+import fcntl
+import argparse
+import queue
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# Third party modules.
+
+# Local modules.
+
+# Globals and constants variables.
+MONACO_DIR = '/usr/share/monaco'
+
+# Replaced by the template of the package when it is built
+WINE_PREFIX_TEMPLATE = '/var/lib/monaco/wineprefix'
+PROGRAMS = {'mccli': 'Mccli32.exe',
+            'mccorr': 'Mccorr32.exe',
+            'mcdemo': 'Mcdemo32.exe',
+            'mclib': 'Mclib32.exe',
+            'mcpack': 'Mcpack32.exe',
+            'mcsim': 'Mcsim32.exe'}
+
+def read_jobs(fp, cwd):
+    """
+    Returns a list of ``(exe, arguments)``. Arguments that are existing
+    paths relative to *cwd* are made absolute.
+    """
+    jobs = []
+    for line in fp:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        program, *arguments = shlex.split(line)
+        exe = PROGRAMS.get(program.lower(), program)
+
+        for i, argument in enumerate(arguments):
+            path = os.path.join(cwd, argument)
+            if not os.path.isabs(argument) and os.path.exists(path):
+                arguments[i] = os.path.abspath(path)
+
+        jobs.append((exe, arguments))
+    return jobs
+
+def get_prefix_dir():
+    """
+    Returns the directory keeping the Wine prefixes of the workers between
+    runs.
+    """
+    cachedir = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(cachedir, 'mcbatch')
+
+class Worker(object):
+    """
+    Runs jobs one after another in its own Wine prefix, the first prefix of
+    *prefixdir* not locked by another worker. A new prefix is cloned from
+    *template*.
+    """
+
+    def __init__(self, index, prefixdir, monaco_dir=MONACO_DIR, wine='wine',
+                 template=WINE_PREFIX_TEMPLATE):
+        self.index = index
+        self.monaco_dir = monaco_dir
+        self.wine = wine
+
+        os.makedirs(prefixdir, exist_ok=True)
+        number = 0
+        while True:
+            self._lockfp = open(os.path.join(prefixdir, 'wineprefix-%i.lock' % number), 'a')
+            try:
+                fcntl.flock(self._lockfp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                self._lockfp.close()
+                number += 1
+
+        # Cloned under another name, so that an interrupted clone is not used
+        self.wineprefix = os.path.join(prefixdir, 'wineprefix-%i' % number)
+        if not os.path.exists(self.wineprefix) and os.path.isdir(template):
+            temp_prefix = self.wineprefix + '.tmp'
+            subprocess.call(['rm', '-rf', temp_prefix])
+            if subprocess.call(['cp', '-a', '--reflink=auto', template, temp_prefix]) == 0:
+                os.rename(temp_prefix, self.wineprefix)
+
+    def _link_installation(self, jobdir):
+        links = []
+        for filename in os.listdir(self.monaco_dir):
+            dst = os.path.join(jobdir, filename)
+            os.symlink(os.path.join(self.monaco_dir, filename), dst)
+            links.append(dst)
+        return links
+
+    def run(self, jobid, exe, arguments, outputdir):
+        jobdir = os.path.join(outputdir, jobid)
+        os.makedirs(jobdir)
+        links = self._link_installation(jobdir)
+
+        env = os.environ.copy()
+        env['WINEPREFIX'] = self.wineprefix
+        env.setdefault('WINEDEBUG', '-all')
+
+        command = [self.wine, os.path.join(jobdir, exe)] + list(arguments)
+        start = time.monotonic()
+        with open(os.path.join(jobdir, 'stdout.log'), 'wb') as stdout, \
+                open(os.path.join(jobdir, 'stderr.log'), 'wb') as stderr:
+            returncode = subprocess.call(command, cwd=jobdir, env=env,
+                                         stdout=stdout, stderr=stderr)
+        duration = time.monotonic() - start
+
+        for link in links:
+            os.remove(link)
+
+        outputs = sorted(os.path.relpath(os.path.join(dirpath, filename), jobdir)
+                         for dirpath, _dirnames, filenames in os.walk(jobdir)
+                         for filename in filenames)
+
+        return {'id': jobid,
+                'command': [exe] + list(arguments),
+                'worker': self.index,
+                'returncode': returncode,
+                'duration': duration,
+                'outputs': outputs}
+
+    def shutdown(self):
+        env = os.environ.copy()
+        env['WINEPREFIX'] = self.wineprefix
+        try:
+            subprocess.call(['wineserver', '-k'], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError:
+            pass
+        self._lockfp.close()
+
+def run_jobs(jobs, outputdir, nworkers, monaco_dir=MONACO_DIR, wine='wine',
+             prefixdir=None, template=WINE_PREFIX_TEMPLATE):
+    """
+    Runs the jobs on *nworkers* workers and returns the report of each job.
+    The Wine prefixes of the workers are kept in *prefixdir* (by default,
+    see :func:`get_prefix_dir`).
+    """
+    if prefixdir is None:
+        prefixdir = get_prefix_dir()
+
+    workers = [Worker(index, prefixdir, monaco_dir, wine, template)
+               for index in range(min(nworkers, len(jobs)) or 1)]
+    available = queue.Queue()
+    for worker in workers:
+        available.put(worker)
+
+    def _run(item):
+        number, (exe, arguments) = item
+        worker = available.get()
+        try:
+            jobid = 'job-%04i' % number
+            return worker.run(jobid, exe, arguments, outputdir)
+        finally:
+            available.put(worker)
+
+    try:
+        with ThreadPoolExecutor(len(workers)) as executor:
+            reports = list(executor.map(_run, enumerate(jobs)))
+    finally:
+        for worker in workers:
+            worker.shutdown()
+
+    return reports
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run MONACO jobs in parallel')
+
+    parser.add_argument('jobfile',
+                        help='File with one job per line, e.g. "mccli sim sample.sim" ("-" for stdin)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Number of jobs running at the same time')
+    parser.add_argument('-o', '--output', default='mcbatch',
+                        help='Output directory, one sub-directory per job')
+
+    args = parser.parse_args(argv)
+
+    if args.jobfile == '-':
+        jobs = read_jobs(sys.stdin, os.getcwd())
+    else:
+        with open(args.jobfile, 'r') as fp:
+            jobs = read_jobs(fp, os.path.dirname(os.path.abspath(args.jobfile)))
+
+    outputdir = os.path.abspath(args.output)
+    os.makedirs(outputdir, exist_ok=True)
+
+    start = time.monotonic()
+    reports = run_jobs(jobs, outputdir, args.jobs)
+    duration = time.monotonic() - start
+
+    with open(os.path.join(outputdir, 'report.json'), 'w') as fp:
+        json.dump({'duration': duration, 'jobs': reports}, fp, indent=2)
+
+    for report in reports:
+        print('{id}\t{returncode:d}\t{duration:.1f}s\t{command}'
+              .format(id=report['id'], returncode=report['returncode'],
+                      duration=report['duration'],
+                      command=' '.join(map(shlex.quote, report['command']))))
+    print('%i jobs in %.1fs' % (len(reports), duration))
+
+    return 1 if any(report['returncode'] for report in reports) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
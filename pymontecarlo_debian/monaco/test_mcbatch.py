@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import io
+import tempfile
+import shutil
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.monaco.mcbatch import \
+    read_jobs, run_jobs, Worker, WINE_PREFIX_TEMPLATE
+from pymontecarlo_debian.monaco.debbuilder import MonacoDebBuilder
+
+# Globals and constants variables.
+
+FAKE_WINE = """#!/bin/sh
+exe=$1
+shift
+echo "$WINEPREFIX" > prefix.txt
+echo "$exe $@" > result.txt
+sleep 0.1
+"""
+
+class Testmcbatch(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+
+        self.monaco_dir = os.path.join(self.tmpdir, 'monaco')
+        os.makedirs(self.monaco_dir)
+        for filename in ['Mccli32.exe', 'Mcsim32.exe', 'material.dat']:
+            with open(os.path.join(self.monaco_dir, filename), 'w') as fp:
+                fp.write(filename)
+
+        self.wine = os.path.join(self.tmpdir, 'wine')
+        with open(self.wine, 'w') as fp:
+            fp.write(FAKE_WINE)
+        os.chmod(self.wine, 0o755)
+
+        self.outputdir = os.path.join(self.tmpdir, 'output')
+        self.prefixdir = os.path.join(self.tmpdir, 'prefixes')
+
+        self.template = os.path.join(self.tmpdir, 'template')
+        os.makedirs(self.template)
+        with open(os.path.join(self.template, 'system.reg'), 'w') as fp:
+            fp.write('template')
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir)
+
+    def testread_jobs(self):
+        fp = io.StringIO('# comment\n\nmccli sim "my sample.sim"\nMcsim32.exe\n')
+        jobs = read_jobs(fp, self.tmpdir)
+        self.assertEqual([('Mccli32.exe', ['sim', 'my sample.sim']),
+                          ('Mcsim32.exe', [])], jobs)
+
+    def testrun_jobs(self):
+        jobs = [('Mccli32.exe', ['sim', str(i)]) for i in range(4)]
+        reports = run_jobs(jobs, self.outputdir, 2, self.monaco_dir, self.wine,
+                           self.prefixdir, self.template)
+
+        self.assertEqual(4, len(reports))
+        prefixes = set()
+        for i, report in enumerate(reports):
+            self.assertEqual(0, report['returncode'])
+            self.assertIn(report['worker'], (0, 1))
+            self.assertEqual(['prefix.txt', 'result.txt', 'stderr.log', 'stdout.log'],
+                             report['outputs'])
+
+            jobdir = os.path.join(self.outputdir, report['id'])
+            with open(os.path.join(jobdir, 'result.txt')) as fp:
+                self.assertEqual(os.path.join(jobdir, 'Mccli32.exe') + ' sim %i\n' % i,
+                                 fp.read())
+            with open(os.path.join(jobdir, 'prefix.txt')) as fp:
+                prefixes.add(fp.read().strip())
+
+        self.assertEqual(2, len(prefixes))
+        for prefix in prefixes:
+            self.assertEqual(self.prefixdir, os.path.dirname(prefix))
+            self.assertTrue(os.path.exists(os.path.join(prefix, 'system.reg')))
+
+    def testrun_jobs_prefixes(self):
+        # The prefixes are kept for the next runs
+        jobs = [('Mccli32.exe', ['sim'])]
+        report, = run_jobs(jobs, self.outputdir, 1, self.monaco_dir, self.wine,
+                           self.prefixdir, self.template)
+        with open(os.path.join(self.outputdir, report['id'], 'prefix.txt')) as fp:
+            prefix = fp.read().strip()
+        with open(os.path.join(prefix, 'user.reg'), 'w') as fp:
+            fp.write('kept')
+
+        # Not shared with a worker of a concurrent run
+        other = Worker(0, self.prefixdir, self.monaco_dir, self.wine, self.template)
+        try:
+            self.assertEqual(prefix, other.wineprefix)
+            worker = Worker(1, self.prefixdir, self.monaco_dir, self.wine, self.template)
+            self.assertNotEqual(prefix, worker.wineprefix)
+            worker.shutdown()
+        finally:
+            other.shutdown()
+
+        self.assertTrue(os.path.exists(os.path.join(prefix, 'user.reg')))
+
+    def testprefix_template(self):
+        self.assertEqual(WINE_PREFIX_TEMPLATE,
+                         MonacoDebBuilder('monaco.zip').wine_prefix_template)
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
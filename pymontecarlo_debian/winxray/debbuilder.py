@@ -4,71 +4,82 @@
 # Standard library modules.
 import os
 import zipfile
-import tempfile
 from datetime import datetime
-import shutil
 import argparse
 
 # Third party modules.
 
 # Local modules.
 from pymontecarlo_debian.core.debbuilder import DebBuilder
-from pymontecarlo_debian.core.exeinfo import extract_exe_info
+from pymontecarlo_debian.core.exeinfo import extract_zip_exe_info
 from pymontecarlo_debian.core.manpage import ManPage
 from pymontecarlo_debian.core.desktopentry import DesktopEntry
+from pymontecarlo_debian.core.lint import SCRIPT
+from pymontecarlo_debian.core.command import \
+    add_build_arguments, get_builder_kwargs, run_build
 
 # Globals and constants variables.
 
 class WinXRayDebBuilder(DebBuilder):
 
-    def __init__(self, zip_path):
+    def __init__(self, zip_path, **kwargs):
         self._zip_path = zip_path
-
-        # Exe info
-        temp_file = tempfile.NamedTemporaryFile(suffix='.exe', delete=False)
-        try:
-            with zipfile.ZipFile(zip_path, 'r') as z:
-                for filename in z.namelist():
-                    if filename.endswith('WinXRay.exe'):
-                        break
-                temp_file.write(z.read(filename))
-                temp_file.close()
-            self.exe_info = extract_exe_info(temp_file.name)
-        finally:
-            os.remove(temp_file.name)
+        self._exe_info = None
 
         super().__init__(package='winxray',
                          fullname='WinXRay',
-                         version=self.exe_info['File version'], # dummy
+                         version=lambda: self.exe_info['File version'], # dummy
                          maintainer='Hendrix Demers',
                          maintainer_email='hendrix.demers@mail.mcgill.ca',
                          authors=['H. Demers', 'P. Horny', 'R. Gauvin', 'E. Lifshin'],
                          section='science',
                          short_description='Monte Carlo simulation of electron trajectory in solid',
                          long_description='This new Monte Carlo programs, Ray, is a extension of the well known Monte Carlo program CASINO, which includes statistical distributions for the backscattered electrons, trapped electrons, energy loss and phi rho z curves for X-ray. The new added features in Ray are: the complete simulation of the X-ray spectrum, the charging effect for insulating specimen.',
-                         date=datetime.strptime(self.exe_info['Link date'], '%I:%M %p %d/%m/%Y'), # dummy
+                         date=lambda: datetime.strptime(self.exe_info['Link date'], '%I:%M %p %d/%m/%Y'), # dummy
                          license='This program is for educational and scientific use only. All commercial applications concerning this program are prohibited without a written agreement with the authors. We claim no responsibility and liability concerning the technical predictions of this programs.\nIn all publications using the results of this program, the complete references to Win X-Ray and the authors must be include in the paper.  And if you send us the paper, we will be pleasure to see want use you have made of the program.',
                          homepage='http://montecarlomodeling.mcgill.ca/software/winxray/winxray.html',
-                         depends=['wine'])
-
-    def _extract_zip(self, temp_dir, *args, **kwargs):
-        with zipfile.ZipFile(self._zip_path, 'r') as z:
-            z.extractall(temp_dir)
+                         depends=['wine'],
+                         **kwargs)
+
+    @property
+    def exe_info(self):
+        if self._exe_info is None:
+            with zipfile.ZipFile(self._zip_path, 'r') as z:
+                self._exe_info = extract_zip_exe_info(z, 'WinXRay.exe')
+        return self._exe_info
+
+    def _map_zip_members(self, names, *args, **kwargs):
+        # Files in the directory of the exe
+        exe_name = next((name for name in names
+                         if os.path.basename(name) == 'WinXRay.exe'), None)
+        if exe_name is None:
+            raise ValueError('WinXRay.exe not found in %s' % self._zip_path)
+        prefix = os.path.dirname(exe_name)
+        if prefix:
+            prefix += '/'
+
+        paths = {}
+        for name in names:
+            if not name.startswith(prefix):
+                continue
+
+            relpath = name[len(prefix):]
+
+            # License file (already in copyright)
+            if relpath == 'Help/License.txt':
+                continue
+
+            paths[name] = os.path.join('usr', 'share', self.package, relpath)
+
+        return paths
+
+    def _get_doc_patterns(self, *args, **kwargs):
+        # Help opened from the program, only recommended
+        patterns = super()._get_doc_patterns(*args, **kwargs)
+        patterns.append(os.path.join('usr', 'share', self.package, 'Help', '*'))
+        return patterns
 
     def _organize_files(self, temp_dir, *args, **kwargs):
-        # Copy files to share
-        def _find(name, path):
-            for root, _dirs, files in os.walk(path):
-                if name in files:
-                    return os.path.join(root, name)
-
-        dst_dir = os.path.join(temp_dir, 'usr', 'share', self.package)
-        os.makedirs(dst_dir, exist_ok=True)
-
-        src_dir = os.path.dirname(_find('WinXRay.exe', temp_dir))
-        for filename in os.listdir(src_dir):
-            shutil.move(os.path.join(src_dir, filename), dst_dir)
-
         # Copy icon
         dst_dir = os.path.join(temp_dir, 'usr', 'share', 'icons',
                                'hicolor', '48x48', 'apps')
@@ -76,26 +87,16 @@ class WinXRayDebBuilder(DebBuilder):
 
         src = os.path.join(os.path.dirname(__file__), 'WinXRay.png')
         dst = os.path.join(dst_dir, 'winxray.png')
-        shutil.copy(src, dst)
-
-        # Remove license file (already in copyright)
-        os.remove(os.path.join(temp_dir, 'usr', 'share', self.package,
-                               'Help', 'License.txt'))
-
-        # Remove temporary directory
-        shutil.rmtree(src_dir)
+        self._manifest.copy_file(src, dst)
 
     def _create_executable(self, temp_dir, *args, **kwargs):
-        lines = []
-        lines.append('#!/bin/sh')
-        lines.append('cd /usr/share/%s' % self.package)
-        lines.append('wine /usr/share/%s/WinXRay.exe $@' % self.package)
-        return lines
+        return self._create_launcher('WinXRay.exe')
 
     def _write_executable(self, lines, temp_dir, *args, **kwargs):
         os.makedirs(os.path.join(temp_dir, 'usr', 'bin'), exist_ok=True)
         filepath = os.path.join(temp_dir, 'usr', 'bin', 'winxray')
-        with open(filepath, 'w') as fp:
+        self._linter.check(SCRIPT, lines, os.path.relpath(filepath, temp_dir))
+        with self._manifest.open(filepath, 'w') as fp:
             fp.write('\n'.join(lines))
         os.chmod(filepath, 0o555)
 
@@ -117,38 +118,38 @@ class WinXRayDebBuilder(DebBuilder):
                             terminal=False,
                             categories=['Science'])
 
-    def _build(self, temp_dir, *args, **kwargs):
-        self._extract_zip(temp_dir, *args, **kwargs)
-
-        self._organize_files(temp_dir, *args, **kwargs)
-
-        lines = self._create_executable(temp_dir, *args, **kwargs)
-        self._write_executable(lines, temp_dir, *args, **kwargs)
-
-        manpage = self._create_man_page(temp_dir, *args, **kwargs)
-        self._write_man_page(manpage, temp_dir, *args, **kwargs)
-
-        entry = self._create_desktop_entry(temp_dir, *args, **kwargs)
-        self._write_desktop_entry(entry, temp_dir, *args, **kwargs)
-
-        super()._build(temp_dir, *args, **kwargs)
-
-def run():
-    parser = argparse.ArgumentParser(description='Create deb for WinXRay')
+    def _add_stages(self, graph, temp_dir, *args, **kwargs):
+        graph.add('extract', lambda: self._extract_zip(temp_dir, *args, **kwargs),
+                  outputs=['zip members'])
+        graph.add('icons', lambda: self._organize_files(temp_dir, *args, **kwargs),
+                  outputs=[os.path.join('usr', 'share', 'icons')])
+
+        graph.add('executable',
+                  self._create_stage(self._create_executable, self._write_executable,
+                                     temp_dir, *args, **kwargs),
+                  outputs=[os.path.join('usr', 'bin', self.package)])
+        # Date of the gzip header
+        graph.add('man page',
+                  self._create_stage(self._create_man_page, self._write_man_page,
+                                     temp_dir, *args, **kwargs),
+                  inputs=['date'], outputs=[os.path.join('usr', 'share', 'man')])
+        graph.add('desktop entry',
+                  self._create_stage(self._create_desktop_entry, self._write_desktop_entry,
+                                     temp_dir, *args, **kwargs),
+                  outputs=[os.path.join('usr', 'share', 'applications')])
+
+        super()._add_stages(graph, temp_dir, *args, **kwargs)
+
+def run(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description='Create deb for WinXRay')
 
     parser.add_argument('filepath', help='Path to ZIP containing WinXRay')
-    parser.add_argument('-o', '--output', help='Path to output directory')
-
-    args = parser.parse_args()
-
-    filepath = args.filepath
+    add_build_arguments(parser, split_doc=True)
 
-    outputdir = args.output
-    if not outputdir:
-        outputdir = os.path.dirname(filepath)
+    args = parser.parse_args(argv)
 
-    debbuilder = WinXRayDebBuilder(filepath)
-    debbuilder.build(outputdir)
+    debbuilder = WinXRayDebBuilder(args.filepath, **get_builder_kwargs(args))
+    run_build(debbuilder, args)
 
 if __name__ == '__main__':
     run()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+""" """
+
+# Standard library modules.
+import unittest
+import logging
+import os
+import tempfile
+import shutil
+import zipfile
+
+# Third party modules.
+
+# Local modules.
+from pymontecarlo_debian.winxray.debbuilder import WinXRayDebBuilder
+
+# Globals and constants variables.
+
+class TestWinXRayDebBuilder(unittest.TestCase):
+
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.zip_path = os.path.join(self.tmpdir, 'winxray.zip')
+        with zipfile.ZipFile(self.zip_path, 'w') as z:
+            z.writestr('winxray/WinXRay.exe', b'a' * 3000)
+            z.writestr('winxray/data.dat', b'b' * 4000)
+            z.writestr('winxray/Help/index.html', b'c' * 5000)
+            z.writestr('winxray/Help/License.txt', b'license')
+
+    def tearDown(self):
+        unittest.TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir)
+
+    def testplan_split_doc(self):
+        debbuilder = WinXRayDebBuilder(self.zip_path, split_doc=True)
+        doc_plan, plan = debbuilder.plan()
+
+        self.assertEqual('winxray-doc', doc_plan.package)
+        self.assertEqual('all', doc_plan.architecture)
+        paths = [planned.path for planned in doc_plan.files]
+        self.assertIn('usr/share/winxray/Help/index.html', paths)
+        self.assertIn('usr/share/doc/winxray-doc/copyright', paths)
+
+        paths = [planned.path for planned in plan.files]
+        self.assertIn('usr/share/winxray/data.dat', paths)
+        self.assertIn('usr/share/doc/winxray/copyright', paths)
+        self.assertNotIn('usr/share/winxray/Help/index.html', paths)
+
+    def testplan_missing_exe(self):
+        zip_path = os.path.join(self.tmpdir, 'other.zip')
+        with zipfile.ZipFile(zip_path, 'w') as z:
+            z.writestr('winxray/data.dat', b'b' * 4000)
+
+        debbuilder = WinXRayDebBuilder(zip_path)
+        with self.assertRaisesRegex(ValueError, 'WinXRay.exe not found in'):
+            debbuilder.plan()
+
+if __name__ == '__main__': #pragma: no cover
+    logging.getLogger().setLevel(logging.DEBUG)
+    unittest.main()
@@ -25,7 +25,7 @@ class WinXRayWebpageVersionParser(WebpageVersionParser):
     def _parse_webpage(self, content):
         soup = BeautifulSoup(content, "html.parser")
 
-        versions = []
+        releases = []
         for a in soup.find_all('a'):
             match = re.match(self.PATTERN, a['href'])
             if not match:
@@ -33,12 +33,9 @@ class WinXRayWebpageVersionParser(WebpageVersionParser):
 
             version = LooseVersion(match.group(1))
 
-            versions.append(version)
+            releases.append((version, a['href']))
 
-        if not versions:
-            return None
-
-        return max(versions)
+        return releases
 
 class WinXRayPackageCloudVersionParser(PackageCloudVersionParser):
 
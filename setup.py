@@ -15,12 +15,27 @@ BASEDIR = os.path.abspath(os.path.dirname(__file__))
 PACKAGES = find_packages()
 INSTALL_REQUIRES = ['python-debian',
                     'chardet', # Uncovered dependency of python-debian
-                    'deb_pkg_tools',
                     'requests',
                     'beautifulsoup4']
 
 CMDCLASS = versioneer.get_cmdclass()
 
+ENTRY_POINTS = {'console_scripts':
+                    ['pymontecarlo-debian = pymontecarlo_debian.cli:main'],
+                'pymontecarlo_debian.commands':
+                    ['casino2 = pymontecarlo_debian.casino2.debbuilder:run',
+                     'mcxray = pymontecarlo_debian.mcxray.debbuilder:run',
+                     'monaco = pymontecarlo_debian.monaco.debbuilder:run',
+                     'winxray = pymontecarlo_debian.winxray.debbuilder:run',
+                     'serve = pymontecarlo_debian.core.server:run',
+                     'verify = pymontecarlo_debian.core.verify:run',
+                     'watch = pymontecarlo_debian.core.watch:run'],
+                'pymontecarlo_debian.builders':
+                    ['casino2 = pymontecarlo_debian.casino2.debbuilder:Casino2DebBuilder',
+                     'mcxray = pymontecarlo_debian.mcxray.debbuilder:MCXrayDebBuilder',
+                     'monaco = pymontecarlo_debian.monaco.debbuilder:MonacoDebBuilder',
+                     'winxray = pymontecarlo_debian.winxray.debbuilder:WinXRayDebBuilder']}
+
 setup(name="pymontecarlo-debian",
       version=versioneer.get_version(),
       url='https://github.com/pymontecarlo/pymontecarlo-debian',
@@ -43,6 +58,8 @@ setup(name="pymontecarlo-debian",
       setup_requires=['nose'],
       install_requires=INSTALL_REQUIRES,
 
+      entry_points=ENTRY_POINTS,
+
       test_suite='nose.collector',
 )
 